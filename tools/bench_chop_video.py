@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Benchmark chop_video.py on synthetic media.
+
+Source videos are generated with lavfi (testsrc2 video and a sine tone) at each
+requested resolution and duration, along with spreadsheets cutting them into
+1 to 500 segments.  Every combination is rendered in each render mode by
+running chop_video.py in its own process.  For each run the benchmark records
+wall time, throughput (source minutes per wall minute and output speed), the
+peak resident memory of chop_video.py and its ffmpeg processes, and the peak
+disk used by the output and intermediate files.
+
+Results are written as json.  Pass --baseline to compare against an earlier
+results file and flag runs that got slower; the exit status is 1 if any did.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-18"
+
+import chop_video
+
+import ffmpeg
+import pandas as pd
+import numpy as np
+
+import sys, os, shutil, argparse, json, time, subprocess, threading, platform
+
+# Default benchmark grid
+RESOLUTIONS = ["640x360","1280x720"]
+DURATIONS = [60,600]
+SEGMENT_COUNTS = [1,10,100,500]
+
+# Shortest slot of source (seconds) given to each segment.  Shorter slots make
+# segments and fades only a few frames long.
+MIN_SLOT = 1.0
+
+
+def make_source(source_file,width,height,duration,frame_rate=30):
+    """
+    Generate a synthetic source video (testsrc2 video plus a 440 Hz tone) with
+    a keyframe every two seconds.  Does nothing if source_file exists.
+
+    source_file: video file to write
+    width, height: frame size in pixels
+    duration: length in seconds
+    frame_rate: frames per second
+    """
+
+    if os.path.isfile(source_file):
+        return
+
+    video = ffmpeg.input("testsrc2=size={}x{}:rate={}".format(width,height,frame_rate),
+                         **{"f":"lavfi","t":duration})
+    audio = ffmpeg.input("sine=frequency=440:sample_rate=48000",
+                         **{"f":"lavfi","t":duration})
+
+    partial_file = chop_video._partial_file(source_file)
+    (
+        ffmpeg
+        .output(video,audio,partial_file,
+                **{"c:v":"libx264","preset":"veryfast","g":2*frame_rate,
+                   "pix_fmt":"yuv420p","c:a":"aac","ac":2})
+        .run(overwrite_output=True,quiet=True)
+    )
+    os.replace(partial_file,source_file)
+
+
+def make_spreadsheet(spreadsheet_file,duration,num_segments):
+    """
+    Write a spreadsheet cutting a video of length duration into num_segments
+    evenly spaced segments.  Each segment covers the middle half of its slot,
+    so segments never merge and always leave room for their fades.
+
+    spreadsheet_file: csv file to write
+    duration: length of the source video in seconds
+    num_segments: number of segments
+
+    Returns the fade length (seconds) to use with the spreadsheet.
+    """
+
+    slot = duration/num_segments
+    slot_starts = np.arange(num_segments)*slot
+
+    starts = slot_starts + slot/4
+    stops = slot_starts + 3*slot/4
+
+    df = pd.DataFrame({"start":[chop_video._seconds_to_time(t) for t in starts],
+                       "stop":[chop_video._seconds_to_time(t) for t in stops]})
+    df.to_csv(spreadsheet_file,index=False)
+
+    # Fades must fit between segments (and before the first one)
+    return float(np.round(min(1.0,slot/8),3))
+
+
+def _disk_usage(directory):
+    """
+    Total size in bytes of every file under directory.
+    """
+
+    total = 0
+    for root, dirs, files in os.walk(directory):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root,f))
+            except OSError:
+                pass
+
+    return total
+
+
+def run_case(case_dir,source_file,spreadsheet_file,fade_length,render_mode,
+             jobs=1):
+    """
+    Render one case by running chop_video.py in a fresh process.
+
+    case_dir: empty directory in which to write the output
+    source_file: source video
+    spreadsheet_file: spreadsheet of segments
+    fade_length: fade length in seconds
+    render_mode: chop_video render mode
+    jobs: number of segment renders to run at once (temp-files mode)
+
+    Returns a dictionary of measurements.
+    """
+
+    output_file = os.path.join(case_dir,"out.mp4")
+    report_file = os.path.join(case_dir,"report.json")
+
+    args = [sys.executable,chop_video.__file__,
+            source_file,spreadsheet_file,
+            "--out-file",output_file,
+            "--fade-length",str(fade_length),
+            "--render-mode",render_mode,
+            "--jobs",str(jobs),
+            "--report",report_file,
+            "--no-progress"]
+
+    # Sample disk use while the render runs
+    peak_disk = [0]
+    done = threading.Event()
+    def _watch_disk():
+        while not done.is_set():
+            peak_disk[0] = max(peak_disk[0],_disk_usage(case_dir))
+            done.wait(0.2)
+
+    watcher = threading.Thread(target=_watch_disk,daemon=True)
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(args,stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    watcher.start()
+
+    # Drain stderr so a chatty render cannot block on a full pipe
+    stderr = process.stderr.read()
+    process.stderr.close()
+
+    # wait4 reports the peak RSS of the process and every descendant it
+    # waited for (i.e. the largest ffmpeg run).
+    _, status, rusage = os.wait4(process.pid,0)
+    wall_time = time.perf_counter() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    done.set()
+    watcher.join()
+    peak_disk[0] = max(peak_disk[0],_disk_usage(case_dir))
+
+    result = {"status":"ok",
+              "wall_time":wall_time,
+              "peak_rss_mb":rusage.ru_maxrss/1024,
+              "peak_disk_mb":peak_disk[0]/1024**2}
+
+    if process.returncode != 0:
+        result["status"] = "failed"
+        result["error"] = stderr.decode(errors="replace").strip().split("\n")[-1]
+        return result
+
+    with open(report_file) as f:
+        report = json.load(f)
+
+    result["output_length"] = report["output_length"]
+    result["output_mb"] = report["output_bytes"]/1024**2
+    result["render_time"] = report["phases"]["render"]
+    result["ffmpeg_runs"] = report["totals"]["ffmpeg_runs"]
+    result["speed"] = report["output_length"]/wall_time
+
+    return result
+
+
+def compare_to_baseline(results,baseline,tolerance=0.2):
+    """
+    Compare results to a baseline.  Adds baseline_time and ratio columns and
+    marks runs more than tolerance (fractional) slower than the baseline as
+    regressions.
+
+    results: data frame of benchmark results
+    baseline: data frame of baseline results
+    tolerance: fractional slowdown allowed before flagging a regression
+
+    Returns the results data frame with comparison columns.
+    """
+
+    baseline = baseline[baseline["status"] == "ok"].set_index("case")["wall_time"]
+
+    results = results.copy()
+    results["baseline_time"] = results["case"].map(baseline)
+    results["ratio"] = results["wall_time"]/results["baseline_time"]
+    results["regression"] = (results["ratio"] > 1 + tolerance) | \
+                            ((results["status"] != "ok") & results["baseline_time"].notna())
+
+    return results
+
+
+def run_benchmarks(bench_dir,resolutions=RESOLUTIONS,durations=DURATIONS,
+                   segment_counts=SEGMENT_COUNTS,render_modes=None,jobs=1,
+                   repeats=1):
+    """
+    Generate synthetic inputs and render every combination of resolution,
+    duration, segment count and render mode.
+
+    bench_dir: directory for generated sources, spreadsheets and outputs.
+               sources are kept and reused between runs.
+    resolutions: list of "WIDTHxHEIGHT" strings
+    durations: list of source durations in seconds
+    segment_counts: list of numbers of segments
+    render_modes: list of render modes. if None, use every mode.
+    jobs: number of segment renders to run at once (temp-files mode)
+    repeats: number of times to render each case (the fastest is kept)
+
+    Returns a data frame with one row per case.
+    """
+
+    if render_modes is None:
+        render_modes = chop_video.RENDER_MODES
+
+    os.makedirs(bench_dir,exist_ok=True)
+
+    rows = []
+    for resolution in resolutions:
+
+        width, height = [int(v) for v in resolution.split("x")]
+
+        for duration in durations:
+
+            source_file = os.path.join(bench_dir,"source_{}_{}s.mp4".format(resolution,
+                                                                            duration))
+            make_source(source_file,width,height,duration)
+
+            for num_segments in segment_counts:
+
+                if duration/num_segments < MIN_SLOT:
+                    print("skipping {} segments in {} s (less than {} s per segment)".format(num_segments,
+                                                                                          duration,
+                                                                                          MIN_SLOT))
+                    continue
+
+                spreadsheet_file = os.path.join(bench_dir,"cuts_{}s_{}.csv".format(duration,
+                                                                                 num_segments))
+                fade_length = make_spreadsheet(spreadsheet_file,duration,
+                                               num_segments)
+
+                for render_mode in render_modes:
+
+                    case = "{}_{}s_{}seg_{}".format(resolution,duration,
+                                                    num_segments,render_mode)
+
+                    best = None
+                    for i in range(repeats):
+
+                        case_dir = os.path.join(bench_dir,"runs",case)
+                        if os.path.isdir(case_dir):
+                            shutil.rmtree(case_dir)
+                        os.makedirs(case_dir)
+
+                        result = run_case(case_dir,source_file,spreadsheet_file,
+                                          fade_length,render_mode,jobs)
+                        shutil.rmtree(case_dir)
+
+                        if best is None or result["status"] != "ok" or \
+                           result["wall_time"] < best["wall_time"]:
+                            best = result
+                        if result["status"] != "ok":
+                            break
+
+                    row = {"case":case,
+                           "resolution":resolution,
+                           "duration":duration,
+                           "segments":num_segments,
+                           "render_mode":render_mode,
+                           "jobs":jobs}
+                    row.update(best)
+                    row["source_min_per_min"] = duration/best["wall_time"]
+                    rows.append(row)
+
+                    print("{:<40} {:>8} {:8.2f} s {:6.1f}x {:8.1f} MB RSS {:8.1f} MB disk".format(case,
+                                                                                          row["status"],
+                                                                                          row["wall_time"],
+                                                                                          row["source_min_per_min"],
+                                                                                          row["peak_rss_mb"],
+                                                                                          row["peak_disk_mb"]))
+                    sys.stdout.flush()
+
+    return pd.DataFrame(rows)
+
+
+def _ffmpeg_version():
+    """
+    First line of 'ffmpeg -version' (so results are compared like to like).
+    """
+
+    try:
+        out = subprocess.run(["ffmpeg","-version"],capture_output=True)
+        return out.stdout.decode(errors="replace").split("\n")[0]
+    except OSError:
+        return "unknown"
+
+
+def main(argv=None):
+    """
+    Parse command line arguments and run the benchmarks.
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(description=__description__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--bench-dir",dest="bench_dir",type=str,default="chop_video_bench",
+                        help="directory for generated media and outputs [default: 'chop_video_bench']")
+    parser.add_argument("--resolutions",dest="resolutions",type=str,
+                        default=",".join(RESOLUTIONS),
+                        help="comma-separated WIDTHxHEIGHT list [default: '{}']".format(",".join(RESOLUTIONS)))
+    parser.add_argument("--durations",dest="durations",type=str,
+                        default=",".join([str(d) for d in DURATIONS]),
+                        help="comma-separated source durations in seconds [default: '{}']".format(",".join([str(d) for d in DURATIONS])))
+    parser.add_argument("--segments",dest="segments",type=str,
+                        default=",".join([str(s) for s in SEGMENT_COUNTS]),
+                        help="comma-separated segment counts [default: '{}']".format(",".join([str(s) for s in SEGMENT_COUNTS])))
+    parser.add_argument("--render-modes",dest="render_modes",type=str,
+                        default=",".join(chop_video.RENDER_MODES),
+                        help="comma-separated render modes [default: '{}']".format(",".join(chop_video.RENDER_MODES)))
+    parser.add_argument("--jobs","-j",dest="jobs",type=int,default=1,
+                        help="segment renders to run at once in temp-files mode [default: 1]")
+    parser.add_argument("--repeats",dest="repeats",type=int,default=1,
+                        help="render each case this many times and keep the fastest [default: 1]")
+    parser.add_argument("--out-file","-o",dest="out_file",type=str,default="bench_results.json",
+                        help="json file in which to write results [default: 'bench_results.json']")
+    parser.add_argument("--baseline",dest="baseline",type=str,default=None,
+                        help="results file from an earlier run to compare against [default: 'None']")
+    parser.add_argument("--tolerance",dest="tolerance",type=float,default=0.2,
+                        help="fractional slowdown allowed before a case counts as a regression [default: 0.2]")
+
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.bench_dir,
+                             resolutions=args.resolutions.split(","),
+                             durations=[int(d) for d in args.durations.split(",")],
+                             segment_counts=[int(s) for s in args.segments.split(",")],
+                             render_modes=args.render_modes.split(","),
+                             jobs=args.jobs,
+                             repeats=args.repeats)
+
+    out = {"ffmpeg":_ffmpeg_version(),
+           "platform":platform.platform(),
+           "cpus":os.cpu_count(),
+           "results":results.to_dict(orient="records")}
+    with open(args.out_file,"w") as f:
+        json.dump(out,f,indent=2)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline["ffmpeg"] != out["ffmpeg"]:
+        print("warning: baseline used '{}'; this run used '{}'".format(baseline["ffmpeg"],
+                                                                        out["ffmpeg"]))
+
+    compared = compare_to_baseline(results,pd.DataFrame(baseline["results"]),
+                                   args.tolerance)
+    print(compared[["case","status","wall_time","baseline_time","ratio","regression"]].to_string(index=False))
+
+    regressions = compared[compared["regression"]]
+    if len(regressions) > 0:
+        print("{} of {} cases regressed".format(len(regressions),len(compared)))
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
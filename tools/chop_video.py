@@ -19,12 +19,34 @@ and then combine them.  The program will optionally look at the 'gap' column
 to find the length of gaps to insert between clips.  In this case, it would
 add a 5 second gap (black screen) between the clips but no gap after.
 
+Times may also be given to the millisecond (HH:MM:SS.mmm) or as a frame number
+(e.g. 9375f).  All times are rounded to whole frames of the source video, so
+cuts are frame accurate.
+
 The codecs and resolution of the input video file should be (largely)
 preserved.  This implementation assumes there is both an audio and a video
 stream in the video file.  It uses ffmpeg under the hood.
 
 The program will also optionally dump out a csv file mapping between the
 time in the chopped video and real time.
+
+By default the whole video is rendered in one decode/encode pass using a single
+ffmpeg filter graph.  --render-mode temp-files instead writes every fade, slice
+and gap to a temporary file and joins them at the end.  --render-mode pipe
+makes the same clips but streams them through named pipes into the join, so
+only the output file is written to disk.  --render-mode queue puts the clips in
+an SQLite work queue that any number of 'chop_video.py worker queue.sqlite'
+processes, on this or other hosts sharing the storage, can render; the
+coordinating process checks every clip and joins them.
+
+--preview renders the same cuts at low resolution with fast encoder settings
+and the source time burned into each frame, for quick review.  The timebase it
+writes is identical to that of the full render.
+
+Run 'chop_video.py batch manifest.csv' to process many videos at once (see
+'chop_video.py batch --help').  Run 'chop_video.py detect video.mp4' to write
+a spreadsheet by detecting silence and black screen (see
+'chop_video.py detect --help').
 """
 
 __author__ = "Michael J. Harms"
@@ -35,94 +57,302 @@ import ffmpeg
 import pandas as pd
 import numpy as np
 
-import sys, random, string, copy, glob, shutil, os, argparse, datetime
+import sys, random, string, copy, glob, shutil, os, argparse, datetime, json
+import fractions, re
+import concurrent.futures, logging, hashlib, time, tempfile, threading
+import asyncio, subprocess, sqlite3, contextlib, socket
+
+logger = logging.getLogger(__name__)
+
+# Encoders for the codecs smart cuts can match (see _matched_encoder_kwargs),
+# with the factor between ffprobe's level and the encoder's level number
+_SMART_CUT_ENCODERS = {"h264":("libx264",10),
+                       "hevc":("libx265",30)}
+
+# Stream properties (see _stream_signature) re-encoded smart cut pieces must
+# share with the stream copied ones
+_SMART_CUT_SIGNATURE = ["video codec","video profile","video level",
+                        "resolution","pix_fmt","video time_base"]
+
+# Ways process_video can render the final movie
+RENDER_MODES = ["filtergraph","temp-files","pipe","queue"]
+
+# ffprobe results keyed by path, size and mtime.  See _probe.
+_PROBE_CACHE = {}
+_PROBE_CACHE_STATS = {"hits":0,"misses":0}
+
+# Keyframe times keyed by path, size and mtime.  See _get_keyframe_times.
+_KEYFRAME_CACHE = {}
+
+# Version of how BlankClipCache builds clips, part of every clip's key so
+# clips built an older way are never reused
+_BLANK_CACHE_VERSION = 2
+
+# How process_video runs the clips of a "temp-files" render
+EXECUTORS = ["process","asyncio"]
+
+# How _slice_out cuts chunks out of the source
+CUT_MODES = ["copy","smart"]
+
+# Streaming packages for rendition ladders, and their segment length (s)
+PACKAGE_FORMATS = ["hls","dash"]
+_PACKAGE_SEGMENT_LENGTH = 6
+
+# Height and encoder settings for --preview renders
+_PREVIEW_HEIGHT = 360
+_PREVIEW_OUT_KWARGS = {"c:v":"libx264","preset":"ultrafast","crf":32,
+                       "c:a":"aac","b:a":"64k"}
+
+# Width (pixels) of each thumbnail in a sprite sheet and thumbnails per row
+_SPRITE_WIDTH = 160
+_SPRITE_COLUMNS = 10
+
+# What detect_segments treats as dead time, and how to find it in the ffmpeg log
+DETECT_MODES = ["silence","black","either","both"]
+_SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_PATTERN = re.compile(r"silence_end:\s*(-?[\d.]+)")
+_BLACK_PATTERN = re.compile(r"black_start:\s*(-?[\d.]+)\s+black_end:\s*(-?[\d.]+)")
+
+# Time strings understood by FrameClock
+_TIME_PATTERN = re.compile(r"^(?:(?P<hours>\d{2}):(?P<minutes>[0-5]\d):(?P<seconds>[0-5]\d)(?:\.(?P<fraction>\d{1,6}))?|(?P<frame>\d+)f)$")
 
-def _time_to_seconds(time_string):
+class FrameClock:
     """
-    Convert a HH:MM:SS-style time-string into seconds (integer).
+    Convert between time strings, seconds and integer frame "ticks" at a fixed
+    frame rate.  Working in ticks keeps every cut on a frame boundary and lets
+    times be added and subtracted without rounding error.
+
+    Time strings may be:
+
+        HH:MM:SS (e.g. 00:05:12)
+        HH:MM:SS.mmm (e.g. 00:05:12.250; up to 6 fractional digits)
+        a frame number followed by "f" (e.g. 9375f)
+
+    parse and format work on whole arrays (e.g. spreadsheet columns) at once.
+
+    frame_rate: frames per second as a number or a string like "30000/1001"
+                (e.g. avg_frame_rate from ffprobe).
     """
 
-    error_string = "time '{}' not recognized.  Should have format HH:MM:SS\n".format(time_string)
+    def __init__(self,frame_rate):
 
-    # Make sure it's a string (should catch strings or numpy strings)
-    if not isinstance(time_string,str):
+        try:
+            self.rate = fractions.Fraction(frame_rate)
+        except (ValueError,TypeError,ZeroDivisionError):
+            err = "frame rate '{}' not recognized\n".format(frame_rate)
+            raise ValueError(err)
 
-        # If pandas interpreted as a datetime object, turn into a string
-        if isinstance(time_string,datetime.time):
-            time_string = str(time_string)
-        else:
-            raise ValueError(error_string)
+        if self.rate <= 0:
+            err = "frame rate must be positive\n"
+            raise ValueError(err)
 
-    # Make sure it splits into three with ":"
-    t_list = time_string.split(":")
-    if len(t_list) != 3:
-        raise ValueError(error_string)
+    def parse(self,values):
+        """
+        Convert an array of time strings (or datetime.time objects) to an
+        array of integer ticks, rounding to the nearest frame.
+        """
 
-    # Make sure each bit of the string can be converted to an integer
-    try:
-        # Make sure each chunk has exactly length = 2
-        if sum([len(t) != 2 for t in t_list]) > 0:
-            raise ValueError
+        strings = pd.Series(np.asarray(values,dtype=object).ravel()).astype(str).str.strip()
+        parts = strings.str.extract(_TIME_PATTERN)
+
+        bad = parts["hours"].isnull() & parts["frame"].isnull()
+        if np.sum(bad) > 0:
+            err = "time(s) {} not recognized.  Should have format HH:MM:SS, HH:MM:SS.mmm or a frame number like 1234f\n".format(list(strings[bad]))
+            raise ValueError(err)
+
+        hours = parts["hours"].fillna(0).astype(np.int64).to_numpy()
+        minutes = parts["minutes"].fillna(0).astype(np.int64).to_numpy()
+        seconds = parts["seconds"].fillna(0).astype(np.int64).to_numpy()
+        micro = parts["fraction"].fillna("").str.ljust(6,"0").astype(np.int64).to_numpy()
+
+        # Round microseconds to nearest frame using integer math
+        us = (hours*3600 + minutes*60 + seconds)*1000000 + micro
+        num, den = self.rate.numerator, self.rate.denominator
+        ticks = (us*num + den*500000)//(den*1000000)
+
+        is_frame = parts["frame"].notnull().to_numpy()
+        ticks[is_frame] = parts["frame"][is_frame].astype(np.int64).to_numpy()
+
+        return ticks
+
+    def format(self,ticks):
+        """
+        Convert an array of ticks to an array of HH:MM:SS.mmm strings.
+        """
+
+        ticks = np.asarray(ticks,dtype=np.int64)
 
-        # Convert to integer
-        t_list = [int(t) for t in t_list]
+        num, den = self.rate.numerator, self.rate.denominator
+        ms = (ticks*den*1000 + num//2)//num
 
-    except ValueError:
-        raise ValueError(error_string)
+        if np.sum(ms < 0) > 0:
+            err = "negative times cannot be represented in HH:MM:SS.mmm.\n"
+            raise ValueError(err)
+
+        hours = ms//3600000
+        minutes = (ms//60000) % 60
+        seconds = (ms//1000) % 60
+        ms = ms % 1000
+
+        if np.sum(hours > 99) > 0:
+            err = "times longer than 99:59:59.999 cannot be represented in HH:MM:SS.mmm.\n"
+            raise ValueError(err)
+
+        out = np.char.zfill(hours.astype(str),2)
+        out = np.char.add(np.char.add(out,":"),np.char.zfill(minutes.astype(str),2))
+        out = np.char.add(np.char.add(out,":"),np.char.zfill(seconds.astype(str),2))
+        out = np.char.add(np.char.add(out,"."),np.char.zfill(ms.astype(str),3))
+
+        return out
+
+    def from_seconds(self,seconds):
+        """
+        Convert seconds to ticks, rounding to the nearest frame.
+        """
+
+        ticks = np.rint(np.asarray(seconds,dtype=float)*float(self.rate))
 
-    # Make sure values are all positive
-    if sum([t < 0 for t in t_list]) != 0:
-        raise ValueError(error_string)
+        return ticks.astype(np.int64)
+
+    def to_seconds(self,ticks):
+        """
+        Convert ticks to seconds (float).
+        """
+
+        return np.asarray(ticks)*self.rate.denominator/self.rate.numerator
 
-    # Return converted time
-    return t_list[0]*3600 + t_list[1]*60 + t_list[2]
 
 def _seconds_to_time(seconds):
     """
-    Convert seconds into a time-string with the format HH:MM:SS.  Seconds should
-    be an integer or float (rounded to nearest second and then cast to int).
+    Convert seconds into a time-string with the format HH:MM:SS.mmm.  Seconds
+    should be an integer or float (rounded to nearest millisecond).
     """
 
-    # Represent as integer
     try:
-        if not type(seconds) is int:
-            seconds = int(round(seconds,0))
-    except TypeError:
-        err = "seconds must be able to be converted to an integer\n"
+        ms = int(round(float(seconds)*1000))
+    except (TypeError,ValueError):
+        err = "seconds must be able to be converted to a number\n"
         raise ValueError(err)
 
-    # Make sure the it is not too large to represent
-    max_value = 99*3600 + 59*60 + 59
-    if seconds > max_value:
-        err = "times longer than {} (99:59:59) cannot be represented in HH:MM:SS.\n".format(max_value)
-        raise ValueError(err)
+    return str(FrameClock(1000).format([ms])[0])
+
+def _file_key(input_file):
+    """
+    Return a string identifying the current contents of input_file (absolute
+    path, size and modification time).
+    """
+
+    input_file = os.path.abspath(input_file)
+    stat = os.stat(input_file)
+
+    return "{}|{}|{}".format(input_file,stat.st_size,stat.st_mtime_ns)
 
-    # Convert seconds to hours, minutes, seconds
-    hours = seconds // 3600
-    leftover = seconds - hours*3600
-    minutes = leftover // 60
-    seconds = leftover - minutes*60
+def _probe(input_file,probe_cache_file=None):
+    """
+    Run ffprobe on input_file, caching the result. Results are keyed on the
+    absolute path, size and modification time of the file, so an edited file
+    is probed again. The cache always lives in memory for this process; if
+    probe_cache_file is given, it is also stored in that json file so it
+    persists between runs.
+
+    input_file: file to probe
+    probe_cache_file: json file holding cached probe results (optional)
+    """
 
-    # Make sure the resulting time is sane.
+    input_file = os.path.abspath(input_file)
+    key = _file_key(input_file)
+
+    # In-process cache
     try:
-        assert seconds >= 0 and seconds < 60
-        assert minutes >= 0 and minutes < 60
-        assert hours >= 0 and hours < 100
-    except AssertionError:
-        err = "time could not be converted to HH:MM:SS format.\n"
-        err += "gave: {} hours, {} minutes, {} seconds\n".format(hours,minutes,seconds)
-        raise RuntimeError(err)
+        result = _PROBE_CACHE[key]
+        _PROBE_CACHE_STATS["hits"] += 1
+        return copy.deepcopy(result)
+    except KeyError:
+        pass
+
+    # On-disk cache
+    disk_cache = {}
+    if probe_cache_file is not None and os.path.isfile(probe_cache_file):
+        try:
+            with open(probe_cache_file) as f:
+                disk_cache = json.load(f)
+        except ValueError:
+            disk_cache = {}
+
+        try:
+            _PROBE_CACHE[key] = disk_cache[key]
+            _PROBE_CACHE_STATS["hits"] += 1
+            return copy.deepcopy(disk_cache[key])
+        except KeyError:
+            pass
+
+    # Not cached. Actually probe the file.
+    _PROBE_CACHE_STATS["misses"] += 1
+    result = ffmpeg.probe(input_file,show_data_hash="sha256")
+    _PROBE_CACHE[key] = result
+
+    # Write out on-disk cache (via rename so readers never see partial file)
+    if probe_cache_file is not None:
+        disk_cache[key] = result
+        tmp_file = "{}.{}.tmp".format(probe_cache_file,os.getpid())
+        with open(tmp_file,"w") as f:
+            json.dump(disk_cache,f)
+        os.replace(tmp_file,probe_cache_file)
+
+    return copy.deepcopy(result)
+
+def _get_keyframe_times(input_file):
+    """
+    Return a sorted numpy array of the times (in seconds) of every keyframe in
+    the first video stream of input_file. This only reads packet headers, so it
+    does not decode the video. The index is built once per source file and then
+    cached in memory.
+
+    input_file: video file to index
+    """
+
+    key = _file_key(input_file)
+    try:
+        return _KEYFRAME_CACHE[key]
+    except KeyError:
+        pass
+
+    packets = ffmpeg.probe(input_file,
+                           select_streams="v:0",
+                           show_entries="packet=pts_time,flags")["packets"]
+
+    keyframes = []
+    for packet in packets:
+        try:
+            if "K" in packet["flags"]:
+                keyframes.append(float(packet["pts_time"]))
+        except (KeyError,ValueError):
+            continue
+
+    keyframes = np.unique(np.array(keyframes,dtype=float))
+    _KEYFRAME_CACHE[key] = keyframes
+
+    return keyframes
+
+def probe_cache_stats():
+    """
+    Return a dictionary with the number of probe cache "hits" and "misses" seen
+    by this process. (Worker processes keep their own counts.)
+    """
 
-    return "{:02}:{:02}:{:02}".format(hours,minutes,seconds)
+    return dict(_PROBE_CACHE_STATS)
 
-def _get_video_properties(input_file):
+def _get_video_properties(input_file,probe_cache_file=None):
     """
     Use ffprobe to extract information for video processing from video file.
     Note that it only looks at the first audio and first video streams.
+
+    input_file: video file to probe
+    probe_cache_file: json file holding cached probe results (optional)
     """
 
     # Rip some information from the video for use in arguments later
-    ffprobe = ffmpeg.probe(input_file)["streams"]
+    ffprobe = _probe(input_file,probe_cache_file)["streams"]
 
     # Find indexes for audio and video streams
     video_index = None
@@ -154,8 +384,8 @@ def _get_video_properties(input_file):
     else:
         out["audio_first"] = True
 
-    # Get max duration as integer
-    out['duration'] = int(np.floor(float(ffprobe[audio_index]['duration'])))
+    # Get duration in seconds
+    out['duration'] = float(ffprobe[audio_index]['duration'])
 
     # Audio
     out['audio_codec'] = ffprobe[audio_index]['codec_name']
@@ -164,6 +394,8 @@ def _get_video_properties(input_file):
 
     # Video
     out['frame_rate'] = ffprobe[video_index]['avg_frame_rate']
+    if out['frame_rate'] in ["0/0","0/1"]:
+        out['frame_rate'] = ffprobe[video_index]['r_frame_rate']
     out['width'] = ffprobe[video_index]['width']
     out['height'] = ffprobe[video_index]['height']
     out['video_codec'] = ffprobe[video_index]['codec_name']
@@ -180,78 +412,766 @@ def _get_video_properties(input_file):
 
     return out
 
-def _fade_in(input_file,output_file,stop_fade,fade_length):
+
+class _RenderContext:
+    """
+    Settings and bookkeeping shared by the ffmpeg runs of one render: whether
+    to draw progress bars, the stall timeout, the statistics of every finished
+    run and the runs still going (so they can be killed if the render is
+    cancelled).  Passed explicitly to the render functions, so renders running
+    at the same time in one process never see each other's settings or runs.
+    Once killed, a context (and each of its children) refuses to start any
+    more ffmpeg runs or render tasks.
+
+    progress: draw a progress bar for runs started from the main thread
+    stall_timeout: seconds an ffmpeg process may go without output before it
+                   is killed as hung. if None, wait forever.
+    """
+
+    def __init__(self,progress=False,stall_timeout=None):
+
+        self.progress = progress
+        self.stall_timeout = stall_timeout
+        self.stats = []
+        self.cancelled = False
+
+        self._runs = set()
+        self._children = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+
+        # Only the settings travel to worker processes
+        return {"progress":self.progress,"stall_timeout":self.stall_timeout}
+
+    def __setstate__(self,state):
+
+        self.__init__(**state)
+
+    def child(self,progress=False):
+        """
+        New context with the same stall timeout, progress bars off (unless
+        progress is True) and no statistics or runs of its own, e.g. for one
+        render task.  Killing this context also kills the child's runs.
+        """
+
+        child = _RenderContext(progress,self.stall_timeout)
+        with self._lock:
+            child.cancelled = self.cancelled
+            self._children.append(child)
+
+        return child
+
+    def check_cancelled(self,what="ffmpeg"):
+        """
+        Raise RuntimeError if the context has been killed.
+        """
+
+        if self.cancelled:
+            err = "render was cancelled; not starting {}\n".format(what)
+            raise RuntimeError(err)
+
+    def add_run(self,run):
+        """
+        Track a run so kill() can stop it.  Returns False (without tracking
+        it) if the context has already been killed.
+        """
+
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._runs.add(run)
+
+        return True
+
+    def remove_run(self,run):
+
+        with self._lock:
+            self._runs.discard(run)
+
+    def record(self,stats):
+        """
+        Add the statistics of finished ffmpeg runs.
+        """
+
+        with self._lock:
+            self.stats.extend(stats)
+
+    def kill(self):
+        """
+        Kill every ffmpeg process still running in this context or any of its
+        children, and refuse to start new ones.
+        """
+
+        with self._lock:
+            self.cancelled = True
+            runs = list(self._runs)
+            children = list(self._children)
+
+        for run in runs:
+            try:
+                run.kill()
+            except OSError:
+                pass
+
+        for child in children:
+            child.kill()
+
+
+class _FFmpegRun:
+    """
+    A running ffmpeg process with -progress piped back.  Background threads
+    drain stdout (progress) and stderr as they arrive, so the process can never
+    stall on a full pipe.  Progress is parsed into the statistics returned by
+    wait() and, if enabled, drawn as a progress bar with an ETA on stderr.
+
+    stream_spec: ffmpeg-python output node to run
+    stage: name of this run in progress bars and render reports
+    duration: expected length of the output in seconds (for the bar and ETA).
+              if None, only show the time encoded so far.
+    show_progress: draw a progress bar. if None, draw one if progress is
+                   enabled in context and this is the main thread.
+    context: _RenderContext the run belongs to. if None, use a new one with
+             default settings.
+    """
+
+    def __init__(self,stream_spec,stage,duration=None,show_progress=None,
+                 context=None):
+
+        if context is None:
+            context = _RenderContext()
+        self.context = context
+        context.check_cancelled("ffmpeg ({})".format(stage))
+
+        self.stage = stage
+        self.duration = duration
+        if show_progress is None:
+            show_progress = context.progress and \
+                            threading.current_thread() is threading.main_thread()
+        self.show_progress = show_progress
+
+        self.progress = {}
+        self.stderr = ""
+        self._stderr = []
+
+        self._start_time = time.perf_counter()
+        self._last_output = self._start_time
+        self.process = (
+            stream_spec
+            .global_args("-progress","pipe:1","-nostats")
+            .run_async(pipe_stdout=True,pipe_stderr=True,overwrite_output=True)
+        )
+
+        # The context may have been killed while ffmpeg was starting
+        if not self.context.add_run(self):
+            self.process.kill()
+            self.process.communicate()
+            self.context.check_cancelled("ffmpeg ({})".format(stage))
+
+        self._threads = [threading.Thread(target=self._read_progress,daemon=True),
+                         threading.Thread(target=self._read_stderr,daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def _read_progress(self):
+
+        block = {}
+        for line in self.process.stdout:
+            self._last_output = time.perf_counter()
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            block[key] = value
+
+            # Each block of key=value lines ends with progress=continue|end
+            if key == "progress":
+                self.progress = block
+                block = {}
+                if self.show_progress:
+                    self._draw()
+
+    def _read_stderr(self):
+
+        for line in self.process.stderr:
+            self._last_output = time.perf_counter()
+            self._stderr.append(line)
+
+    def _value(self,key,default=None):
+        """
+        Numeric value of a progress key (None if missing or N/A).
+        """
+
+        value = self.progress.get(key,"N/A").rstrip("x")
+        try:
+            return float(value)
+        except ValueError:
+            return default
+
+    def _out_time(self):
+
+        # out_time_ms is (despite its name) in microseconds, like out_time_us
+        out_time = self._value("out_time_us",self._value("out_time_ms"))
+        if out_time is None:
+            return 0.0
+
+        return max(0.0,out_time/1e6)
+
+    def _draw(self):
+
+        elapsed = time.perf_counter() - self._start_time
+        out_time = self._out_time()
+        speed = self._value("speed")
+        speed = "  -  " if speed is None else "{:4.1f}x".format(speed)
+
+        if self.duration is None or self.duration <= 0:
+            msg = "{:<28} {} {}".format(self.stage[:28],
+                                        _seconds_to_time(out_time),speed)
+        else:
+            fraction = min(1.0,out_time/self.duration)
+            if fraction > 0:
+                eta = _seconds_to_time(elapsed*(1 - fraction)/fraction)[:8]
+            else:
+                eta = "--:--:--"
+            bar = "#"*int(30*fraction)
+            msg = "{:<28} [{:<30}] {:5.1f}% {} ETA {}".format(self.stage[:28],
+                                                            bar,
+                                                            100*fraction,
+                                                            speed,eta)
+
+        sys.stderr.write("\r" + msg)
+        sys.stderr.flush()
+
+    def kill(self):
+
+        self.process.kill()
+
+    def wait(self,timeout=None):
+        """
+        Wait for ffmpeg to finish.  Raises ffmpeg.Error if it fails; otherwise
+        records the statistics of the run in its context and returns them.
+
+        timeout: kill ffmpeg and raise TimeoutError if it writes no progress
+                 or log output for this many seconds. if None, use the stall
+                 timeout of the run's context.
+        """
+
+        if timeout is None:
+            timeout = self.context.stall_timeout
+
+        try:
+            while True:
+                try:
+                    self.process.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    stalled = time.perf_counter() - self._last_output
+                    if timeout is not None and stalled > timeout:
+                        self.kill()
+                        self.process.wait()
+                        err = "ffmpeg ({}) produced no output for {} seconds and was killed\n".format(self.stage,
+                                                                                                   timeout)
+                        raise TimeoutError(err)
+        finally:
+            self.context.remove_run(self)
+            for t in self._threads:
+                t.join()
+
+        if self.show_progress:
+            sys.stderr.write("\n")
+            sys.stderr.flush()
+
+        self.stderr = b"".join(self._stderr).decode(errors="replace")
+        if self.process.returncode != 0:
+            raise ffmpeg.Error("ffmpeg",b"",b"".join(self._stderr))
+
+        wall_time = time.perf_counter() - self._start_time
+        out_time = self._out_time()
+        stats = {"stage":self.stage,
+                 "wall_time":wall_time,
+                 "out_time":out_time,
+                 "frames":self._value("frame"),
+                 "fps":self._value("fps"),
+                 "speed":self._value("speed"),
+                 "bytes":self._value("total_size")}
+
+        for key in ["frames","bytes"]:
+            if stats[key] is not None:
+                stats[key] = int(stats[key])
+
+        # ffmpeg reports speed as N/A for very short runs
+        if stats["speed"] is None and wall_time > 0:
+            stats["speed"] = out_time/wall_time
+
+        self.context.record([stats])
+
+        return stats
+
+
+def _run_ffmpeg(stream_spec,stage,duration=None,context=None):
+    """
+    Run an ffmpeg-python output node to completion with progress reporting
+    (see _FFmpegRun).  Returns the run.
+    """
+
+    run = _FFmpegRun(stream_spec,stage,duration,context=context)
+    run.wait()
+
+    return run
+
+
+def _fade_in(input_file,output_file,stop_fade,fade_length,video_props=None,
+             context=None):
     """
     Make a tiny video encoding a fade from black for a chunk extracted
     from a larger video.
 
     input_file: input video file.
     output_file: output video file.
-    stop_fade: time at which to stop the fade (as indexed in the input_file)
+    stop_fade: time at which to stop the fade (seconds, as indexed in the
+               input_file)
     fade_length: fade length in seconds
+    video_props: output of _get_video_properties for input_file. If None,
+                 probe input_file.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
     """
 
-    video_props = _get_video_properties(input_file)
+    if video_props is None:
+        video_props = _get_video_properties(input_file)
 
-    out_kwargs = video_props["out_kwargs"]
-    out_kwargs["filter:v"] = "fade=in:0:{}".format(fade_length*video_props['frame_rate'])
+    out_kwargs = dict(video_props["out_kwargs"])
+    out_kwargs["filter:v"] = "fade=t=in:st=0:d={}".format(fade_length)
 
-    # Fade length
-    start_fade_sec = _time_to_seconds(stop_fade) - fade_length
-    start_fade = _seconds_to_time(start_fade_sec)
+    start_fade = stop_fade - fade_length
 
-    (
+    _run_ffmpeg(
         ffmpeg
         .input(input_file,**{"ss":start_fade,
                              "to":stop_fade})
-        .output(output_file,**out_kwargs)
-        .run()
+        .output(output_file,**out_kwargs),
+        "fade-in",fade_length,context
     )
 
 
-def _slice_out(input_file,output_file,start,stop):
+def _concat_copy(file_list,output_file,duration=None,context=None,
+                 video_props=None,extras=None):
     """
-    Chop a chunk of video out of a large video, copying the codecs.
+    Join files with the ffmpeg concat demuxer, copying (not re-encoding) the
+    streams. All files must have identical codecs and codec parameters.
+
+    file_list: list of files to join, in order
+    output_file: output video file
+    duration: length of the joined video in seconds (for progress)
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    video_props: output of _get_video_properties for the source video (only
+                 needed with extras)
+    extras: renditions, sprite and chapters to make in the same run (see
+            _copy_join_outputs). if None, only join.
     """
 
-    (
-        ffmpeg
-        .input(input_file,**{"ss":start,"to":stop})
-        .output(output_file,**{"c:v":"copy","c:a":"copy"})
-        .run()
-    )
+    list_file = "{}.concat.txt".format(output_file)
+    with open(list_file,"w") as f:
+        for file_name in file_list:
+            f.write("file '{}'\n".format(os.path.abspath(file_name).replace("'","'\\''")))
+
+    try:
+        source = ffmpeg.input(list_file,**{"f":"concat","safe":0})
+        nodes = _copy_join_outputs(source,output_file,duration,video_props,
+                                   extras)
+        _run_ffmpeg(ffmpeg.merge_outputs(*nodes),"join (copy)",duration,
+                    context)
+    finally:
+        os.remove(list_file)
+
+
+def _matched_encoder_kwargs(input_file,video_props,keyframes):
+    """
+    Output keyword arguments that re-encode video with the same encoder
+    parameters as the first video stream of input_file (profile, level, pixel
+    format, time base and group-of-pictures structure), so the re-encoded
+    pieces of a smart cut can be joined to stream copied ones.  Returns None
+    if the source codec cannot be matched.
+
+    input_file: source video file
+    video_props: output of _get_video_properties for input_file
+    keyframes: sorted array of keyframe times in input_file, in seconds
+    """
+
+    stream = None
+    for candidate in _probe(input_file)["streams"]:
+        if candidate.get("codec_type") == "video":
+            stream = candidate
+            break
+
+    if stream is None or stream.get("codec_name") not in _SMART_CUT_ENCODERS:
+        return None
+
+    encoder, level_scale = _SMART_CUT_ENCODERS[stream["codec_name"]]
+
+    profile = str(stream.get("profile","")).lower()
+    profile = profile.replace("constrained ","").replace(" ","")
+    try:
+        level = int(stream["level"])
+        time_base = fractions.Fraction(stream["time_base"])
+    except (KeyError,ValueError,TypeError):
+        return None
+    if profile == "" or level <= 0:
+        return None
+
+    out_kwargs = dict(video_props["out_kwargs"])
+    out_kwargs.update({"c:v":encoder,
+                       "profile:v":profile,
+                       "level:v":"{:.1f}".format(level/level_scale),
+                       "pix_fmt":stream["pix_fmt"],
+                       "video_track_timescale":time_base.denominator})
+
+    # Keep the source's keyframe interval and reference structure
+    if len(keyframes) > 1:
+        frame_rate = float(fractions.Fraction(video_props["frame_rate"]))
+        out_kwargs["g"] = max(1,int(round(np.median(np.diff(keyframes))*frame_rate)))
+    if "has_b_frames" in stream:
+        out_kwargs["bf"] = int(stream["has_b_frames"])
+    if "refs" in stream:
+        out_kwargs["refs"] = int(stream["refs"])
+
+    return out_kwargs
+
+
+def _slice_out(input_file,output_file,start,stop,video_props=None,keyframes=None,
+               context=None):
+    """
+    Chop a chunk of video out of a large video, copying the codecs.
+
+    If keyframes is None, the whole chunk is stream copied. This is fast, but
+    the cut snaps to the nearest keyframe. If keyframes are given, do a
+    "smart cut": only the partial groups of pictures between start and the
+    first keyframe after it (and between the last keyframe before stop and
+    stop) are re-encoded.  Everything between those keyframes is stream copied.
+    This gives frame-accurate cuts at close to stream-copy speed.  The
+    re-encoded pieces use the source's encoder parameters (see
+    _matched_encoder_kwargs).  If those cannot be matched, the whole chunk is
+    re-encoded instead.
 
+    input_file: input video file.
+    output_file: output video file.
+    start: time at which to start the chunk (seconds, as indexed in the
+           input_file)
+    stop: time at which to stop the chunk (seconds, as indexed in the
+          input_file)
+    video_props: output of _get_video_properties for input_file. If None,
+                 probe input_file. Only used for smart cuts.
+    keyframes: sorted array of keyframe times in input_file, in seconds (see
+               _get_keyframe_times). If None, stream copy the whole chunk.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
 
-def _fade_out(input_file,output_file,start_fade,fade_length):
+    if keyframes is None:
+        _run_ffmpeg(
+            ffmpeg
+            .input(input_file,**{"ss":start,"to":stop})
+            .output(output_file,**{"c:v":"copy","c:a":"copy"}),
+            "slice",stop - start,context
+        )
+        return
+
+    if video_props is None:
+        video_props = _get_video_properties(input_file)
+
+    start_sec = start
+    stop_sec = stop
+
+    # First keyframe at/after start and last keyframe at/before stop
+    keyframes = np.asarray(keyframes)
+    first_index = np.searchsorted(keyframes,start_sec,side="left")
+    last_index = np.searchsorted(keyframes,stop_sec,side="right") - 1
+
+    def _reencode():
+        _run_ffmpeg(
+            ffmpeg
+            .input(input_file,**{"ss":start,"to":stop})
+            .output(output_file,**video_props["out_kwargs"]),
+            "slice (re-encode)",stop - start,context
+        )
+
+    # No complete group of pictures in the chunk.  Re-encode all of it.
+    if first_index >= len(keyframes) or last_index < 0 or \
+       keyframes[first_index] >= keyframes[last_index]:
+        _reencode()
+        return
+
+    # Cannot encode pieces that match the source.  Re-encode all of it.
+    matched_kwargs = _matched_encoder_kwargs(input_file,video_props,keyframes)
+    if matched_kwargs is None:
+        logger.info("cannot match the source encoder; re-encoding {}-{}".format(_seconds_to_time(start),
+                                                                             _seconds_to_time(stop)))
+        _reencode()
+        return
+
+    first_key = keyframes[first_index]
+    last_key = keyframes[last_index]
+
+    # (piece start, piece stop, stream copy?)
+    pieces = []
+    if first_key > start_sec:
+        pieces.append((start_sec,first_key,False))
+    pieces.append((first_key,last_key,True))
+    if stop_sec > last_key:
+        pieces.append((last_key,stop_sec,False))
+
+    piece_files = []
+    try:
+        for i, (piece_start, piece_stop, stream_copy) in enumerate(pieces):
+
+            piece_file = "{}.piece{}.mp4".format(output_file,i)
+            piece_files.append(piece_file)
+
+            if stream_copy:
+                out_kwargs = {"c:v":"copy","c:a":"copy"}
+            else:
+                out_kwargs = matched_kwargs
+
+            _run_ffmpeg(
+                ffmpeg
+                .input(input_file,**{"ss":repr(float(piece_start)),
+                                     "to":repr(float(piece_stop))})
+                .output(piece_file,**out_kwargs),
+                "slice piece",float(piece_stop - piece_start),context
+            )
+
+        # Check the encoder really produced matching parameters
+        copy_index = [p[2] for p in pieces].index(True)
+        copied = _stream_signature(piece_files[copy_index])
+        for i, (_, _, stream_copy) in enumerate(pieces):
+            if stream_copy:
+                continue
+            encoded = _stream_signature(piece_files[i])
+            for k in _SMART_CUT_SIGNATURE:
+                if encoded.get(k) != copied.get(k):
+                    logger.info("re-encoded piece has {} '{}' (source has '{}'); re-encoding {}-{}".format(k,
+                                                                                                      encoded.get(k),
+                                                                                                      copied.get(k),
+                                                                                                      _seconds_to_time(start),
+                                                                                                      _seconds_to_time(stop)))
+                    _reencode()
+                    return
+
+        _concat_copy(piece_files,output_file,stop - start,context)
+
+    finally:
+        for f in piece_files:
+            if os.path.isfile(f):
+                os.remove(f)
+
+
+def _fade_out(input_file,output_file,start_fade,fade_length,video_props=None,
+              context=None):
     """
     Make a tiny video encoding a fade to black for a chunk extracted
     from a larger video.
 
     input_file: input video file.
     output_file: output video file.
-    start_fade: time at which to start the fade (as indexed in the input_file)
+    start_fade: time at which to start the fade (seconds, as indexed in the
+                input_file)
     fade_length: fade length in seconds
+    video_props: output of _get_video_properties for input_file. If None,
+                 probe input_file.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
     """
 
-    video_props = _get_video_properties(input_file)
+    if video_props is None:
+        video_props = _get_video_properties(input_file)
 
-    out_kwargs = video_props["out_kwargs"]
-    out_kwargs["filter:v"] = "fade=out:0:{}".format(fade_length*video_props['frame_rate'])
+    out_kwargs = dict(video_props["out_kwargs"])
+    out_kwargs["filter:v"] = "fade=t=out:st=0:d={}".format(fade_length)
 
-    # Fade length
-    stop_fade_sec = _time_to_seconds(start_fade) + fade_length
-    stop_fade = _seconds_to_time(stop_fade_sec)
+    stop_fade = start_fade + fade_length
 
-    (
+    _run_ffmpeg(
         ffmpeg
         .input(input_file,**{"ss":start_fade,
                              "to":stop_fade})
-        .output(output_file,**out_kwargs)
-        .run()
+        .output(output_file,**out_kwargs),
+        "fade-out",fade_length,context
     )
 
 
-def _generate_blank(input_file,output_file,length):
+def _synthesize_blank(output_file,length,video_props,context=None):
+    """
+    Encode a clip with black video and silent audio.
+
+    output_file: output video file.
+    length: length of black frame, in seconds
+    video_props: output of _get_video_properties for the video the clip must
+                 match.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    out_kwargs = dict(video_props["out_kwargs"])
+
+    # Generate black video
+    video = ffmpeg.input("color=c=black:s={}x{}".format(video_props['width'],
+                                                        video_props['height']),
+                         **{"t":length,"f":"lavfi"})
+
+    # Generate silent audio track
+    audio = ffmpeg.input("anullsrc=channel_layout={}:sample_rate={}".format(video_props['channel_layout'],
+                                                                              video_props['sample_rate']),
+                         **{"t":length,"f":"lavfi"})
+
+
+    # Combine video and audio
+    if video_props["audio_first"]:
+        stream = ffmpeg.concat(video.video,audio.audio,a=1,v=1).node
+    else:
+        stream = ffmpeg.concat(video.audio,audio.video,v=1,a=1).node
+
+    # Write output
+    out = ffmpeg.output(stream[0],stream[1],output_file,**out_kwargs)
+    _run_ffmpeg(out,"blank",length,context)
+
+
+class BlankClipCache:
+    """
+    Content-addressed, on-disk cache of black/silent clips.  Clips are keyed on
+    everything that determines their bytes (resolution, pixel format, codecs,
+    sample rate, channel layout, frame rate and length), so the same clip is
+    reused across gaps, runs and source videos.  Clips that are a whole number
+    of seconds long are built by stream copying the video of a cached
+    one-second unit clip and encoding a single silent audio track for the
+    whole clip.  When the cache grows past max_bytes, the least recently used clips are
+    removed.
+
+    cache_dir: directory in which to store clips
+    max_bytes: maximum total size of the clips in the cache
+    """
+
+    def __init__(self,cache_dir,max_bytes=1024**3):
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.cache_dir,exist_ok=True)
+
+    def _key(self,video_props,length):
+        """
+        Hash of the properties that define a blank clip.
+        """
+
+        to_hash = {"width":video_props["width"],
+                   "height":video_props["height"],
+                   "pix_fmt":video_props["pix_fmt"],
+                   "video_codec":video_props["video_codec"],
+                   "audio_codec":video_props["audio_codec"],
+                   "sample_rate":video_props["sample_rate"],
+                   "channel_layout":video_props["channel_layout"],
+                   "frame_rate":video_props["frame_rate"],
+                   "length":float(length),
+                   "version":_BLANK_CACHE_VERSION}
+
+        encoded = json.dumps(to_hash,sort_keys=True).encode()
+
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self,video_props,length,context=None):
+        """
+        Return the path to a cached blank clip matching video_props that is
+        length seconds long, creating it if necessary (with the ffmpeg runs in
+        context).
+        """
+
+        clip_file = os.path.join(self.cache_dir,
+                                 "{}.mp4".format(self._key(video_props,length)))
+
+        # Cache hit.  Mark as recently used.
+        if os.path.isfile(clip_file):
+            os.utime(clip_file)
+            return clip_file
+
+        # Write to a unique temporary name and rename, so other processes and
+        # threads sharing the cache never see (or write into) a partial clip.
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir,
+                                        prefix="{}.".format(os.path.basename(clip_file)[:-4]),
+                                        suffix=".tmp.mp4")
+        os.close(fd)
+        try:
+            if length > 1 and float(length).is_integer():
+                unit_file = self.get(video_props,1,context)
+                self._join_units(unit_file,int(length),tmp_file,video_props,
+                                 context)
+            else:
+                _synthesize_blank(tmp_file,length,video_props,context)
+            os.replace(tmp_file,clip_file)
+        finally:
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+        self._evict(keep=clip_file)
+
+        return clip_file
+
+    def _join_units(self,unit_file,count,output_file,video_props,context=None):
+        """
+        Write count copies of unit_file back to back into output_file.  The
+        video is stream copied, but the audio is encoded afresh: each unit's
+        AAC track is padded out to whole 1024 sample frames and has its own
+        encoder priming, so copying it would let the audio drift from the
+        video a little more with every unit.
+        """
+
+        list_file = "{}.concat.txt".format(output_file)
+        with open(list_file,"w") as f:
+            for _ in range(count):
+                f.write("file '{}'\n".format(os.path.abspath(unit_file).replace("'","'\\''")))
+
+        # Only the audio options apply; the video is copied
+        out_kwargs = {k:v for k, v in video_props["out_kwargs"].items()
+                      if k.split(":")[1:2] == ["a"]}
+        out_kwargs["c:v"] = "copy"
+
+        units = ffmpeg.input(list_file,**{"f":"concat","safe":0})
+        audio = ffmpeg.input("anullsrc=channel_layout={}:sample_rate={}".format(video_props['channel_layout'],
+                                                                                  video_props['sample_rate']),
+                             **{"t":count,"f":"lavfi"})
+
+        try:
+            _run_ffmpeg(ffmpeg.output(units.video,audio.audio,output_file,
+                                      **out_kwargs),
+                        "blank",count,context)
+        finally:
+            os.remove(list_file)
+
+    def _evict(self,keep=None):
+        """
+        Remove least recently used clips until the cache is under max_bytes.
+        Never removes keep.
+        """
+
+        clips = []
+        for f in glob.glob(os.path.join(self.cache_dir,"*.mp4")):
+
+            # Skip clips other processes are still writing
+            if f.endswith(".tmp.mp4"):
+                continue
+
+            try:
+                stat = os.stat(f)
+            except FileNotFoundError:
+                continue
+            clips.append((stat.st_mtime,stat.st_size,f))
+
+        total = sum([c[1] for c in clips])
+        for mtime, size, f in sorted(clips):
+            if total <= self.max_bytes:
+                break
+            if f == keep:
+                continue
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _generate_blank(input_file,output_file,length,video_props=None,
+                    blank_cache=None,context=None):
     """
     Generate a clip with black video and silent audio that matches the codecs
     and size of the input_file.
@@ -259,72 +1179,2091 @@ def _generate_blank(input_file,output_file,length):
     input_file: input video file.
     output_file: output video file.
     length: length of black frame, in seconds
+    video_props: output of _get_video_properties for input_file. If None,
+                 probe input_file.
+    blank_cache: BlankClipCache instance. If not None, take the clip from the
+                 cache rather than encoding a new one.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    if video_props is None:
+        video_props = _get_video_properties(input_file)
+
+    if blank_cache is None:
+        _synthesize_blank(output_file,length,video_props,context)
+        return
+
+    cached_file = blank_cache.get(video_props,length,context)
+
+    # Hard link if we can (free); copy if we cannot.
+    try:
+        os.link(cached_file,output_file)
+    except OSError:
+        shutil.copy(cached_file,output_file)
+
+
+def _run_render_task(task,context=None):
+    """
+    Run a single render task (see _build_render_tasks). This is module-level so
+    it can be shipped to worker processes. The clip is written to a partial
+    file and renamed when complete, so an existing output_file is always a
+    finished clip.
+
+    task: render task dictionary
+    context: _RenderContext of the task alone (see _RenderContext.child). if
+             None, use a new one.
+
+    Returns the statistics of the ffmpeg runs the task made, labeled with the
+    task name.
+    """
+
+    if context is None:
+        context = _RenderContext()
+    context.check_cancelled(task["name"])
+
+    partial_file = _partial_file(task["output_file"])
+    try:
+        _RENDER_FUNCTIONS[task["kind"]](task["input_file"],partial_file,
+                                        *task["args"],context=context)
+        os.replace(partial_file,task["output_file"])
+    finally:
+        if os.path.isfile(partial_file):
+            os.remove(partial_file)
+
+    for stat in context.stats:
+        stat["task"] = task["name"]
+
+    return context.stats
+
+
+def _partial_file(output_file):
+    """
+    Name of the file a render task writes to before it is complete.
+    """
+
+    root, ext = os.path.splitext(output_file)
+
+    return "{}.partial{}".format(root,ext)
+
+
+def _tasks_to_run(tasks):
+    """
+    Render tasks that still need to run: those whose output_file does not
+    exist yet, with one task per output_file.  Identical clips (e.g. gaps of
+    the same length) share an output_file, so rendering it once serves every
+    segment that uses it.
+    """
+
+    tasks_to_run = []
+    seen = set()
+    for t in tasks:
+        if t["output_file"] in seen or os.path.isfile(t["output_file"]):
+            continue
+        seen.add(t["output_file"])
+        tasks_to_run.append(t)
+
+    return tasks_to_run
+
+
+def _run_render_tasks(tasks,jobs=1,executor="process",context=None):
+    """
+    Run a list of render tasks, either one at a time (jobs == 1) or at most
+    jobs at a time. Tasks whose output_file already exists are skipped and
+    tasks sharing an output_file are rendered once (see _tasks_to_run). Every
+    task is attempted; if any fail, their partial outputs are removed and a
+    RuntimeError describing each failure is raised.
+
+    tasks: list of render task dictionaries (see _build_render_tasks)
+    jobs: number of tasks to run at once
+    executor: "process" runs tasks on a pool of worker processes; "asyncio"
+              runs them on an event loop (see _run_render_tasks_async).
+    context: _RenderContext in which to record the statistics of every task.
+             if None, use a new one.
+    """
+
+    if context is None:
+        context = _RenderContext()
+
+    if executor == "asyncio":
+        asyncio.run(_run_render_tasks_async(tasks,jobs,context))
+        return
+
+    tasks_to_run = _tasks_to_run(tasks)
+
+    failures = []
+    if jobs == 1:
+        for task in tasks_to_run:
+            try:
+                context.record(_run_render_task(task,context.child(context.progress)))
+            except Exception as e:
+                failures.append((task,e))
+    else:
+        # No progress bars in the workers; bars from several workers would
+        # overwrite each other.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = dict([(pool.submit(_run_render_task,t,context.child()),t)
+                            for t in tasks_to_run])
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    context.record(future.result())
+                except Exception as e:
+                    failures.append((futures[future],e))
+
+    _raise_render_failures(tasks,tasks_to_run,failures)
+
+
+async def _run_render_tasks_async(tasks,jobs=1,context=None):
+    """
+    Run a list of render tasks on an asyncio event loop, at most jobs at a
+    time.  The work happens in ffmpeg subprocesses, so each task just waits on
+    its processes in a thread; stdout and stderr of every process are drained
+    as they arrive and each process is killed if it stalls for longer than the
+    stall timeout of context (see _FFmpegRun.wait).  Every task has its own
+    _RenderContext, so if the coroutine is cancelled, the ffmpeg processes of
+    these tasks (and no others) are killed.  Otherwise behaves like
+    _run_render_tasks.
+
+    tasks: list of render task dictionaries (see _build_render_tasks)
+    jobs: number of tasks to run at once
+    context: _RenderContext in which to record the statistics of every task.
+             if None, use a new one.
+    """
+
+    if context is None:
+        context = _RenderContext()
+
+    tasks_to_run = _tasks_to_run(tasks)
+    task_contexts = [context.child() for _ in tasks_to_run]
+
+    semaphore = asyncio.Semaphore(jobs)
+    async def _run(task,task_context):
+        async with semaphore:
+            return await asyncio.to_thread(_run_render_task,task,task_context)
+
+    try:
+        results = await asyncio.gather(*[_run(t,c) for t, c in zip(tasks_to_run,task_contexts)],
+                                       return_exceptions=True)
+    except asyncio.CancelledError:
+        for task_context in task_contexts:
+            task_context.kill()
+        raise
+
+    failures = []
+    for task, result in zip(tasks_to_run,results):
+        if isinstance(result,Exception):
+            failures.append((task,result))
+        else:
+            context.record(result)
+
+    _raise_render_failures(tasks,tasks_to_run,failures)
+
+
+def _raise_render_failures(tasks,tasks_to_run,failures):
+    """
+    If any render tasks failed, remove their partial outputs and raise a
+    RuntimeError describing each failure.
+
+    tasks: every render task, in join order
+    tasks_to_run: tasks that were attempted
+    failures: list of (task, exception) tuples
+    """
+
+    if len(failures) > 0:
+
+        # Nuke partial outputs left behind by crashed workers
+        for task, e in failures:
+            partial_file = _partial_file(task["output_file"])
+            if os.path.isfile(partial_file):
+                os.remove(partial_file)
+
+        failures.sort(key=lambda x: tasks.index(x[0]))
+
+        err = "{} of {} segment renders failed:\n".format(len(failures),len(tasks_to_run))
+        for task, e in failures:
+            err += "    {} ({}): {}\n".format(task["name"],task["output_file"],
+                                              repr(e))
+        raise RuntimeError(err)
+
+
+# Output kwargs that change how ffmpeg runs but not the clip it writes.  They
+# are left out of clip names, so changing them does not invalidate clips.
+_UNHASHED_KWARGS = ["threads"]
+
+
+def _task_key(**kwargs):
+    """
+    Hash of everything that determines the contents of a rendered clip.
+    """
+
+    encoded = json.dumps(kwargs,sort_keys=True).encode()
+
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _clip_manifest_file(work_dir,output_file):
+    """
+    Manifest in work_dir listing the clips used by the render of output_file.
+    """
+
+    key = _task_key(output_file=os.path.abspath(output_file))[:16]
+
+    return os.path.join(work_dir,"{}.clips.json".format(key))
+
+
+def _read_clip_manifest(manifest_file):
+    """
+    Return the set of clip names in a clip manifest (empty if there is none).
+    """
+
+    try:
+        with open(manifest_file) as f:
+            return set(json.load(f)["clips"])
+    except (FileNotFoundError,ValueError,KeyError):
+        return set()
+
+
+def _write_clip_manifest(manifest_file,output_file,clips):
+    """
+    Write a clip manifest recording that the render of output_file uses clips
+    (names of files in the manifest's directory).
+    """
+
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(manifest_file),
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd,"w") as f:
+            json.dump({"output_file":os.path.abspath(output_file),
+                       "clips":sorted(clips)},f)
+        os.replace(tmp_file,manifest_file)
+    finally:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+
+
+def _build_render_tasks(video_file,segments,fade_length,video_props,work_dir,
+                        cut_mode="copy",blank_cache=None):
+    """
+    Build the list of clips to render for the temp-file path, in the order
+    they will be joined.  Each task is a dictionary with keys:
+
+        name: human readable description (e.g. "segment 003 slice")
+        segment: index of the segment the clip belongs to
+        kind: key into _RENDER_FUNCTIONS
+        input_file: source video
+        output_file: clip to write
+        args: remaining arguments for the render function
+
+    Clips are named by a hash of the source identity (path, size, mtime), the
+    times, fade length and output kwargs that define them (less those in
+    _UNHASHED_KWARGS), so a clip left in work_dir by an earlier run with the
+    same inputs is reused rather than rendered again.
+
+    video_file: input video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    work_dir: directory in which to write clips
+    cut_mode: "copy" or "smart" (see _slice_out)
+    blank_cache: BlankClipCache from which to take gap clips (or None)
     """
 
-    video_props = _get_video_properties(input_file)
+    # Build keyframe index once for the whole source
+    if cut_mode == "smart":
+        keyframes = _get_keyframe_times(video_file)
+    else:
+        keyframes = None
+
+    source = _file_key(video_file)
+    out_kwargs = dict([(k,v) for k, v in video_props["out_kwargs"].items()
+                       if k not in _UNHASHED_KWARGS])
+
+    tasks = []
+    for i, segment in enumerate(segments):
+
+        # Create initial fade in (start - fade_length) -> start
+        key = _task_key(kind="fade-in",source=source,stop=segment["start"],
+                        fade_length=fade_length,out_kwargs=out_kwargs)
+        tasks.append({"name":"segment {:03} fade-in".format(i),
+                      "segment":i,
+                      "kind":"fade-in",
+                      "input_file":video_file,
+                      "output_file":os.path.join(work_dir,"{}.mp4".format(key)),
+                      "args":(segment["start"],fade_length,video_props)})
+
+        # Chop out video chunk from start -> stop
+        key = _task_key(kind="slice",source=source,start=segment["start"],
+                        stop=segment["stop"],cut_mode=cut_mode,
+                        out_kwargs=out_kwargs)
+        tasks.append({"name":"segment {:03} slice".format(i),
+                      "segment":i,
+                      "kind":"slice",
+                      "input_file":video_file,
+                      "output_file":os.path.join(work_dir,"{}.mp4".format(key)),
+                      "args":(segment["start"],segment["stop"],video_props,
+                              keyframes)})
 
-    out_kwargs = video_props["out_kwargs"]
+        # Generate fade out (stop -> stop + fade_length)
+        key = _task_key(kind="fade-out",source=source,start=segment["stop"],
+                        fade_length=fade_length,out_kwargs=out_kwargs)
+        tasks.append({"name":"segment {:03} fade-out".format(i),
+                      "segment":i,
+                      "kind":"fade-out",
+                      "input_file":video_file,
+                      "output_file":os.path.join(work_dir,"{}.mp4".format(key)),
+                      "args":(segment["stop"],fade_length,video_props)})
+
+        # Generate a black screen for gap_after if requested
+        if segment["gap"] > 0:
+            key = _task_key(kind="gap",source=source,length=segment["gap"],
+                            out_kwargs=out_kwargs)
+            tasks.append({"name":"segment {:03} gap".format(i),
+                          "segment":i,
+                          "kind":"gap",
+                          "input_file":video_file,
+                          "output_file":os.path.join(work_dir,"{}.mp4".format(key)),
+                          "args":(segment["gap"],video_props,blank_cache)})
+
+    return tasks
+
+
+def _render_temp_files(video_file,output_file,segments,fade_length,video_props,
+                       work_dir,jobs=1,cut_mode="copy",blank_cache=None,
+                       executor="process",extras=None,context=None):
+    """
+    Render segments by writing the fade-in, slice, fade-out and gap for each
+    segment to its own file in work_dir, then joining all of them. Clips
+    already in work_dir from an earlier run with the same inputs are reused.
+    The clips of each output_file are recorded in a manifest in work_dir;
+    clips an earlier render of output_file used that neither this render nor
+    any other output's manifest uses are removed, so several renders can
+    share one work_dir.
+
+    video_file: input video file
+    output_file: output video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    work_dir: directory in which to write clips
+    jobs: number of segment renders to run at once
+    cut_mode: "copy" stream copies each chunk (cuts snap to keyframes); "smart"
+              re-encodes only the partial groups of pictures at each cut.
+    blank_cache: BlankClipCache from which to take gap clips. If None, encode
+                 each gap from scratch.
+    executor: how to run clips at once ("process" or "asyncio"; see
+              _run_render_tasks)
+    extras: renditions, sprite and chapters to make in the join (see
+            _copy_join_outputs). if None, only join.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    tasks = _build_render_tasks(video_file,segments,fade_length,video_props,
+                                work_dir,cut_mode,blank_cache)
+
+    clips = set([t["output_file"] for t in tasks])
+
+    # Record the clips before rendering, so other renders sharing work_dir
+    # leave them (including those still being written) alone.
+    manifest_file = _clip_manifest_file(work_dir,output_file)
+    previous_clips = _read_clip_manifest(manifest_file)
+    _write_clip_manifest(manifest_file,output_file,
+                         [os.path.basename(c) for c in clips])
+
+    num_new = len(_tasks_to_run(tasks))
+    logger.info("rendering {} of {} clips ({} reused from {})".format(num_new,
+                                                                   len(clips),
+                                                                   len(clips) - num_new,
+                                                                   work_dir))
+
+    _run_render_tasks(tasks,jobs,executor,context)
+
+    # Remove clips left over from earlier versions of this output's plan.
+    # Only clips an earlier render of this output recorded are candidates,
+    # and any clip another output's manifest lists is kept.
+    in_use = set([os.path.basename(c) for c in clips])
+    for other_file in glob.glob(os.path.join(work_dir,"*.clips.json")):
+        if other_file != manifest_file:
+            in_use |= _read_clip_manifest(other_file)
+    for name in previous_clips - in_use:
+        clip_file = os.path.join(work_dir,os.path.basename(name))
+        if os.path.isfile(clip_file):
+            os.remove(clip_file)
+
+    # Combine all clips into the final movie
+    _join_clips([t["output_file"] for t in tasks],output_file,video_props,
+                extras,context)
+
+
+def _unblock_fifo(fifo):
+    """
+    Let a process blocked opening fifo for writing proceed (and then fail with
+    a broken pipe) by briefly opening the read end.
+    """
+
+    try:
+        fd = os.open(fifo,os.O_RDONLY | os.O_NONBLOCK)
+        os.close(fd)
+    except OSError:
+        pass
+
+
+def _render_pipes(video_file,output_file,segments,fade_length,video_props,
+                  work_dir,cut_mode="copy",extras=None,context=None):
+    """
+    Render the same clips as _render_temp_files, but stream each one as
+    MPEG-TS through a named pipe (FIFO) into a single joining ffmpeg process
+    reading them with the concat demuxer.  The joiner copies the streams into
+    output_file, so no clip is ever written to disk and each frame is encoded
+    at most once.  Clips are produced one after another in join order; the
+    next producer is started early so it is waiting when the joiner reaches
+    its pipe.  Requires a POSIX system.
+
+    The clips cannot be checked before the joiner copies them, so the fades
+    and gaps are encoded with the source's encoder parameters (see
+    _matched_encoder_kwargs) to keep them compatible with the stream copied
+    slices.  If those cannot be matched, fall back to _render_temp_files,
+    whose join checks every clip and re-encodes if they differ.
+
+    video_file: input video file
+    output_file: output video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    work_dir: directory in which to create the pipes
+    cut_mode: "copy" stream copies each chunk (cuts snap to keyframes); "smart"
+              re-encodes only the partial groups of pictures at each cut.
+    extras: renditions, sprite and chapters for the joiner to make (see
+            _copy_join_outputs). if None, only join.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    if context is None:
+        context = _RenderContext()
+
+    if not hasattr(os,"mkfifo"):
+        err = "pipe render mode requires named pipes (os.mkfifo), which are not available on this system\n"
+        raise RuntimeError(err)
+
+    matched_kwargs = _matched_encoder_kwargs(video_file,video_props,np.zeros(0))
+    if matched_kwargs is None:
+        logger.info("cannot match the source encoder for streamed clips; rendering through temporary files instead")
+        _render_temp_files(video_file,output_file,segments,fade_length,
+                           video_props,work_dir,cut_mode=cut_mode,
+                           extras=extras,context=context)
+        return
+
+    # MPEG-TS always uses a 90 kHz time base (and has no such option)
+    matched_kwargs.pop("video_track_timescale")
+    pipe_props = dict(video_props)
+    pipe_props["out_kwargs"] = matched_kwargs
+
+    tasks = _build_render_tasks(video_file,segments,fade_length,pipe_props,
+                                work_dir,cut_mode)
+
+    fifo_dir = tempfile.mkdtemp(prefix="pipes_",dir=work_dir)
+    try:
+
+        # One pipe per clip, listed in join order for the concat demuxer
+        fifos = []
+        list_file = os.path.join(fifo_dir,"concat.txt")
+        with open(list_file,"w") as f:
+            for i in range(len(tasks)):
+                fifos.append(os.path.abspath(os.path.join(fifo_dir,"{:05}.ts".format(i))))
+                os.mkfifo(fifos[-1])
+                f.write("file '{}'\n".format(fifos[-1].replace("'","'\\''")))
+
+        length = sum([s["stop"] - s["start"] + 2*fade_length + s["gap"]
+                      for s in segments])
+        source = ffmpeg.input(list_file,**{"f":"concat","safe":0})
+        joiner = _FFmpegRun(
+            ffmpeg.merge_outputs(*_copy_join_outputs(source,output_file,length,
+                                                     video_props,extras)),
+            "join (pipe)",length,context=context
+        )
+
+        def _produce(task,fifo):
+            _RENDER_FUNCTIONS[task["kind"]](task["input_file"],fifo,*task["args"],
+                                            context=context)
+
+        failure = None
+        joiner_died = False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+
+            futures = [pool.submit(_produce,t,f) for t, f in zip(tasks,fifos)]
+            for i, future in enumerate(futures):
+
+                # Watch the joiner while waiting; if it exits early, nothing
+                # will ever read the remaining pipes.
+                while not future.done() and joiner.process.poll() is None:
+                    concurrent.futures.wait([future],timeout=0.5)
+                if not future.done():
+                    joiner_died = True
+                    break
+
+                try:
+                    future.result()
+                except Exception as e:
+                    failure = (tasks[i],e)
+                    break
+
+            # Tear down: stop the joiner, drop queued producers and unblock any
+            # producer waiting for the joiner to open its pipe.
+            if failure is not None or joiner_died:
+                joiner.kill()
+                for future in futures:
+                    future.cancel()
+                while not all([future.done() for future in futures]):
+                    for fifo in fifos:
+                        _unblock_fifo(fifo)
+                    time.sleep(0.1)
+
+        join_error = None
+        try:
+            joiner.wait()
+        except ffmpeg.Error as e:
+            join_error = e
+
+        if failure is not None:
+            task, e = failure
+            err = "streaming {} failed: {}\n".format(task["name"],repr(e))
+            raise RuntimeError(err)
+
+        if join_error is not None or joiner_died:
+            err = "joining streamed clips failed (ffmpeg returned {})\n".format(joiner.process.returncode)
+            raise RuntimeError(err)
+
+    finally:
+        shutil.rmtree(fifo_dir)
+
+
+def _task_to_json(task):
+    """
+    Serialize a render task (see _build_render_tasks) to json so it can be
+    queued for another process or host.  Paths are made absolute, numpy arrays
+    become lists and a BlankClipCache is replaced by its settings.
+    """
+
+    def _encode(value):
+        if isinstance(value,BlankClipCache):
+            return {"__blank_cache__":{"cache_dir":os.path.abspath(value.cache_dir),
+                                       "max_bytes":value.max_bytes}}
+        if isinstance(value,np.ndarray):
+            return {"__array__":value.tolist()}
+        if isinstance(value,np.generic):
+            return value.item()
+        if isinstance(value,dict):
+            return dict([(k,_encode(v)) for k, v in value.items()])
+        if isinstance(value,(list,tuple)):
+            return [_encode(v) for v in value]
+        return value
+
+    out = _encode(task)
+    out["input_file"] = os.path.abspath(task["input_file"])
+    out["output_file"] = os.path.abspath(task["output_file"])
+
+    return json.dumps(out,sort_keys=True)
+
+
+def _task_from_json(spec):
+    """
+    Rebuild a render task serialized by _task_to_json.
+    """
+
+    def _decode(value):
+        if isinstance(value,dict):
+            if "__blank_cache__" in value:
+                return BlankClipCache(**value["__blank_cache__"])
+            if "__array__" in value:
+                return np.array(value["__array__"],dtype=float)
+            return dict([(k,_decode(v)) for k, v in value.items()])
+        if isinstance(value,list):
+            return [_decode(v) for v in value]
+        return value
+
+    task = _decode(json.loads(spec))
+    task["args"] = tuple(task["args"])
+
+    return task
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of render tasks shared by a coordinator and any number
+    of worker processes (see run_worker), on one host or on several hosts that
+    share storage.  Tasks are grouped by job; each is pending, running, done or
+    failed.  A worker claims a task by taking a lease on it.  If the worker
+    dies, the lease expires and the task is handed out again.  Failed tasks are
+    retried until they have been attempted max_attempts times.
+
+    SQLite relies on file locking, so on network filesystems the queue file
+    should live on storage with working locks (NFSv4, SMB, local disk).
+
+    queue_file: sqlite database file (created if needed)
+    max_attempts: times a task is attempted before it is marked failed
+    """
+
+    def __init__(self,queue_file,max_attempts=3):
+
+        self.queue_file = queue_file
+        self.max_attempts = max_attempts
+
+        with self._transaction() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+                              id INTEGER PRIMARY KEY,
+                              job TEXT NOT NULL,
+                              position INTEGER NOT NULL,
+                              name TEXT NOT NULL,
+                              output_file TEXT NOT NULL,
+                              spec TEXT NOT NULL,
+                              status TEXT NOT NULL DEFAULT 'pending',
+                              worker TEXT,
+                              attempts INTEGER NOT NULL DEFAULT 0,
+                              lease_expires REAL,
+                              error TEXT,
+                              UNIQUE(job,output_file))""")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Connection holding the write lock for the duration of the block.
+        """
+
+        db = sqlite3.connect(self.queue_file,timeout=60,isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def add(self,job,tasks):
+        """
+        Queue tasks under job.  Tasks whose output already exists are queued
+        as done.  Tasks already queued for the job are left alone (so a
+        coordinator can be restarted), except that failed tasks and tasks
+        whose worker's lease has expired get a fresh set of attempts.
+        """
+
+        now = time.time()
+        with self._transaction() as db:
+            for i, task in enumerate(tasks):
+                if os.path.isfile(task["output_file"]):
+                    status = "done"
+                else:
+                    status = "pending"
+                output_file = os.path.abspath(task["output_file"])
+                db.execute("INSERT OR IGNORE INTO tasks (job,position,name,output_file,spec,status) VALUES (?,?,?,?,?,?)",
+                           (job,i,task["name"],output_file,
+                            _task_to_json(task),status))
+                db.execute("""UPDATE tasks SET status = ?, worker = NULL,
+                              attempts = 0, lease_expires = NULL, error = NULL
+                              WHERE job = ? AND output_file = ?
+                              AND (status = 'failed' OR (status = 'running' AND lease_expires < ?))""",
+                           (status,job,output_file,now))
+
+    def claim(self,worker,job=None,lease=600):
+        """
+        Claim the next pending task (or one whose lease expired).  Returns
+        (task_id, task) or None if there is nothing to do.
+
+        worker: name of the claiming worker
+        job: only claim tasks from this job. if None, any job.
+        lease: seconds the worker has to finish (or renew) the task
+        """
+
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+
+                row = db.execute("""SELECT id, spec, status, attempts FROM tasks
+                                    WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?))
+                                    AND (? IS NULL OR job = ?)
+                                    ORDER BY job, position LIMIT 1""",
+                                 (now,job,job)).fetchone()
+                if row is None:
+                    return None
+
+                task_id, spec, status, attempts = row
+
+                # A worker died holding this task too many times
+                if status == "running" and attempts >= self.max_attempts:
+                    db.execute("UPDATE tasks SET status = 'failed', error = ? WHERE id = ?",
+                               ("lease expired {} times".format(attempts),task_id))
+                    continue
+
+                db.execute("""UPDATE tasks SET status = 'running', worker = ?,
+                              attempts = attempts + 1, lease_expires = ?
+                              WHERE id = ?""",(worker,now + lease,task_id))
+
+                return task_id, _task_from_json(spec)
+
+    def renew(self,task_id,worker,lease=600):
+        """
+        Extend the lease on a running task.
+        """
+
+        with self._transaction() as db:
+            db.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                       (time.time() + lease,task_id,worker))
+
+    def complete(self,task_id,worker):
+        """
+        Mark a task claimed by worker as done.
+        """
+
+        with self._transaction() as db:
+            db.execute("UPDATE tasks SET status = 'done', lease_expires = NULL, error = NULL WHERE id = ? AND worker = ?",
+                       (task_id,worker))
+
+    def fail(self,task_id,error,worker=None):
+        """
+        Record a failed attempt at a task.  The task goes back in the queue
+        unless it has been attempted max_attempts times.
+
+        task_id: task that failed
+        error: description of the failure
+        worker: if not None, only record the failure if worker holds the task
+        """
+
+        with self._transaction() as db:
+            db.execute("""UPDATE tasks SET
+                          status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+                          lease_expires = NULL, error = ?
+                          WHERE id = ? AND (? IS NULL OR worker = ?)""",
+                       (self.max_attempts,error,task_id,worker,worker))
+
+    def counts(self,job=None):
+        """
+        Dictionary of the number of tasks with each status.
+        """
+
+        with self._transaction() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM tasks WHERE (? IS NULL OR job = ?) GROUP BY status",
+                              (job,job)).fetchall()
+
+        return dict(rows)
+
+    def tasks(self,job,status=None):
+        """
+        List of (task_id, task, status, error) for a job, in join order.
+        """
+
+        with self._transaction() as db:
+            rows = db.execute("""SELECT id, spec, status, error FROM tasks
+                                 WHERE job = ? AND (? IS NULL OR status = ?)
+                                 ORDER BY position""",
+                              (job,status,status)).fetchall()
+
+        return [(r[0],_task_from_json(r[1]),r[2],r[3]) for r in rows]
+
+
+def run_worker(queue_file,job=None,worker=None,poll=5.0,lease=600.0,
+               keep_running=False,timeout=None):
+    """
+    Render tasks from a WorkQueue until no work is left.  Safe to run many at
+    once, on one or several hosts.
+
+    queue_file: sqlite work queue file
+    job: only render tasks from this job. if None, any job.
+    worker: name of this worker. if None, use host:pid.
+    poll: seconds to wait between checks when the queue has no pending work
+    lease: seconds a claimed task is reserved for this worker. the lease is
+           renewed while the task renders, so it only runs out if the worker
+           dies.
+    keep_running: keep polling for new work when the queue is empty.
+    timeout: kill any ffmpeg process that produces no output for this many
+             seconds and fail the task. if None, wait forever.
+
+    Returns the number of tasks rendered.
+    """
+
+    context = _RenderContext(stall_timeout=timeout)
+
+    queue = WorkQueue(queue_file)
+    if worker is None:
+        worker = "{}:{}".format(socket.gethostname(),os.getpid())
+
+    num_rendered = 0
+    while True:
+
+        claimed = queue.claim(worker,job,lease)
+        if claimed is None:
+
+            # Wait while other workers' tasks could still fail and come back
+            counts = queue.counts(job)
+            if not keep_running and counts.get("pending",0) == 0 and \
+               counts.get("running",0) == 0:
+                break
+            time.sleep(poll)
+            continue
+
+        task_id, task = claimed
+        logger.info("{}: rendering {}".format(worker,task["name"]))
+
+        # Keep the lease alive while rendering
+        stop_renewing = threading.Event()
+        def _renew():
+            while not stop_renewing.wait(lease/3):
+                queue.renew(task_id,worker,lease)
+        renewer = threading.Thread(target=_renew,daemon=True)
+        renewer.start()
+
+        try:
+            _run_render_task(task,context.child())
+        except Exception as e:
+            logger.info("{}: {} failed: {}".format(worker,task["name"],repr(e)))
+            queue.fail(task_id,repr(e),worker)
+        else:
+            queue.complete(task_id,worker)
+            num_rendered += 1
+        finally:
+            stop_renewing.set()
+            renewer.join()
+
+    return num_rendered
+
+
+def _verify_clip(clip_file):
+    """
+    Check that a rendered clip exists and holds video and audio.  Returns a
+    description of the problem or None if the clip looks good.
+    """
+
+    if not os.path.isfile(clip_file) or os.path.getsize(clip_file) == 0:
+        return "{} is missing or empty".format(clip_file)
+
+    try:
+        probe = _probe(clip_file)
+    except ffmpeg.Error as e:
+        return "{} could not be read: {}".format(clip_file,e.stderr.decode(errors="replace").strip()[-200:])
+
+    codec_types = set([stream.get("codec_type") for stream in probe["streams"]])
+    if "video" not in codec_types or "audio" not in codec_types:
+        return "{} does not have both video and audio".format(clip_file)
+
+    try:
+        if float(probe["format"]["duration"]) <= 0:
+            return "{} has no duration".format(clip_file)
+    except (KeyError,ValueError):
+        return "{} has no duration".format(clip_file)
+
+    return None
+
+
+def _render_queue(video_file,output_file,segments,fade_length,video_props,
+                  work_dir,queue_file,cut_mode="copy",blank_cache=None,
+                  local_workers=1,poll=2.0,timeout=None,extras=None,
+                  context=None):
+    """
+    Render segments through a WorkQueue.  Every clip of the temp-file render
+    is queued as an independent task.  This process starts local_workers
+    workers (more can be started with 'chop_video.py worker queue_file' on any
+    host sharing work_dir), checks each clip as it is finished (requeueing bad
+    ones) and joins them when all are done.
+
+    video_file: input video file
+    output_file: output video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    work_dir: directory in which workers write clips (shared storage)
+    queue_file: sqlite work queue file (shared storage)
+    cut_mode: "copy" or "smart" (see _slice_out)
+    blank_cache: BlankClipCache from which to take gap clips (or None)
+    local_workers: number of worker processes to start on this host
+    poll: seconds between checks of the queue
+    timeout: stall timeout (seconds) passed to the local workers. if None,
+             wait forever.
+    extras: renditions, sprite and chapters to make in the join (see
+            _copy_join_outputs). if None, only join.
+    context: _RenderContext for the joining ffmpeg run. if None, use a new
+             one.
+    """
+
+    tasks = _build_render_tasks(video_file,segments,fade_length,video_props,
+                                work_dir,cut_mode,blank_cache)
+
+    queue = WorkQueue(queue_file)
+    job = _task_key(output_file=os.path.abspath(output_file),
+                    clips=[os.path.abspath(t["output_file"]) for t in tasks])[:16]
+    queue.add(job,tasks)
+
+    worker_args = [sys.executable,os.path.abspath(__file__),"worker",
+                   queue_file,"--job",job]
+    if timeout is not None:
+        worker_args.extend(["--timeout",str(timeout)])
+    logger.info("queued {} clips as job {} in {} (add workers with: {})".format(len(tasks),job,
+                                                                               queue_file,
+                                                                               " ".join(worker_args[1:])))
+
+    workers = []
+    verified = set()
+    try:
+        while True:
+
+            # Check clips as they finish; bad ones go back in the queue
+            for task_id, task, _, _ in queue.tasks(job,status="done"):
+                if task_id in verified:
+                    continue
+                problem = _verify_clip(task["output_file"])
+                if problem is None:
+                    verified.add(task_id)
+                    continue
+                logger.info("requeueing {}: {}".format(task["name"],problem))
+                if os.path.isfile(task["output_file"]):
+                    os.remove(task["output_file"])
+                queue.fail(task_id,problem)
+
+            counts = queue.counts(job)
+            remaining = counts.get("pending",0) + counts.get("running",0)
+            if remaining == 0:
+                break
+
+            # Keep local_workers alive while there is work for them
+            workers = [w for w in workers if w.poll() is None]
+            pending = counts.get("pending",0)
+            while len(workers) < local_workers and pending > 0:
+                workers.append(subprocess.Popen(worker_args))
+                pending -= 1
+
+            logger.info("job {}: {} of {} clips done".format(job,len(verified),
+                                                             sum(counts.values())))
+            time.sleep(poll)
+
+    finally:
+        for w in workers:
+            if w.poll() is None:
+                w.terminate()
+                w.wait()
+
+    failed = [t for t in queue.tasks(job) if t[2] == "failed"]
+    if len(failed) > 0:
+        err = "{} of {} clips failed:\n".format(len(failed),len(tasks))
+        for _, task, _, error in failed:
+            err += "    {} ({}): {}\n".format(task["name"],task["output_file"],error)
+        raise RuntimeError(err)
+
+    _join_clips([t["output_file"] for t in tasks],output_file,video_props,
+                extras,context)
+
+
+def _stream_signature(input_file):
+    """
+    Return a dictionary of the properties of the first video and audio streams
+    of input_file that must match for clips to be joined by stream copying.
+    """
+
+    signature = {}
+    for stream in _probe(input_file)["streams"]:
+
+        codec_type = stream.get("codec_type")
+        if codec_type == "video" and "video codec" not in signature:
+            signature["video codec"] = stream.get("codec_name")
+            signature["video profile"] = stream.get("profile")
+            signature["video level"] = stream.get("level")
+            signature["video time_base"] = stream.get("time_base")
+            signature["video extradata"] = stream.get("extradata_hash")
+            signature["resolution"] = "{}x{}".format(stream.get("width"),
+                                                     stream.get("height"))
+            signature["pix_fmt"] = stream.get("pix_fmt")
+            signature["frame rate"] = stream.get("avg_frame_rate")
+        elif codec_type == "audio" and "audio codec" not in signature:
+            signature["audio codec"] = stream.get("codec_name")
+            signature["sample rate"] = stream.get("sample_rate")
+            signature["channel layout"] = stream.get("channel_layout")
+            signature["audio time_base"] = stream.get("time_base")
+            signature["audio extradata"] = stream.get("extradata_hash")
+
+    return signature
+
+
+def _join_clips(file_list,output_file,video_props,extras=None,context=None):
+    """
+    Join clips into output_file.  If every clip has the same codecs, resolution,
+    pixel format, frame rate and audio format as the source, and the same
+    profile, level, time base and codec extradata (e.g. the H.264 SPS/PPS) as
+    each other, join them with the concat demuxer and copy the streams (no
+    re-encode).  Otherwise, decode all clips and re-encode them through the
+    concat filter.  Logs which path was taken and why.  Either way, the
+    renditions, sprite and chapters in extras are made in the same run from
+    the joined streams.
+
+    file_list: list of clips to join, in order
+    output_file: output video file
+    video_props: output of _get_video_properties for the source video
+    extras: renditions, sprite and chapters to make (see _copy_join_outputs).
+            if None, only join.
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    expected = {"video codec":video_props["video_codec"],
+                "resolution":"{}x{}".format(video_props["width"],
+                                            video_props["height"]),
+                "pix_fmt":video_props["pix_fmt"],
+                "audio codec":video_props["audio_codec"],
+                "sample rate":video_props["sample_rate"],
+                "channel layout":video_props["channel_layout"]}
+
+    # Look for a clip that does not match the source or the first clip
+    reason = None
+    first_signature = None
+    for f in file_list:
+
+        signature = _stream_signature(f)
+
+        for k in expected:
+            if signature.get(k) != expected[k]:
+                reason = "{} has {} '{}' (source has '{}')".format(f,k,
+                                                                   signature.get(k),
+                                                                   expected[k])
+                break
+
+        if reason is None:
+            if first_signature is None:
+                first_signature = signature
+            else:
+                for k in first_signature:
+                    if signature[k] != first_signature[k]:
+                        reason = "{} has {} '{}' ({} has '{}')".format(f,k,
+                                                                       signature[k],
+                                                                       file_list[0],
+                                                                       first_signature[k])
+                        break
+
+        if reason is not None:
+            break
+
+    length = sum([float(_probe(f)["format"]["duration"]) for f in file_list])
+
+    if reason is None:
+        logger.info("joining {} clips with concat demuxer (stream copy): all clips match the source codecs and format".format(len(file_list)))
+        _concat_copy(file_list,output_file,length,context,video_props,extras)
+        return
+
+    logger.info("joining {} clips with concat filter (re-encode): {}".format(len(file_list),reason))
+
+    inputs = []
+    streams = []
+    for f in file_list:
+        inputs.append(ffmpeg.input(f))
+        streams.append(inputs[-1].video)
+        streams.append(inputs[-1].audio)
+
+    joined = ffmpeg.concat(*streams,v=1,a=1).node
+
+    # Render final movie, splitting the joined streams for any extras.
+    if extras is None:
+        nodes = [ffmpeg.output(joined[0],joined[1],output_file,
+                               **video_props["out_kwargs"])]
+    else:
+        nodes = _ladder_outputs(joined[0],joined[1],output_file,
+                                extras["renditions"],extras["rendition_outputs"],
+                                video_props,extras["package"],extras["meta_file"],
+                                extras["sprite_file"],extras["sprite_interval"],
+                                length)
+    _run_ffmpeg(ffmpeg.merge_outputs(*nodes),"join (re-encode)",length,context)
+
+
+def _build_filtergraph(video_file,segments,fade_length,video_props,
+                       preview=False):
+    """
+    Build a single ffmpeg filter graph that cuts every segment out of the
+    source, fades it in and out, inserts black/silent gaps and concatenates
+    the result. Returns the joined (video, audio) node.
+
+    video_file: input video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    preview: scale segments to video_props width/height and burn the source
+             time into each frame (see _preview_properties).
+    """
+
+    if preview:
+        # Skipping the deblocking filter speeds up decoding a lot and is
+        # invisible at preview resolution.
+        source = ffmpeg.input(video_file,skip_loop_filter="all")
+    else:
+        source = ffmpeg.input(video_file)
+
+    streams = []
+    for segment in segments:
+
+        # Content runs from (start - fade_length) -> (stop + fade_length),
+        # just like fade-in + slice + fade-out in the temp-file path.
+        start_sec = segment["start"] - fade_length
+        stop_sec = segment["stop"] + fade_length
+        chunk_duration = stop_sec - start_sec
+
+        video = (
+            source.video
+            .trim(start=start_sec,end=stop_sec)
+            .setpts("PTS-STARTPTS")
+        )
+
+        if preview:
+            video = (
+                video
+                .filter("scale",video_props["width"],video_props["height"])
+                .drawtext(text="%{{pts:hms:{}}}".format(start_sec),
+                          x=8,y=8,fontsize=24,fontcolor="white",
+                          box=1,boxcolor="black@0.6",boxborderw=4,
+                          escape_text=False)
+            )
+
+        video = (
+            video
+            .filter("fade",type="in",start_time=0,duration=fade_length)
+            .filter("fade",type="out",
+                    start_time=chunk_duration - fade_length,
+                    duration=fade_length)
+        )
+
+        audio = (
+            source.audio
+            .filter("atrim",start=start_sec,end=stop_sec)
+            .filter("asetpts","PTS-STARTPTS")
+        )
+
+        streams.append(video)
+        streams.append(audio)
+
+        # Black screen and silence for the gap, if requested
+        gap_sec = segment["gap"]
+        if gap_sec > 0:
+
+            video = ffmpeg.input("color=c=black:s={}x{}:r={}".format(video_props['width'],
+                                                                     video_props['height'],
+                                                                     video_props['frame_rate']),
+                                 **{"t":gap_sec,"f":"lavfi"})
+
+            audio = ffmpeg.input("anullsrc=channel_layout={}:sample_rate={}".format(video_props['channel_layout'],
+                                                                                      video_props['sample_rate']),
+                                 **{"t":gap_sec,"f":"lavfi"})
+
+            streams.append(video.video)
+            streams.append(audio.audio)
+
+    return ffmpeg.concat(*streams,v=1,a=1).node
+
+
+def _preview_properties(video_props,height=_PREVIEW_HEIGHT):
+    """
+    Return a copy of video_props for a preview render: scaled down to height
+    (never up) with ultrafast, low quality encoder settings.  The frame rate is
+    unchanged, so the preview has exactly the same frames and timing as the
+    full render.
+
+    video_props: output of _get_video_properties
+    height: preview height in pixels
+    """
+
+    preview_props = copy.deepcopy(video_props)
+
+    height = min(height,video_props["height"])
+    height = height - (height % 2)
+    width = int(round(video_props["width"]*height/video_props["height"]/2))*2
+
+    preview_props["width"] = width
+    preview_props["height"] = height
+    preview_props["out_kwargs"].update(_PREVIEW_OUT_KWARGS)
+
+    return preview_props
+
+
+def _load_renditions(renditions):
+    """
+    Normalize a rendition ladder.  Each rendition is a dictionary with a
+    "name", an output "height" (width follows the aspect ratio) and optional
+    "out_kwargs" (ffmpeg output options such as "c:v", "b:v", "crf" or
+    "preset") that override the options used for the main output.
+
+    renditions: list of rendition dictionaries or heights, a json file holding
+                such a list, or a comma-separated string of heights
+                (e.g. "1080,720,480").
+    """
+
+    if isinstance(renditions,str):
+        if os.path.isfile(renditions):
+            with open(renditions) as f:
+                renditions = json.load(f)
+        else:
+            renditions = renditions.split(",")
+
+    out = []
+    for r in renditions:
+
+        if not isinstance(r,dict):
+            r = {"height":r}
+
+        try:
+            height = int(r["height"])
+        except (KeyError,TypeError,ValueError):
+            err = "rendition '{}' must have an integer height\n".format(r)
+            raise ValueError(err)
+
+        if height <= 0:
+            err = "rendition height must be positive ({})\n".format(height)
+            raise ValueError(err)
+
+        out.append({"name":str(r.get("name","{}p".format(height))),
+                    "height":height,
+                    "out_kwargs":dict(r.get("out_kwargs",{}))})
+
+    names = [r["name"] for r in out]
+    if len(set(names)) != len(names):
+        err = "rendition names must be unique ({})\n".format(",".join(names))
+        raise ValueError(err)
+
+    return out
+
+
+def _rendition_files(output_file,renditions,package=None):
+    """
+    Work out where each rendition is written.
+
+    output_file: main output video file
+    renditions: output of _load_renditions
+    package: None (one video file per rendition), "hls" or "dash"
+
+    Returns (targets, outputs).  targets is a list of (partial, final) paths
+    that are renamed into place after a successful render.  outputs holds the
+    path ffmpeg writes for each rendition (for "dash", the one manifest).
+    """
+
+    root, ext = os.path.splitext(output_file)
+
+    if package is None:
+        finals = ["{}.{}{}".format(root,r["name"],ext) for r in renditions]
+        targets = [(_partial_file(f),f) for f in finals]
+        outputs = [t[0] for t in targets]
+        return targets, outputs
+
+    final_dir = "{}.{}".format(root,package)
+    partial_dir = "{}.partial".format(final_dir)
+    if package == "hls":
+        outputs = [os.path.join(partial_dir,r["name"],"index.m3u8")
+                   for r in renditions]
+    else:
+        outputs = [os.path.join(partial_dir,"manifest.mpd")]
+
+    return [(partial_dir,final_dir)], outputs
+
+
+def _stream_kwargs(kwargs,index):
+    """
+    Restrict ffmpeg output options to video stream index of a multi-stream
+    output ("c:v" -> "c:v:1", "crf" -> "crf:v:1").  Audio options ("c:a",
+    "b:a") are shared by every rendition and passed through unchanged.
+    """
+
+    out = {}
+    for key, value in kwargs.items():
+        parts = key.split(":")
+        if len(parts) > 1 and parts[1] == "a":
+            out[key] = value
+        else:
+            out["{}:v:{}".format(parts[0],index)] = value
+
+    return out
+
+
+def _split(stream,filter_name,num_outputs):
+    """
+    Split stream into num_outputs copies with the split (video) or asplit
+    (audio) filter.  Returns a list of streams.
+    """
+
+    if num_outputs == 0:
+        return []
+    if num_outputs == 1:
+        return [stream]
+
+    node = stream.filter_multi_output(filter_name,num_outputs)
+
+    return [node[i] for i in range(num_outputs)]
+
+
+def _chapter_output(video,audio,output_file,out_kwargs,meta_file,
+                    other_nodes=()):
+    """
+    Output node writing video and audio to output_file with the chapters in an
+    ffmetadata file.  -map_chapters needs the number of the metadata input,
+    which ffmpeg-python only assigns when it compiles the command, so compile
+    once to find it.  The node must be run as the first output of
+    ffmpeg.merge_outputs(node,*other_nodes).
+
+    video, audio: ffmpeg-python streams to write
+    output_file: file to write
+    out_kwargs: ffmpeg output options
+    meta_file: ffmetadata file holding the chapters (see _write_ffmetadata)
+    other_nodes: the other outputs run in the same ffmpeg command
+    """
+
+    # "d?" maps the (nonexistent) data streams of the metadata input only if
+    # present, which pulls the input into the command without adding a stream.
+    meta = ffmpeg.input(meta_file,f="ffmetadata")
+
+    def _output(index):
+        kwargs = dict(out_kwargs)
+        kwargs["map_chapters"] = index
+        return ffmpeg.output(video,audio,meta["d?"],output_file,**kwargs)
+
+    args = ffmpeg.merge_outputs(_output(0),*other_nodes).compile()
+    inputs = [args[i + 1] for i in range(len(args) - 1) if args[i] == "-i"]
+
+    return _output(inputs.index(meta_file))
+
+
+def _sprite_size(video_props):
+    """
+    Width and height (pixels) of one thumbnail in a sprite sheet.
+    """
+
+    height = int(round(_SPRITE_WIDTH*video_props["height"]/video_props["width"]/2))*2
+
+    return _SPRITE_WIDTH, height
+
+
+def _sprite_output(video,sprite_file,length,video_props,interval):
+    """
+    Output node sampling one frame every interval seconds from video and
+    tiling the thumbnails into a single sprite sheet image.
+
+    video: ffmpeg-python video stream
+    sprite_file: image to write (e.g. .jpg or .png)
+    length: length of video in seconds
+    video_props: properties of video (for the thumbnail aspect ratio)
+    interval: seconds between thumbnails
+    """
+
+    num_thumbs = max(1,int(np.ceil(length/interval)))
+    columns = min(_SPRITE_COLUMNS,num_thumbs)
+    rows = int(np.ceil(num_thumbs/columns))
+    width, height = _sprite_size(video_props)
+
+    return (
+        video
+        .filter("fps",fps="1/{}".format(interval))
+        .filter("scale",width,height)
+        .filter("tile","{}x{}".format(columns,rows))
+        .output(sprite_file,**{"frames:v":1,"update":1})
+    )
+
+
+def _ladder_outputs(video,audio,output_file,renditions,rendition_outputs,
+                    video_props,package=None,meta_file=None,
+                    sprite_file=None,sprite_interval=10,length=None):
+    """
+    Split one decoded (video,audio) pair into the main output plus every
+    rendition and the thumbnail sprite, so all of them are encoded from a
+    single decode.
+
+    video, audio: ffmpeg-python streams holding the finished video
+    output_file: main output file. if None, only write renditions and sprite.
+    renditions: output of _load_renditions
+    rendition_outputs: outputs from _rendition_files
+    video_props: output of _get_video_properties for the source video
+    package: None, "hls" or "dash"
+    meta_file: ffmetadata file with chapters to embed in output_file (or None)
+    sprite_file: thumbnail sprite sheet to write (or None)
+    sprite_interval: seconds between thumbnails
+    length: length of the video in seconds (needed for the sprite)
+
+    Returns a list of ffmpeg-python output nodes to run together (with
+    ffmpeg.merge_outputs, in this order).
+    """
+
+    has_main = output_file is not None
+    has_sprite = sprite_file is not None
+    if len(renditions) == 0:
+        rendition_audio = 0
+    elif package == "dash":
+        rendition_audio = 1
+    else:
+        rendition_audio = len(renditions)
+
+    videos = _split(video,"split",has_main + has_sprite + len(renditions))
+    audios = _split(audio,"asplit",has_main + rendition_audio)
+
+    if has_main:
+        main_video = videos.pop(0)
+        main_audio = audios.pop(0)
+
+    nodes = []
+    if has_sprite:
+        nodes.append(_sprite_output(videos.pop(0),sprite_file,length,
+                                    video_props,sprite_interval))
+
+    scaled = [videos[i].filter("scale",-2,r["height"])
+              for i, r in enumerate(renditions)]
+
+    # Put a keyframe at every segment boundary so renditions switch cleanly
+    key_frames = "expr:gte(t,n_forced*{})".format(_PACKAGE_SEGMENT_LENGTH)
+
+    if package == "dash":
+
+        # One manifest holding every rendition as an adaptation set
+        out_kwargs = dict(video_props["out_kwargs"])
+        for i, r in enumerate(renditions):
+            out_kwargs.update(_stream_kwargs(r["out_kwargs"],i))
+        out_kwargs.update({"f":"dash",
+                           "force_key_frames":key_frames,
+                           "seg_duration":_PACKAGE_SEGMENT_LENGTH,
+                           "use_template":1,
+                           "use_timeline":1,
+                           "adaptation_sets":"id=0,streams=v id=1,streams=a"})
+
+        os.makedirs(os.path.dirname(rendition_outputs[0]),exist_ok=True)
+        nodes.append(ffmpeg.output(*scaled,audios[0],rendition_outputs[0],
+                                   **out_kwargs))
+
+    else:
+        for i, r in enumerate(renditions):
+
+            out_kwargs = dict(video_props["out_kwargs"])
+            out_kwargs.update(r["out_kwargs"])
+
+            if package == "hls":
+                playlist_dir = os.path.dirname(rendition_outputs[i])
+                os.makedirs(playlist_dir,exist_ok=True)
+                out_kwargs.update({"f":"hls",
+                                   "force_key_frames":key_frames,
+                                   "hls_time":_PACKAGE_SEGMENT_LENGTH,
+                                   "hls_playlist_type":"vod",
+                                   "hls_segment_filename":os.path.join(playlist_dir,
+                                                                       "segment_%05d.ts")})
+
+            nodes.append(ffmpeg.output(scaled[i],audios[i],
+                                       rendition_outputs[i],**out_kwargs))
+
+    if not has_main:
+        return nodes
+
+    if meta_file is None:
+        main = ffmpeg.output(main_video,main_audio,output_file,
+                             **video_props["out_kwargs"])
+    else:
+        main = _chapter_output(main_video,main_audio,output_file,
+                               video_props["out_kwargs"],meta_file,nodes)
+
+    return [main] + nodes
+
+
+def _write_hls_master(master_file,renditions,rendition_outputs,video_props):
+    """
+    Write an HLS master playlist pointing at each rendition's media playlist.
+    Bandwidths are measured from the segments that were actually written.
+
+    master_file: master playlist to write
+    renditions: output of _load_renditions
+    rendition_outputs: media playlists from _rendition_files
+    video_props: output of _get_video_properties for the source video
+    """
+
+    lines = ["#EXTM3U","#EXT-X-VERSION:3"]
+    for r, playlist in zip(renditions,rendition_outputs):
+
+        playlist_dir = os.path.dirname(playlist)
+
+        # Pair each #EXTINF duration with the size of the segment after it
+        durations = []
+        sizes = []
+        with open(playlist) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#EXTINF:"):
+                    durations.append(float(line[8:].split(",")[0]))
+                elif line != "" and not line.startswith("#"):
+                    sizes.append(os.path.getsize(os.path.join(playlist_dir,line)))
+
+        bits = 8*np.array(sizes,dtype=float)
+        seconds = np.maximum(np.array(durations,dtype=float),1e-3)
+        peak = int(np.max(bits/seconds)) if len(bits) > 0 else 0
+        average = int(np.sum(bits)/np.sum(seconds)) if len(bits) > 0 else 0
+
+        width = int(round(video_props["width"]*r["height"]/video_props["height"]/2))*2
+        lines.append("#EXT-X-STREAM-INF:BANDWIDTH={},AVERAGE-BANDWIDTH={},RESOLUTION={}x{}".format(peak,
+                                                                                                  average,
+                                                                                                  width,
+                                                                                                  r["height"]))
+        lines.append(os.path.relpath(playlist,os.path.dirname(master_file)))
+
+    with open(master_file,"w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _copy_join_outputs(source,output_file,length,video_props,extras=None):
+    """
+    Output nodes for a join that copies the streams of source (a concat
+    demuxer input) into output_file.  The renditions and thumbnail sprite in
+    extras are encoded from one decode of the same input in the same run, and
+    its chapters are embedded in output_file, so the clip-based render modes
+    need no second pass over the joined video.  Run the nodes together with
+    ffmpeg.merge_outputs, in order.
+
+    source: ffmpeg-python input node of the clips to join
+    output_file: output video file
+    length: length of the joined video in seconds (needed for the sprite)
+    video_props: output of _get_video_properties for the source video
+    extras: dictionary with "renditions", "rendition_outputs", "package",
+            "meta_file", "sprite_file" and "sprite_interval" (see
+            _ladder_outputs). if None, only copy the streams.
+    """
+
+    if extras is None:
+        return [source.output(output_file,**{"c":"copy"})]
+
+    nodes = _ladder_outputs(source.video,source.audio,None,extras["renditions"],
+                            extras["rendition_outputs"],video_props,
+                            extras["package"],sprite_file=extras["sprite_file"],
+                            sprite_interval=extras["sprite_interval"],
+                            length=length)
+
+    if extras["meta_file"] is None:
+        main = ffmpeg.output(source.video,source.audio,output_file,
+                             **{"c":"copy"})
+    else:
+        main = _chapter_output(source.video,source.audio,output_file,
+                               {"c":"copy"},extras["meta_file"],nodes)
+
+    return [main] + nodes
+
+
+def _render_filtergraph(video_file,output_file,segments,fade_length,video_props,
+                        renditions=None,rendition_outputs=None,package=None,
+                        preview=False,meta_file=None,
+                        sprite_file=None,sprite_interval=10,context=None):
+    """
+    Render segments in a single decode/encode pass through one filter graph.
+    No intermediate files are written.
+
+    video_file: input video file
+    output_file: output video file
+    segments: list of dictionaries with "start", "stop" and "gap" keys (all
+              in seconds; see Timebase.segments).
+    fade_length: fade length in seconds
+    video_props: output of _get_video_properties for video_file
+    renditions: output of _load_renditions. if given, split the joined video
+                and encode these renditions in the same pass.
+    rendition_outputs: outputs from _rendition_files
+    package: None, "hls" or "dash"
+    preview: render a preview (see _build_filtergraph)
+    meta_file: ffmetadata file with chapters to embed in output_file (or None)
+    sprite_file: thumbnail sprite sheet to sample in the same pass (or None)
+    sprite_interval: seconds between thumbnails
+    context: _RenderContext for the ffmpeg runs. if None, use a new one.
+    """
+
+    if renditions is None:
+        renditions = []
+
+    joined = _build_filtergraph(video_file,segments,fade_length,video_props,
+                                preview)
+
+    length = sum([s["stop"] - s["start"] + 2*fade_length + s["gap"]
+                  for s in segments])
+
+    nodes = _ladder_outputs(joined[0],joined[1],output_file,renditions,
+                            rendition_outputs,video_props,package,
+                            meta_file,sprite_file,sprite_interval,length)
+    _run_ffmpeg(ffmpeg.merge_outputs(*nodes),"filtergraph",length,context)
+
+
+def _write_ffmetadata(meta_file,chapters):
+    """
+    Write chapters (see Timebase.chapters) to an ffmetadata file.
+    """
+
+    def _escape(value):
+        return re.sub(r"([=;#\\\n])",r"\\\1",value)
+
+    lines = [";FFMETADATA1"]
+    for chapter in chapters:
+        lines.extend(["[CHAPTER]",
+                      "TIMEBASE=1/1000",
+                      "START={}".format(int(round(chapter["start"]*1000))),
+                      "END={}".format(int(round(chapter["stop"]*1000))),
+                      "title={}".format(_escape(chapter["title"]))])
+
+    with open(meta_file,"w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _write_chapter_list(chapters_file,chapters):
+    """
+    Write chapters (see Timebase.chapters) as a YouTube-style text list, one
+    "M:SS title" (or "H:MM:SS title") line per chapter, ready to paste into a
+    video description.
+    """
+
+    long_video = chapters[-1]["stop"] >= 3600
+
+    lines = []
+    for chapter in chapters:
+        seconds = int(np.floor(chapter["start"]))
+        hours, seconds = divmod(seconds,3600)
+        minutes, seconds = divmod(seconds,60)
+        if long_video:
+            stamp = "{}:{:02}:{:02}".format(hours,minutes,seconds)
+        else:
+            stamp = "{}:{:02}".format(minutes,seconds)
+        lines.append("{} {}".format(stamp,chapter["title"]))
+
+    with open(chapters_file,"w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    # YouTube ignores chapter lists that break its rules
+    lengths = [c["stop"] - c["start"] for c in chapters]
+    if len(chapters) < 3 or min(lengths) < 10:
+        logger.info("note: YouTube only shows chapters for lists of 3 or more chapters that are each at least 10 seconds long")
+
+
+def _write_sprite_vtt(vtt_file,sprite_file,length,video_props,interval):
+    """
+    Write a WebVTT file mapping each interval of the video to its thumbnail
+    in the sprite sheet (sprite.jpg#xywh=x,y,w,h), as used by web players for
+    seek previews.
+    """
 
-    # Generate black video
-    video = ffmpeg.input("color=c=black:s={}x{}".format(video_props['width'],
-                                                        video_props['height']),
-                         **{"t":length,"f":"lavfi"})
+    num_thumbs = max(1,int(np.ceil(length/interval)))
+    columns = min(_SPRITE_COLUMNS,num_thumbs)
+    width, height = _sprite_size(video_props)
+    sprite_name = os.path.relpath(sprite_file,os.path.dirname(os.path.abspath(vtt_file)))
 
-    # Generate silent audio track
-    audio = ffmpeg.input("anullsrc=channel_layout={}:sample_rate={}".format(video_props['channel_layout'],
-                                                                              video_props['sample_rate']),
-                         **{"t":length,"f":"lavfi"})
+    lines = ["WEBVTT",""]
+    for i in range(num_thumbs):
+        row, column = divmod(i,columns)
+        lines.append("{} --> {}".format(_seconds_to_time(i*interval),
+                                        _seconds_to_time(min((i + 1)*interval,length))))
+        lines.append("{}#xywh={},{},{},{}".format(sprite_name,column*width,
+                                                  row*height,width,height))
+        lines.append("")
 
+    with open(vtt_file,"w") as f:
+        f.write("\n".join(lines))
 
-    # Combine video and audio
-    if video_props["audio_first"]:
-        stream = ffmpeg.concat(video.video,audio.audio,a=1,v=1).node
-    else:
-        stream = ffmpeg.concat(video.audio,audio.video,v=1,a=1).node
 
-    # Write output
-    out = ffmpeg.output(stream[0],stream[1],output_file,**out_kwargs)
-    out.run()
+# Functions used to render each kind of temp-file render task
+_RENDER_FUNCTIONS = {"fade-in":_fade_in,
+                     "slice":_slice_out,
+                     "fade-out":_fade_out,
+                     "gap":_generate_blank}
 
 
-def _load_time_column(df,column_name=None,allow_missing=False):
+def _load_time_column(df,clock,column_name=None,allow_missing=False):
     """
-    Load a column of HH:MM:SS type values from a data frame.
+    Load a column of HH:MM:SS, HH:MM:SS.mmm or frame number (1234f) values from
+    a data frame and return them as an array of integer ticks.
 
     df: dataframe with column
-    column_name: name of column.  if None, return a set of 00:00:00 of the
+    clock: FrameClock used to convert times to ticks
+    column_name: name of column.  if None, return an array of zeros of the
                  proper length
     allow_missing: whether or not to allow missing values.  if True, set
-                   missing values to 00:00:00
+                   missing values to zero
     """
 
     # Get time values from spreadsheets
     try:
 
-        values = np.array(df[column_name],dtype=np.str)
+        values = df[column_name]
 
         # Deal with missing values. Either replace with 00:00:00 or throw error
-        if allow_missing:
-            values[df[column_name].isnull()] = "00:00:00"
-        else:
-            if np.sum(df[column_name].isnull()) > 0:
-                err = "column '{}' has missing values\n".format(column_name)
-                raise ValueError(err)
+        missing = values.isnull().to_numpy()
+        if np.sum(missing) > 0 and not allow_missing:
+            err = "column '{}' has missing values\n".format(column_name)
+            raise ValueError(err)
 
     except KeyError:
         if column_name is None:
-            num_values = len(df.iloc[:,0])
-            values = np.array(["00:00:00" for _ in range(num_values)])
+            return np.zeros(len(df.iloc[:,0]),dtype=np.int64)
         else:
             err = "spreadsheet does not have column '{}'\n".format(column_name)
             raise ValueError(err)
 
-    # Check sanity of times.  This will throw an error if they have the incorrect
-    # format.
-    for v in values:
-        _ = _time_to_seconds(v)
+    # Convert whole column at once.  This will throw an error if any value has
+    # the incorrect format.
+    ticks = np.zeros(len(values),dtype=np.int64)
+    ticks[~missing] = clock.parse(values[~missing].to_numpy())
+
+    return ticks
+
+
+def _plan_segments(starts,stops,gaps,merge_within,clock):
+    """
+    Turn spreadsheet rows into the minimum set of segments to render.  Rows
+    are sorted by start time, exact duplicates are dropped, and rows that
+    overlap or are separated by less than merge_within are merged into a
+    single segment.  A merged segment keeps the gap after its last row; gaps
+    after the other rows are dropped.
+
+    Returns starts, stops and gaps for the planned segments along with an edit
+    decision list (data frame) explaining where each segment came from. Row
+    numbers in the edit decision list count spreadsheet data rows from 1.
+
+    starts: chunk start SOURCE times (ticks)
+    stops: chunk stop SOURCE times (ticks)
+    gaps: gap after each chunk (ticks)
+    merge_within: merge rows separated by less than this (ticks)
+    clock: FrameClock defining the ticks
+    """
+
+    starts = np.asarray(starts,dtype=np.int64)
+    stops = np.asarray(stops,dtype=np.int64)
+    gaps = np.asarray(gaps,dtype=np.int64)
+
+    # Sort by start, then stop.  Keep track of original row numbers.
+    order = np.lexsort((stops,starts))
+    rows = order + 1
+    starts = starts[order]
+    stops = stops[order]
+    gaps = gaps[order]
+
+    # Exact duplicates of the previous row
+    duplicate = np.zeros(len(starts),dtype=bool)
+    duplicate[1:] = (starts[1:] == starts[:-1]) & (stops[1:] == stops[:-1])
+
+    # Start a new segment whenever a row starts at least merge_within after
+    # the latest stop seen so far.
+    latest_stop = np.maximum.accumulate(stops)
+    new_segment = np.ones(len(starts),dtype=bool)
+    new_segment[1:] = (starts[1:] - latest_stop[:-1]) >= merge_within
+    segment_index = np.cumsum(new_segment) - 1
+
+    num_segments = segment_index[-1] + 1
+    first = np.nonzero(new_segment)[0]
+    last = np.append(first[1:],len(starts)) - 1
+
+    out_starts = starts[first]
+    out_stops = np.maximum.reduceat(stops,first)
+    out_gaps = gaps[last]
+
+    # Explain each segment
+    edl = {"event":np.arange(1,num_segments + 1),
+           "rows":[],"source_start":clock.format(out_starts),
+           "source_stop":clock.format(out_stops),"gap":clock.format(out_gaps),
+           "action":[],"notes":[]}
+
+    for i in range(num_segments):
+
+        these = np.arange(first[i],last[i] + 1)
+        edl["rows"].append(",".join([str(r) for r in rows[these]]))
+
+        notes = []
+        if np.sum(duplicate[these]) > 0:
+            notes.append("dropped duplicate row(s) {}".format(",".join([str(r) for r in rows[these][duplicate[these]]])))
+
+        kept = these[~duplicate[these]]
+        if len(kept) > 1:
+            overlapping = starts[kept[1:]] < latest_stop[kept[:-1]]
+            if np.sum(overlapping) > 0:
+                notes.append("merged overlapping row(s) {}".format(",".join([str(r) for r in rows[kept[1:]][overlapping]])))
+            if np.sum(~overlapping) > 0:
+                notes.append("merged row(s) {} starting less than {} after the previous stop".format(",".join([str(r) for r in rows[kept[1:]][~overlapping]]),
+                                                                                                     clock.format([merge_within])[0]))
+
+            dropped_gaps = rows[kept[:-1]][gaps[kept[:-1]] > 0]
+            if len(dropped_gaps) > 0:
+                notes.append("dropped gap after row(s) {}".format(",".join([str(r) for r in dropped_gaps])))
+
+        if np.sum(np.diff(rows[these]) < 0) > 0 or (i > 0 and rows[first[i]] < rows[last[i-1]]):
+            notes.append("reordered")
+
+        if len(these) == 1:
+            edl["action"].append("keep")
+        else:
+            edl["action"].append("merge")
+        edl["notes"].append("; ".join(notes))
+
+    edl = pd.DataFrame(edl)
+
+    return out_starts, out_stops, out_gaps, edl
+
+
+class Timebase:
+    """
+    Map between times in a chopped video and real time.
+
+    There are *three* sets of times that we have to keep track of to build
+    a map between the final video time and real time.
+    1) SOURCE time.  This is the time index of the original source file
+    2) OUTPUT time.  This is the time index in the final output video
+    3) REAL time.  This is the real time.  It is related to the SOURCE time
+       by a simple offset.  Because we chop out chunks to make OUTPUT time,
+       it is not simply related to OUTPUT time...
+
+    The output video alternates "content" sections (fade-in + chunk) and "gap"
+    sections (fade-out + black screen).  Each section is stored as a row in
+    numpy arrays (section_type, {source|output|real}_{start|stop}) of integer
+    frame ticks (see FrameClock).  Sections are half-open intervals
+    [start,stop), so each section starts exactly where the previous one
+    stopped.  Within a section, times are mapped linearly, so queries are a
+    binary search plus arithmetic and are vectorized over arrays of times.
+
+    REAL times are frame ticks too, but the REAL time of the first output
+    frame usually falls between frames (e.g. 09:00:00 at 29.97 fps).  That time
+    is kept exactly (real_time_us) and every REAL time is offset by the
+    difference, so REAL times are reported as the user gave them.
+
+    Use Timebase.from_cuts to build from spreadsheet chunks.
+    """
+
+    def __init__(self,section_type,
+                 source_start,source_stop,
+                 output_start,output_stop,
+                 real_start,real_stop,
+                 clock,fade_length=0,real_time_us=None):
+
+        self.section_type = np.asarray(section_type)
+        self.source_start = np.asarray(source_start,dtype=np.int64)
+        self.source_stop = np.asarray(source_stop,dtype=np.int64)
+        self.output_start = np.asarray(output_start,dtype=np.int64)
+        self.output_stop = np.asarray(output_stop,dtype=np.int64)
+        self.real_start = np.asarray(real_start,dtype=np.int64)
+        self.real_stop = np.asarray(real_stop,dtype=np.int64)
+        self.clock = clock
+        self.fade_length = fade_length
+
+        # Exact REAL time (microseconds) of real_start[0] and its offset
+        # (seconds) from the frame-rounded tick
+        self.real_time_us = real_time_us
+        self._real_shift = 0.0
+        if real_time_us is not None and len(self.real_start) > 0:
+            self._real_shift = real_time_us/1e6 - float(clock.to_seconds(self.real_start[0]))
+
+    @classmethod
+    def from_cuts(cls,starts,stops,gaps,fade_length,duration,real_time,clock):
+        """
+        Build the timebase for a video chopped into chunks.  All times are in
+        ticks of clock.
+
+        starts: chunk start SOURCE times
+        stops: chunk stop SOURCE times
+        gaps: length of black screen to add after each chunk
+        fade_length: fade length
+        duration: length of the source video
+        real_time: REAL time corresponding to the first output frame, as a
+                   time string (see FrameClock).  kept exactly, even if it
+                   falls between frames.
+        clock: FrameClock defining the ticks
+
+        Chunks are chopped up as fade-in + chunk and then fade-out + gap:
+        |fadein0chunk0|fadeout0gap0|fadein1chunk1|fadeout1gap1|...
+        """
+
+        starts = np.asarray(starts,dtype=np.int64)
+        stops = np.asarray(stops,dtype=np.int64)
+        gaps = np.asarray(gaps,dtype=np.int64)
 
-    return values
+        # Make sure the start and stop have room for fading in and out
+        start_source = np.maximum(starts,fade_length)
+        stop_source = np.minimum(stops,duration - fade_length)
+
+        # How long is each chunk (includes *one* of the fades) and each gap
+        # (includes the other fade).
+        chunk_duration = stop_source - start_source + fade_length
+        gap_duration = gaps + fade_length
+
+        # ---------------- Source time ------------------
+        # Content covers (start - fade) -> stop.  The gap covers what was cut
+        # out: stop -> start of the next content (or the end of the video).
+        content_source_start = start_source - fade_length
+        content_source_stop = stop_source
+        gap_source_start = stop_source
+        gap_source_stop = np.append(content_source_start[1:],duration)
+
+        # ---------------- Output time ------------------
+        block = chunk_duration + gap_duration
+        content_output_start = np.concatenate(([0],np.cumsum(block)[:-1]))
+        content_output_stop = content_output_start + chunk_duration
+        gap_output_start = content_output_stop
+        gap_output_stop = gap_output_start + gap_duration
+
+        # ---------------- Real time ------------------
+        # The first output frame corresponds to the specified real time.
+        # Frame numbers are exact; other times are also kept to the
+        # microsecond.
+        real_ticks = clock.parse([real_time])[0]
+        real_time_us = None
+        if not str(real_time).strip().endswith("f"):
+            real_time_us = int(FrameClock(1000000).parse([real_time])[0])
+        real_time_offset = real_ticks - content_source_start[0]
+
+        # Interleave content and gap sections
+        def _interleave(content,gap):
+            out = np.empty(2*len(content),dtype=np.int64)
+            out[0::2] = content
+            out[1::2] = gap
+            return out
+
+        source_start = _interleave(content_source_start,gap_source_start)
+        source_stop = _interleave(content_source_stop,gap_source_stop)
+
+        section_type = np.array(["content","gap"]*len(starts))
+
+        return cls(section_type,
+                   source_start,source_stop,
+                   _interleave(content_output_start,gap_output_start),
+                   _interleave(content_output_stop,gap_output_stop),
+                   source_start + real_time_offset,
+                   source_stop + real_time_offset,
+                   clock,fade_length,real_time_us)
+
+    def __len__(self):
+        return len(self.section_type)
+
+    def _map(self,t,from_start,from_stop,to_start,to_stop):
+        """
+        Map times t (seconds) from one time axis to another by finding the
+        section containing each t (binary search) and interpolating linearly
+        within it.  Times outside the covered range are clamped to it (the
+        start of the first section or the stop of the last), so they map to
+        the first or last time of the other axis rather than being
+        extrapolated through a compressed gap.  Returns seconds.
+        """
+
+        scalar = np.ndim(t) == 0
+        t = np.asarray(t,dtype=float)*float(self.clock.rate)
+        t = np.clip(t,from_start[0],from_stop[-1])
+
+        index = np.searchsorted(from_start,t,side="right") - 1
+        index = np.clip(index,0,len(from_start) - 1)
+
+        from_span = (from_stop - from_start)[index]
+        to_span = (to_stop - to_start)[index]
+        scale = np.divide(to_span,from_span,
+                          out=np.zeros(np.shape(index),dtype=float),
+                          where=from_span != 0)
+
+        mapped = (to_start[index] + (t - from_start[index])*scale)/float(self.clock.rate)
+
+        if scalar:
+            return float(mapped)
+        return mapped
+
+    def output_to_real(self,t):
+        """
+        Convert OUTPUT time(s) t (seconds) to REAL time (seconds). Times
+        before the start or past the end of the output map to the first or
+        last REAL time the video covers.
+        """
+
+        return self._map(t,self.output_start,self.output_stop,
+                         self.real_start,self.real_stop) + self._real_shift
+
+    def real_to_output(self,t):
+        """
+        Convert REAL time(s) t (seconds) to OUTPUT time (seconds). Real times
+        that were cut out of the video map into the gap that replaced them;
+        times outside the source map to the start or end of the output.
+        """
+
+        return self._map(np.asarray(t,dtype=float) - self._real_shift,
+                         self.real_start,self.real_stop,
+                         self.output_start,self.output_stop)
+
+    def _format_real(self,ticks):
+        """
+        Convert an array of REAL ticks to HH:MM:SS.mmm strings, offset so that
+        real_start[0] is exactly real_time_us.
+        """
+
+        if self.real_time_us is None:
+            return self.clock.format(ticks)
+
+        # Integer math: milliseconds = round((ticks - first)/rate + real_time)
+        num, den = self.clock.rate.numerator, self.clock.rate.denominator
+        ticks = np.asarray(ticks,dtype=np.int64) - self.real_start[0]
+        ms = (ticks*den*1000000 + self.real_time_us*num + num*500)//(num*1000)
+
+        return FrameClock(1000).format(ms)
+
+    def segments(self):
+        """
+        Return list of segments to render: dictionaries with "start", "stop"
+        and "gap" keys, in seconds.  start and stop are the chunk SOURCE times
+        (not including fades).  Times fall exactly on frame boundaries.
+        """
+
+        content = self.section_type == "content"
+        gap = self.section_type == "gap"
+
+        starts = self.clock.to_seconds(self.source_start[content] + self.fade_length)
+        stops = self.clock.to_seconds(self.source_stop[content])
+        gaps = self.clock.to_seconds((self.output_stop[gap] - self.output_start[gap]) - self.fade_length)
+
+        segments = []
+        for i in range(len(starts)):
+            segments.append({"start":float(starts[i]),
+                             "stop":float(stops[i]),
+                             "gap":float(gaps[i])})
+
+        return segments
+
+    def chapters(self,titles=None):
+        """
+        Return one chapter per content section: dictionaries with "start" and
+        "stop" (OUTPUT times in seconds) and "title" keys.  Each chapter runs
+        until the next one starts, so the gaps belong to the chapter before
+        them.
+
+        titles: list of titles, one per content section.  Missing or empty
+                titles default to the part number and the REAL time at which
+                the section's content starts.
+        """
+
+        content = np.where(self.section_type == "content")[0]
+
+        starts = self.clock.to_seconds(self.output_start[content])
+        stops = np.append(starts[1:],self.clock.to_seconds(self.output_stop[-1]))
+        real = self.clock.to_seconds(self.real_start[content] + self.fade_length)
+        real = real.astype(float) + self._real_shift
+
+        chapters = []
+        for i in range(len(content)):
+
+            title = None
+            if titles is not None and i < len(titles):
+                title = titles[i]
+            if title is None or str(title).strip() == "":
+                title = "Part {} ({})".format(i + 1,
+                                              _seconds_to_time(float(real[i])).split(".")[0])
+
+            chapters.append({"start":float(starts[i]),
+                             "stop":float(stops[i]),
+                             "title":str(title).strip()})
+
+        return chapters
+
+    def to_dataframe(self):
+        """
+        Return the timebase as a data frame of HH:MM:SS.mmm strings.
+        """
+
+        out_dict = {}
+        out_dict["section_type"] = self.section_type
+        out_dict["real_start"] = self._format_real(self.real_start)
+        out_dict["real_stop"] = self._format_real(self.real_stop)
+        out_dict["video_start"] = self.clock.format(self.output_start)
+        out_dict["video_stop"] = self.clock.format(self.output_stop)
+
+        return pd.DataFrame(out_dict)
+
+    def to_csv(self,timebase_file):
+        """
+        Write the timebase to a csv file.
+        """
+
+        self.to_dataframe().to_csv(timebase_file,index=False)
 
 
 def process_video(video_file,output_file,
@@ -332,7 +3271,17 @@ def process_video(video_file,output_file,
                   start_column="start",stop_column="stop",gap_column=None,
                   fade_length=1,
                   timebase_file=None,real_time="00:00:00",
-                  force=False):
+                  force=False,render_mode="filtergraph",jobs=1,
+                  probe_cache_file=None,cut_mode="copy",
+                  blank_cache_dir=None,blank_cache_size=1024,
+                  work_dir=None,keep_work_dir=False,dry_run=False,
+                  threads=None,merge_within=None,edl_file=None,
+                  renditions=None,package=None,preview=False,
+                  report_file=None,progress=True,
+                  executor="process",timeout=None,
+                  queue_file=None,local_workers=1,
+                  chapters_file=None,chapter_column=None,
+                  sprite_file=None,sprite_interval=10,_context=None):
     """
     Take a video file, extract the sections identified in a spreadsheet, and
     then combine them into a single video.  Fades to black between clips.
@@ -345,21 +3294,123 @@ def process_video(video_file,output_file,
     start_column: column in spreadsheet with chunk starts
     stop_column: column in spreadsheet with chunk stops
     gap_column: column in spreadsheet with gaps (if None, do not use)
-    fade_length: length of fades in seconds
+    fade_length: length of fades in seconds (rounded to whole frames)
     timebase_file: file to write out map between video and real time. if None
                    do not write out the file
-    real_time: real time in HH:MM:SS format corresponding to 00:00:00 in output
-               video. only used in timebase_file.
+    real_time: real time in HH:MM:SS(.mmm) format corresponding to 00:00:00 in
+               output video. only used in timebase_file.
     force: wipe out existing output files (default is False)
+    render_mode: how to render the video. "filtergraph" (default) decodes and
+                 encodes the source once using a single ffmpeg filter graph.
+                 "temp-files" writes each fade, slice and gap to a temporary
+                 file and then joins them. "pipe" streams the same clips
+                 through named pipes into the joining process, so no clips
+                 touch disk. "queue" renders the temp-file clips through an
+                 sqlite work queue (see queue_file) and then joins them.
+    jobs: number of segment renders to run at once in "temp-files" mode.
+          ignored, with a warning, by the other modes
+    probe_cache_file: json file in which to cache ffprobe results between runs.
+                      if None, only cache within this process.
+    cut_mode: how to cut chunks in "temp-files" mode. "copy" (default) stream
+              copies, so cuts snap to keyframes. "smart" re-encodes only the
+              partial groups of pictures at each cut for frame-accurate cuts.
+              ignored, with a warning, in "filtergraph" mode
+    blank_cache_dir: directory in which to cache black/silent gap clips for
+                     reuse within and between runs ("temp-files" mode). if
+                     None, encode every gap from scratch. ignored, with a
+                     warning, in "filtergraph" and "pipe" modes
+    blank_cache_size: maximum size of the gap clip cache in megabytes
+    work_dir: directory for intermediate clips. clips are named by a hash of
+              their inputs, so rerunning with a kept work_dir only renders the
+              rows that changed. if None, use '{output_file}.work'. a work_dir
+              that is passed in is always kept. only created by the modes that
+              write clips or pipes ("temp-files", "pipe" and "queue").
+    keep_work_dir: keep the default work_dir (and its clips) after the run.
+    dry_run: do not render or write any files; log which clips would be
+             rebuilt and return their names.
+    threads: maximum number of threads each ffmpeg encoder may use. if None,
+             let ffmpeg decide.
+    merge_within: rows that overlap or are separated by less than this many
+                  seconds are merged into one segment.  if None, use twice
+                  the fade length (the rows' fades would overlap).
+    edl_file: csv file in which to write the edit decision list explaining
+              how rows were sorted, merged and dropped. if None (or for a
+              dry_run, which only logs it), do not write.
+    renditions: extra copies to encode at other resolutions, from the same
+                decode as the main output in "filtergraph" mode and from a
+                decode of the clips in the join of the other modes (see
+                _load_renditions). written as '{root}.{name}{ext}' or, when
+                packaged, into '{root}.hls' or '{root}.dash'.
+    package: package renditions for streaming. None, "hls" (a media playlist
+             per rendition plus master.m3u8) or "dash" (one manifest.mpd).
+    preview: render a quick, low resolution review copy with the source time
+             burned in.  always renders in "filtergraph" mode.  the segments
+             and timebase are identical to those of the full render.
+    report_file: json file in which to write a render report: wall time of
+                 each phase and, for every ffmpeg run, its wall time, encoded
+                 fps, speed and bytes written. if None, do not write.
+    progress: draw a progress bar with an ETA for each ffmpeg run when stderr
+              is a terminal.
+    executor: how "temp-files" mode runs clips at once. "process" (default)
+              uses a pool of worker processes; "asyncio" waits on the ffmpeg
+              processes from an event loop (see also process_video_async).
+    timeout: kill any ffmpeg process that produces no output for this many
+             seconds and fail the render. if None, wait forever.
+    queue_file: sqlite work queue for "queue" mode. other hosts can help by
+                running 'chop_video.py worker queue_file' (queue_file and
+                work_dir must be on storage they share). if None, use
+                'queue.sqlite' in work_dir.
+    local_workers: number of queue workers to start on this host in "queue"
+                   mode (0 relies entirely on workers started elsewhere).
+    chapters_file: text file in which to write a YouTube-style chapter list.
+                   whenever chapters_file or chapter_column is given, the
+                   chapters are also embedded in output_file. if None, do not
+                   write.
+    chapter_column: column in spreadsheet with chapter titles. a merged
+                    segment takes the first title among its rows. if None,
+                    chapters are titled by part number and real time.
+    sprite_file: image in which to write a sheet of thumbnails sampled every
+                 sprite_interval seconds (e.g. for seek previews), along with
+                 a WebVTT index of it in '{root}.vtt'. sampled during the
+                 render pass in "filtergraph" mode and during the join in the
+                 other modes. if None, do not write.
+    sprite_interval: seconds between sprite thumbnails
+    _context: _RenderContext for the render's ffmpeg runs, so a caller can
+              kill them (see process_video_async). its progress and stall
+              timeout are set from progress and timeout. if None, use a new
+              one.
+
+    Returns a Timebase mapping between output and real time (or, for a
+    dry_run, the list of clips that would be rebuilt).
     """
 
     # -------------------------------------------------------------------------
     # Check sanity of input files
+
+    if render_mode not in RENDER_MODES:
+        err = "render_mode '{}' not recognized. Should be one of: {}\n".format(render_mode,
+                                                                        ",".join(RENDER_MODES))
+        raise ValueError(err)
+
+    if cut_mode not in CUT_MODES:
+        err = "cut_mode '{}' not recognized. Should be one of: {}\n".format(cut_mode,
+                                                                     ",".join(CUT_MODES))
+        raise ValueError(err)
+
+    if jobs < 1:
+        err = "jobs must be 1 or more\n"
+        raise ValueError(err)
+
+    if executor not in EXECUTORS:
+        err = "executor '{}' not recognized. Should be one of: {}\n".format(executor,
+                                                                      ",".join(EXECUTORS))
+        raise ValueError(err)
+
     if not os.path.isfile(video_file):
         err = "video_file '{}' does not exist.\n".format(video_file)
         raise FileNotFoundError(err)
 
-    if os.path.isfile(output_file) and not force:
+    if os.path.isfile(output_file) and not force and not dry_run:
         err = "output_file '{}' exists. Stopping. Use --force to overwrite.\n".format(output_file)
         raise FileExistsError(err)
 
@@ -367,15 +3418,88 @@ def process_video(video_file,output_file,
         err = "spreadsheet_file '{}' does not exist.\n".format(spreadsheet_file)
         raise FileNotFoundError(err)
 
-    if timebase_file is not None and not force:
+    if timebase_file is not None and not force and not dry_run:
         if os.path.isfile(timebase_file):
             err = "timebase_file '{}' exists. Stopping. Use --force to overwrite.\n".format(timebase_file)
             raise FileExistsError(err)
 
+    if edl_file is not None and not force and not dry_run:
+        if os.path.isfile(edl_file):
+            err = "edl_file '{}' exists. Stopping. Use --force to overwrite.\n".format(edl_file)
+            raise FileExistsError(err)
+
+    if report_file is not None and not force and not dry_run:
+        if os.path.isfile(report_file):
+            err = "report_file '{}' exists. Stopping. Use --force to overwrite.\n".format(report_file)
+            raise FileExistsError(err)
+
+    for extra_file in [chapters_file,sprite_file]:
+        if extra_file is not None and not force and not dry_run:
+            if os.path.isfile(extra_file):
+                err = "output '{}' exists. Stopping. Use --force to overwrite.\n".format(extra_file)
+                raise FileExistsError(err)
+
+    if sprite_interval <= 0:
+        err = "sprite_interval must be greater than 0\n"
+        raise ValueError(err)
+
+    if package is not None and package not in PACKAGE_FORMATS:
+        err = "package '{}' not recognized. Should be one of: {}\n".format(package,
+                                                                     ",".join(PACKAGE_FORMATS))
+        raise ValueError(err)
+
+    if renditions is None:
+        renditions = []
+    renditions = _load_renditions(renditions)
+
+    if package is not None and len(renditions) == 0:
+        err = "package requires at least one rendition\n"
+        raise ValueError(err)
+
+    if preview and len(renditions) > 0:
+        err = "renditions cannot be rendered in preview mode\n"
+        raise ValueError(err)
+
+    rendition_targets, rendition_outputs = _rendition_files(output_file,
+                                                            renditions,
+                                                            package)
+    if len(renditions) > 0 and not force and not dry_run:
+        for _, final in rendition_targets:
+            if os.path.exists(final):
+                err = "rendition output '{}' exists. Stopping. Use --force to overwrite.\n".format(final)
+                raise FileExistsError(err)
+
     # -------------------------------------------------------------------------
     # Probe the video for its properties (resolution, codec, etc)
 
-    video_props = _get_video_properties(video_file)
+    phase_start = time.perf_counter()
+    phases = {}
+
+    video_props = _get_video_properties(video_file,probe_cache_file)
+    phases["probe"] = time.perf_counter() - phase_start
+
+    if threads is not None:
+        video_props["out_kwargs"]["threads"] = threads
+
+    # A preview only changes how the plan is rendered, never the plan itself.
+    if preview:
+        if render_mode != "filtergraph":
+            logger.info("preview renders in filtergraph mode, not {}".format(render_mode))
+        render_mode = "filtergraph"
+        render_props = _preview_properties(video_props)
+    else:
+        render_props = video_props
+
+    # Options that only apply to the clip-based modes are ignored otherwise.
+    ignored = []
+    if jobs != 1 and render_mode != "temp-files":
+        ignored.append("jobs")
+    if cut_mode != "copy" and render_mode == "filtergraph":
+        ignored.append("cut_mode")
+    if blank_cache_dir is not None and render_mode not in ["temp-files","queue"]:
+        ignored.append("blank_cache_dir")
+    if len(ignored) > 0:
+        logger.warning("{} ignored in {} mode".format(", ".join(ignored),render_mode))
 
     # -------------------------------------------------------------------------
     # Load the spreadsheet
@@ -388,225 +3512,795 @@ def process_video(video_file,output_file,
         err = "spreadsheet file type not recognized.  Should be excel or csv.\n"
         raise ValueError(err)
 
+    if len(df) == 0:
+        err = "spreadsheet_file '{}' has no rows. Nothing to cut.\n".format(spreadsheet_file)
+        raise ValueError(err)
+
+    # All times are handled as integer frame ticks of the source video
+    clock = FrameClock(video_props["frame_rate"])
+    duration = int(np.floor(video_props["duration"]*clock.rate))
+
     # Get times of chunks from the spreadsheet
-    starts = _load_time_column(df,start_column,allow_missing=False)
-    stops = _load_time_column(df,stop_column,allow_missing=False)
-    gap_after = _load_time_column(df,gap_column,allow_missing=True)
+    starts = _load_time_column(df,clock,start_column,allow_missing=False)
+    stops = _load_time_column(df,clock,stop_column,allow_missing=False)
+    gap_after = _load_time_column(df,clock,gap_column,allow_missing=True)
 
     # Check time sanity
-    for i in range(len(stops)):
-        stop_value = _time_to_seconds(stops[i])
-        start_value = _time_to_seconds(starts[i])
+    bad = np.nonzero(stops <= starts)[0]
+    if len(bad) > 0:
+        i = bad[0]
+        err = "stop time '{}' before or identical to start time '{}'\n".format(clock.format([stops[i]])[0],
+                                                                            clock.format([starts[i]])[0])
+        raise ValueError(err)
 
-        if stop_value <= start_value:
-            err = "stop time '{}' before or identical to start time '{}'\n".format(stops[i],starts[i])
-            raise ValueError(err)
+    bad = np.nonzero(stops > duration)[0]
+    if len(bad) > 0:
+        i = bad[0]
+        longest_allowed = clock.format([duration])[0]
+        err = "stop time '{}' is longer than the video ({})".format(clock.format([stops[i]])[0],
+                                                                    longest_allowed)
+        raise ValueError(err)
 
-        if stop_value > video_props["duration"]:
-            longest_allowed = _seconds_to_time(video_props["duration"])
-            err = "stop time '{}' is longer than the video ({})".format(stops[i],
-                                                                        longest_allowed)
-            raise ValueError(err)
+    # -------------------------------------------------------------------------
+    # Sort, de-duplicate and merge rows into the segments to render.
+
+    fade_ticks = int(clock.from_seconds(fade_length))
+    if merge_within is None:
+        merge_ticks = 2*fade_ticks
+    else:
+        merge_ticks = int(clock.from_seconds(merge_within))
+
+    starts, stops, gap_after, edl = _plan_segments(starts,stops,gap_after,
+                                                    merge_ticks,clock)
+
+    logger.info("edit decision list ({} rows -> {} segments):\n{}".format(len(df),
+                                                                        len(edl),
+                                                                        edl.to_string(index=False)))
+    if edl_file is not None and not dry_run:
+        edl.to_csv(edl_file,index=False)
 
     # -------------------------------------------------------------------------
-    # Prep variables for main procesing loop
-
-    # Create unique file prefix for temporary files
-    file_prefix = "tmp_{}".format("".join([random.choice(string.ascii_letters)
-                                           for _ in range(8)]))
-
-    section_type = []
-    real_starts_sec = []
-    real_stops_sec = []
-    output_starts_sec = []
-    output_stops_sec = []
-
-    real_time_sec = _time_to_seconds(real_time)
-
-    # Now go through each chunk to chop out and construct timebase and video
-    # chunks
-
-    # There are *three* sets of times that we have to keep track of to build
-    # a map between the final video time and real time.
-    # 1) SOURCE time.  This is the time index of the original source file
-    # 2) OUTPUT time.  This is the time index in the final output video
-    # 3) REAL time.  This is the real time.  It is related to the SOURCE time
-    #    by a simple offset.  Because we chop out chunks to make OUTPUT time,
-    #    it is not simply related to OUTPUT time...
-    #
-    # Below, I denote variables as {start|stop}_{source|output|real}_{sec|string}
-    # The last field indicates whether the variable is a HH:MM:SS string or an
-    # integer of seconds.
-    #
-    # Final note on indexing.  I chop up chunks as fade-in + chunk and then
-    # fade-in + gap.  Everything has 1 second resolution.
-    # |fadein0chunk0|fadeout0gap0|fadein1chunk1|fadeout1gap1|...
-    #  ^           ^ ^
-    #  1           2 3
-    # 1: 0
-    # 2: t
-    # 3: t+1
-    # ...
-
-    file_list = []
-    for i in range(len(starts)):
-
-        # ---------------------------------------------------------------------
-        # Build conversion data for timebase file
-        # ---------------------------------------------------------------------
+    # Build map between source, output and real time.  This also defines the
+    # segments to render.
+
+    timebase = Timebase.from_cuts(starts,stops,gap_after,
+                                  fade_ticks,duration,real_time,clock)
+    segments = timebase.segments()
+
+    chapters = None
+    if chapters_file is not None or chapter_column is not None:
+        titles = None
+        if chapter_column is not None:
+            if chapter_column not in df.columns:
+                err = "chapter_column '{}' not in spreadsheet\n".format(chapter_column)
+                raise ValueError(err)
+            titles = []
+            for rows in edl["rows"]:
+                row_titles = [df[chapter_column].iloc[int(r) - 1] for r in rows.split(",")]
+                row_titles = [t for t in row_titles
+                              if not pd.isnull(t) and str(t).strip() != ""]
+                titles.append(row_titles[0] if len(row_titles) > 0 else None)
+        chapters = timebase.chapters(titles)
+
+    phases["plan"] = time.perf_counter() - phase_start - phases["probe"]
+
+    # Renderers work in seconds; use the fade length rounded to whole frames
+    fade_length = float(clock.to_seconds(fade_ticks))
+
+    # Only remove a work directory we chose; a work_dir passed in is kept.
+    if work_dir is None:
+        work_dir = "{}.work".format(output_file)
+    else:
+        keep_work_dir = True
 
-        # ---------------- Source time ------------------
+    # -------------------------------------------------------------------------
+    # Render the final movie
 
-        # Chunk start and stop SOURCE times in seconds
-        start_source_sec = _time_to_seconds(starts[i])
-        stop_source_sec = _time_to_seconds(stops[i])
+    if blank_cache_dir is None:
+        blank_cache = None
+    else:
+        blank_cache = BlankClipCache(blank_cache_dir,
+                                     blank_cache_size*1024**2)
+
+    # Report what would be rendered and stop
+    if dry_run:
+
+        if render_mode not in ["temp-files","queue"]:
+            logger.info("{} mode renders all {} segments every run.".format(render_mode,
+                                                                            len(segments)))
+            return ["segment {:03}".format(i) for i in range(len(segments))]
+
+        tasks = _build_render_tasks(video_file,segments,fade_length,
+                                    video_props,work_dir,cut_mode,blank_cache)
+
+        to_build = []
+        for i, segment in enumerate(segments):
+            stale = [t for t in tasks
+                     if t["segment"] == i and not os.path.isfile(t["output_file"])]
+            if len(stale) == 0:
+                status = "up to date"
+            else:
+                status = "rebuild ({})".format(", ".join([t["kind"] for t in stale]))
+            logger.info("segment {:03} {}-{}: {}".format(i,_seconds_to_time(segment["start"]),
+                                                         _seconds_to_time(segment["stop"]),
+                                                         status))
+            to_build.extend([t["name"] for t in stale])
+
+        return to_build
+
+    # Only the clip and pipe modes need somewhere to put intermediate files
+    if render_mode != "filtergraph":
+        os.makedirs(work_dir,exist_ok=True)
+
+    # Render next to output_file and then rename it into place. The rename
+    # is atomic, so output_file is never a partial video.
+    final_file = _partial_file(output_file)
+
+    meta_file = None
+    if chapters is not None:
+        meta_file = "{}.ffmetadata".format(os.path.splitext(final_file)[0])
+        _write_ffmetadata(meta_file,chapters)
+
+    sprite_partial = None
+    if sprite_file is not None:
+        sprite_partial = _partial_file(sprite_file)
+
+    context = _context
+    if context is None:
+        context = _RenderContext()
+    context.progress = progress and sys.stderr.isatty()
+    context.stall_timeout = timeout
+
+    # The clip-based modes make the renditions, sprite and chapters in their
+    # join, from the joined streams.
+    extras = None
+    if len(renditions) > 0 or meta_file is not None or sprite_file is not None:
+        extras = {"renditions":renditions,
+                  "rendition_outputs":rendition_outputs,
+                  "package":package,
+                  "meta_file":meta_file,
+                  "sprite_file":sprite_partial,
+                  "sprite_interval":sprite_interval}
+
+    render_start = time.perf_counter()
+    try:
+        if render_mode == "filtergraph":
+            _render_filtergraph(video_file,final_file,segments,fade_length,
+                                render_props,renditions,rendition_outputs,
+                                package,preview,meta_file,sprite_partial,
+                                sprite_interval,context)
+        elif render_mode == "pipe":
+            _render_pipes(video_file,final_file,segments,fade_length,
+                          video_props,work_dir,cut_mode,extras,context)
+        elif render_mode == "queue":
+            if queue_file is None:
+                queue_file = os.path.join(work_dir,"queue.sqlite")
+            _render_queue(video_file,final_file,segments,fade_length,
+                          video_props,work_dir,queue_file,cut_mode,blank_cache,
+                          local_workers,timeout=timeout,extras=extras,
+                          context=context)
+        else:
+            _render_temp_files(video_file,final_file,segments,fade_length,
+                               video_props,work_dir,jobs,cut_mode,blank_cache,
+                               executor,extras,context)
+
+        if package == "hls":
+            _write_hls_master(os.path.join(rendition_targets[0][0],"master.m3u8"),
+                              renditions,rendition_outputs,video_props)
+
+        os.replace(final_file,output_file)
+        if sprite_file is not None:
+            os.replace(sprite_partial,sprite_file)
+            length = sum([s["stop"] - s["start"] + 2*fade_length + s["gap"]
+                          for s in segments])
+            _write_sprite_vtt("{}.vtt".format(os.path.splitext(sprite_file)[0]),
+                              sprite_file,length,video_props,sprite_interval)
+        for partial, final in rendition_targets:
+            if os.path.isdir(final):
+                shutil.rmtree(final)
+            os.replace(partial,final)
+
+    finally:
+
+        # Nuke temporary files
+        for partial in [final_file,sprite_partial,meta_file]:
+            if partial is not None and os.path.isfile(partial):
+                os.remove(partial)
+        for partial, _ in rendition_targets:
+            if os.path.isdir(partial):
+                shutil.rmtree(partial)
+            elif os.path.isfile(partial):
+                os.remove(partial)
+        if not keep_work_dir and os.path.isdir(work_dir):
+            shutil.rmtree(work_dir)
+
+    phases["render"] = time.perf_counter() - render_start
 
-        # Make sure the start and stop have room for fading in and out
-        if (start_source_sec - fade_length) < 0:
-            start_source_sec = 0 + fade_length
-        if stop_source_sec + fade_length > video_props["duration"]:
-            stop_source_sec = video_props["duration"] - fade_length
+    # Write out timebase_file, if requested.
+    if timebase_file is not None:
+        timebase.to_csv(timebase_file)
 
-        # Start and stop SOURCE times as strings
-        start_source_string = _seconds_to_time(start_source_sec)
-        stop_source_string  = _seconds_to_time(stop_source_sec)
+    if chapters_file is not None:
+        _write_chapter_list(chapters_file,chapters)
 
-        # How long is the chunk (includes *one* of the fades)
-        chunk_duration = stop_source_sec - start_source_sec + fade_length
+    if report_file is not None:
+        _write_render_report(report_file,context.stats,phases,
+                             video_file=video_file,
+                             output_file=output_file,
+                             render_mode=render_mode,
+                             segments=len(segments),
+                             output_length=sum([s["stop"] - s["start"] + 2*fade_length + s["gap"]
+                                                for s in segments]),
+                             output_bytes=os.path.getsize(output_file))
 
-        # The first start corresponds to the specified real time. The first
-        # time through the loop, calculate the appropriate offset.
-        if i == 0:
-            real_time_offset = real_time_sec - (start_source_sec - fade_length)
+    return timebase
 
-        # ----------------------------------------------------------------------
-        # Work on main chunk:
-        # |fadein0chunk0|fadeout0gap0|
-        #  *************  <- indexes for fade-in through chunk
-        # ----------------------------------------------------------------------
 
-        section_type.append("content")
+async def process_video_async(video_file,output_file,spreadsheet_file,**kwargs):
+    """
+    Coroutine version of process_video for use from asyncio code.  Probing the
+    source and, for smart cuts, scanning its keyframes run at the same time,
+    and the render uses the asyncio executor, all without blocking the event
+    loop.  If the coroutine is cancelled, the ffmpeg processes of this render
+    (and no others) are killed.
 
-        # ---------------- Output time ------------------
+    video_file: video file to process
+    output_file: output video file name
+    spreadsheet file: spreadsheet encoding chunks to extract
+    kwargs: any other process_video keyword arguments
 
-        # If this is the first chunk, output start time is zero.  If not, the
-        # output start time is the previous output stop + 1.
-        if i == 0:
-            start_output_sec = 0
-        else:
-            start_output_sec = output_stops_sec[-1] + 1
+    Returns a Timebase mapping between output and real time.
+    """
 
-        stop_output_sec = start_output_sec + chunk_duration
+    kwargs.setdefault("executor","asyncio")
+    context = _RenderContext()
 
-        output_starts_sec.append(start_output_sec)
-        output_stops_sec.append(stop_output_sec)
+    # Independent set-up steps; their results are cached for process_video
+    steps = [asyncio.to_thread(_get_video_properties,video_file,
+                               kwargs.get("probe_cache_file",None))]
+    if kwargs.get("cut_mode","copy") == "smart" and \
+       kwargs.get("render_mode","filtergraph") != "filtergraph":
+        steps.append(asyncio.to_thread(_get_keyframe_times,video_file))
 
-        # ---------------- Real time ------------------
+    try:
+        await asyncio.gather(*steps)
+        return await asyncio.to_thread(process_video,video_file,output_file,
+                                       spreadsheet_file,_context=context,
+                                       **kwargs)
+    except asyncio.CancelledError:
+        context.kill()
+        raise
 
-        # Second, calculate real time for this chunk
-        start_real_sec = (start_source_sec - fade_length) + real_time_offset
-        stop_real_sec = start_real_sec + chunk_duration
 
-        real_starts_sec.append(start_real_sec)
-        real_stops_sec.append(stop_real_sec)
+def _write_render_report(report_file,stats,phases,**summary):
+    """
+    Write a json render report.
 
-        # ----------------------------------------------------------------------
-        # Work on gap chunk:
-        # |fadein0chunk0|fadeout0gap0|
-        #                ************ <- indexes for fade-out through gap
-        # ----------------------------------------------------------------------
+    report_file: json file to write
+    stats: statistics of each ffmpeg run (see _FFmpegRun.wait)
+    phases: dictionary of wall time (seconds) spent in each phase of the run
+    summary: other top level values (output file, mode, etc.)
+    """
 
-        section_type.append("gap")
+    report = dict(summary)
+    report["wall_time"] = sum(phases.values())
+    report["phases"] = phases
+    report["ffmpeg"] = stats
 
-        # ---------------- Output time ------------------
+    # Totals across every ffmpeg run, so reports can be compared over time
+    ffmpeg_time = sum([s["wall_time"] for s in stats])
+    report["totals"] = {"ffmpeg_runs":len(stats),
+                        "ffmpeg_wall_time":ffmpeg_time,
+                        "frames":sum([s["frames"] or 0 for s in stats]),
+                        "bytes":sum([s["bytes"] or 0 for s in stats])}
+    if "output_length" in summary and phases.get("render",0) > 0:
+        report["totals"]["speed"] = summary["output_length"]/phases["render"]
 
-        # On the final video the gap will go:
-        # (prev_stop + 1) -> (prev_stop + 1 + gap_duration)
-        start_output_sec = output_stops_sec[-1] + 1
-        gap_duration_sec = _time_to_seconds(gap_after[i]) + fade_length
-        stop_output_sec = start_output_sec + gap_duration_sec
+    with open(report_file,"w") as f:
+        json.dump(report,f,indent=2)
 
-        output_starts_sec.append(start_output_sec)
-        output_stops_sec.append(stop_output_sec)
 
-        # ---------------- Real time ------------------
+def _merge_intervals(intervals):
+    """
+    Merge overlapping (start,stop) intervals. Returns a sorted (N,2) array.
+    """
 
-        # The real start time is the last real time seen + 1
-        start_real_sec = real_stops_sec[-1] + 1
+    intervals = np.asarray(intervals,dtype=float).reshape(-1,2)
+    if len(intervals) == 0:
+        return intervals
 
-        # Get the next chunk start SOURCE time (either the start of the next
-        # chunk or the end of the video).
-        if i != len(starts) - 1:
-            start_source_next_chunk = _time_to_seconds(starts[i+1]) - fade_length
-        else:
-            start_source_next_chunk = video_props["duration"]
+    intervals = intervals[np.argsort(intervals[:,0])]
 
-        # Gap duration the time between the (start of next chunk - 1) and the
-        # end of the chunk.
-        gap_duration = (start_source_next_chunk - 1) - (stop_source_sec + 1)
-        stop_real_sec = start_real_sec + gap_duration
+    # Start a new interval whenever a start is past every stop seen so far
+    latest_stop = np.maximum.accumulate(intervals[:,1])
+    new_interval = np.ones(len(intervals),dtype=bool)
+    new_interval[1:] = intervals[1:,0] > latest_stop[:-1]
+    first = np.nonzero(new_interval)[0]
 
-        real_starts_sec.append(start_real_sec)
-        real_stops_sec.append(stop_real_sec)
+    return np.column_stack((intervals[first,0],
+                            np.maximum.reduceat(intervals[:,1],first)))
 
-        # ---------------------------------------------------------------------
-        # Construct temporary video files for this chunk
 
-        # Create initial fade in (start - fade_length) -> start
-        fade_in_file = "{}_{:03}_fade-in.mp4".format(file_prefix,i)
-        _fade_in(video_file,fade_in_file,start_source_string,fade_length)
-        file_list.append(fade_in_file)
+def _invert_intervals(intervals,duration):
+    """
+    Return the parts of (0,duration) not covered by intervals.
+    """
 
-        # Chop out video chunk from start -> stop
-        chunk_out_file = "{}_{:03}.mp4".format(file_prefix,i)
-        _slice_out(video_file,chunk_out_file,start_source_string,stop_source_string)
-        file_list.append(chunk_out_file)
+    intervals = _merge_intervals(intervals)
 
-        # Generate fade out (stop -> stop + fade_length)
-        fade_out_file = "{}_{:03}_fade-out.mp4".format(file_prefix,i)
-        _fade_out(video_file,fade_out_file,stop_source_string,fade_length)
-        file_list.append(fade_out_file)
+    edges = np.concatenate(([0.0],intervals.ravel(),[duration]))
+    inverted = edges.reshape(-1,2)
 
-        # Generate a black screen for gap_after if requested
-        if gap_after[i] != "00:00:00":
-            gap_out_file = "{}_{:03}_gap.mp4".format(file_prefix,i)
-            _generate_blank(video_file,gap_out_file,gap_after[i])
-            file_list.append(gap_out_file)
+    return inverted[inverted[:,1] > inverted[:,0]]
+
+
+def _intersect_intervals(a,b):
+    """
+    Return the parts of time covered by both interval sets a and b.
+    """
+
+    a = _merge_intervals(a)
+    b = _merge_intervals(b)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((0,2))
+
+    # Pair every interval in a with every interval in b it could overlap
+    i, j = np.meshgrid(np.arange(len(a)),np.arange(len(b)),indexing="ij")
+    i = i.ravel()
+    j = j.ravel()
+    start = np.maximum(a[i,0],b[j,0])
+    stop = np.minimum(a[i,1],b[j,1])
+    keep = stop > start
+
+    return _merge_intervals(np.column_stack((start[keep],stop[keep])))
+
+
+def _parse_detect_log(log,duration):
+    """
+    Pull silence and black intervals out of the stderr of an ffmpeg run with
+    the silencedetect and blackdetect filters.  Returns two (N,2) arrays of
+    (start,stop) times in seconds: silence, black.
+    """
+
+    silence = []
+    silence_start = None
+    for line in log.splitlines():
+
+        match = _SILENCE_START_PATTERN.search(line)
+        if match:
+            silence_start = float(match.group(1))
+            continue
+
+        match = _SILENCE_END_PATTERN.search(line)
+        if match and silence_start is not None:
+            silence.append((silence_start,float(match.group(1))))
+            silence_start = None
+
+    # Silence that runs to the end of the file
+    if silence_start is not None:
+        silence.append((silence_start,duration))
+
+    black = [(float(m.group(1)),float(m.group(2)))
+             for m in _BLACK_PATTERN.finditer(log)]
+
+    return (np.array(silence,dtype=float).reshape(-1,2),
+            np.array(black,dtype=float).reshape(-1,2))
+
+
+def detect_segments(video_file,spreadsheet_file,
+                    mode="either",
+                    noise="-30dB",black_threshold=0.1,min_dead=2.0,
+                    min_segment=5.0,padding=1.0,
+                    audio_rate=8000,video_fps=1.0,keyframes_only=False,
+                    force=False):
+    """
+    Find the content in a video by detecting silence and/or black screen in a
+    single streaming decode, then write a spreadsheet of start/stop times that
+    process_video can use to cut out the dead sections.  Audio is analyzed
+    after resampling to audio_rate and video after dropping to video_fps (and
+    scaling down), so the pass runs much faster than real time.
+
+    video_file: video file to analyze
+    spreadsheet_file: csv or excel file in which to write start,stop columns
+    mode: which sections count as dead. "silence", "black", "either" (silent
+          or black) or "both" (silent and black).
+    noise: silencedetect noise threshold (e.g. "-30dB")
+    black_threshold: blackdetect pixel threshold (0-1)
+    min_dead: minimum length (seconds) of silence/black to count as dead
+    min_segment: drop content segments shorter than this (seconds)
+    padding: extend each content segment by this much (seconds) on both sides
+    audio_rate: sample rate (Hz) at which to analyze audio
+    video_fps: frame rate at which to analyze video
+    keyframes_only: only decode keyframes (much faster; black detection has
+                    keyframe resolution)
+    force: overwrite spreadsheet_file if it exists
+
+    Returns a data frame with start and stop columns.
+    """
+
+    if mode not in DETECT_MODES:
+        err = "mode '{}' not recognized. Should be one of: {}\n".format(mode,
+                                                                 ",".join(DETECT_MODES))
+        raise ValueError(err)
+
+    if not os.path.isfile(video_file):
+        err = "video_file '{}' does not exist.\n".format(video_file)
+        raise FileNotFoundError(err)
+
+    if os.path.isfile(spreadsheet_file) and not force:
+        err = "spreadsheet_file '{}' exists. Stopping. Use --force to overwrite.\n".format(spreadsheet_file)
+        raise FileExistsError(err)
+
+    video_props = _get_video_properties(video_file)
+    duration = video_props["duration"]
+
+    # One decode; both detectors run on cheap, downsampled copies of the
+    # streams and the result goes to the null muxer.
+    input_kwargs = {}
+    if keyframes_only:
+        input_kwargs["skip_frame"] = "nokey"
+    source = ffmpeg.input(video_file,**input_kwargs)
 
-    # Combine all streams
-    inputs = []
     streams = []
-    for f in file_list:
-        inputs.append(ffmpeg.input(f))
-        streams.append(inputs[-1].video)
-        streams.append(inputs[-1].audio)
+    if mode != "black":
+        streams.append(source.audio
+                       .filter("aresample",audio_rate)
+                       .filter("silencedetect",noise=noise,d=min_dead))
+    if mode != "silence":
+        streams.append(source.video
+                       .filter("fps",fps=video_fps)
+                       .filter("scale",160,-2)
+                       .filter("blackdetect",d=min_dead,pix_th=black_threshold))
+
+    run = _run_ffmpeg(ffmpeg.output(*streams,"-",f="null"),"detect",duration)
+
+    silence, black = _parse_detect_log(run.stderr,duration)
+
+    if mode == "silence":
+        dead = silence
+    elif mode == "black":
+        dead = black
+    elif mode == "either":
+        dead = np.concatenate((silence,black))
+    else:
+        dead = _intersect_intervals(silence,black)
 
-    joined = ffmpeg.concat(*streams,v=1,a=1).node
+    # Content is whatever is not dead.  Pad, re-merge and drop short bits.
+    content = _invert_intervals(dead,duration)
+    content = content[(content[:,1] - content[:,0]) >= min_segment]
+    content = content + np.array([-padding,padding])
+    content = np.clip(_merge_intervals(content),0,duration)
 
-    # Render final movie.
-    out = ffmpeg.output(joined[0],joined[1],
-                        "{}_final.mp4".format(file_prefix),
-                        **video_props["out_kwargs"])
-    out.run()
+    df = pd.DataFrame({"start":[_seconds_to_time(t) for t in content[:,0]],
+                       "stop":[_seconds_to_time(t) for t in content[:,1]]})
 
-    # Copy final file to output file name and nuke temporary files
-    to_remove = glob.glob("{}*".format(file_prefix))
-    shutil.copy("{}_final.mp4".format(file_prefix),output_file)
-    for f in to_remove:
-        os.remove(f)
+    if spreadsheet_file[-4:] in [".xls","xlsx"]:
+        df.to_excel(spreadsheet_file,index=False)
+    else:
+        df.to_csv(spreadsheet_file,index=False)
 
+    logger.info("found {} content segments ({} of {} kept)".format(len(df),
+                                                                   _seconds_to_time(np.sum(content[:,1] - content[:,0])),
+                                                                   _seconds_to_time(duration)))
 
-    # Write out timebase_file, if requested.
-    if timebase_file is not None:
+    return df
 
-        out_dict = {}
-        out_dict["section_type"] = section_type
-        out_dict["real_start"] = [_seconds_to_time(t) for t in real_starts_sec]
-        out_dict["real_stop"] = [_seconds_to_time(t) for t in real_stops_sec]
-        out_dict["video_start"] = [_seconds_to_time(t) for t in output_starts_sec]
-        out_dict["video_stop"] = [_seconds_to_time(t) for t in output_stops_sec]
 
-        pd.DataFrame(out_dict).to_csv(timebase_file,index=False)
+def main_detect(argv=None):
+    """
+    Parse command line arguments and invoke detect_segments function.
+
+    argv: command line arguments (without the leading "detect")
+    """
+
+    if argv is None:
+        argv = sys.argv[2:]
+
+    description = \
+    """
+    Detect silence and/or black screen in a video and write a start,stop
+    spreadsheet of the remaining content that chop_video.py can use directly.
+    """
+
+    parser = argparse.ArgumentParser(prog="chop_video.py detect",
+                                     description=description,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("video_file",type=str,
+                        help="video file to analyze")
+    parser.add_argument("--out-file","-o",dest="out_file",type=str,default=None,
+                        help="spreadsheet to write [default: '{video_file}.detected.csv']")
+    parser.add_argument("--mode",dest="mode",type=str,default="either",choices=DETECT_MODES,
+                        help="what counts as dead: silence, black, either or both [default: 'either']")
+    parser.add_argument("--noise",dest="noise",type=str,default="-30dB",
+                        help="silence threshold [default: '-30dB']")
+    parser.add_argument("--black-threshold",dest="black_threshold",type=float,default=0.1,
+                        help="pixel threshold (0-1) for black frames [default: 0.1]")
+    parser.add_argument("--min-dead",dest="min_dead",type=float,default=2.0,
+                        help="minimum length of silence/black to cut, in seconds [default: 2]")
+    parser.add_argument("--min-segment",dest="min_segment",type=float,default=5.0,
+                        help="drop content segments shorter than this, in seconds [default: 5]")
+    parser.add_argument("--padding",dest="padding",type=float,default=1.0,
+                        help="seconds of padding to keep on both sides of each segment [default: 1]")
+    parser.add_argument("--audio-rate",dest="audio_rate",type=int,default=8000,
+                        help="sample rate at which to analyze audio [default: 8000]")
+    parser.add_argument("--video-fps",dest="video_fps",type=float,default=1.0,
+                        help="frame rate at which to analyze video [default: 1]")
+    parser.add_argument("--keyframes-only",dest="keyframes_only",action="store_true",
+                        help="only decode keyframes (faster, coarser black detection)")
+    parser.add_argument("--force",dest="force",action="store_true",
+                        help="overwrite any previous output file")
+
+    args = parser.parse_args(argv)
+
+    out_file = args.out_file
+    if out_file is None:
+        out_file = "{}.detected.csv".format(args.video_file)
+
+    detect_segments(args.video_file,out_file,
+                    mode=args.mode,
+                    noise=args.noise,
+                    black_threshold=args.black_threshold,
+                    min_dead=args.min_dead,
+                    min_segment=args.min_segment,
+                    padding=args.padding,
+                    audio_rate=args.audio_rate,
+                    video_fps=args.video_fps,
+                    keyframes_only=args.keyframes_only,
+                    force=args.force)
+
+
+def _run_batch_job(job,process_kwargs):
+    """
+    Run process_video for one row of a batch manifest, catching any error.
+    Returns a dictionary describing the outcome. This is module-level so it can
+    be shipped to worker processes.
+
+    job: dictionary with "video", "spreadsheet", "output", "timebase" and
+         "real_time" keys
+    process_kwargs: keyword arguments passed to every process_video call
+    """
+
+    result = {"status":"ok","error":""}
+
+    start_time = time.perf_counter()
+    try:
+        process_video(job["video"],job["output"],job["spreadsheet"],
+                      timebase_file=job["timebase"],
+                      real_time=job["real_time"],
+                      **process_kwargs)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = repr(e)
+
+    result["wall_time"] = time.perf_counter() - start_time
+
+    return result
+
+
+def process_batch(manifest_file,report_file=None,
+                  jobs=1,cpus=None,
+                  probe_cache_file=None,
+                  **process_kwargs):
+    """
+    Process many videos listed in a manifest spreadsheet.  The manifest has
+    one row per video with columns:
+
+        video: video file to process
+        spreadsheet: spreadsheet encoding chunks to extract
+        output: output video file name
+        timebase: (optional) timebase file to write
+        real_time: (optional) real time of the start of the output video
+
+    Every input is probed up front.  Jobs then run at most jobs at a time.  A
+    job that fails is recorded and the rest of the batch continues.  Returns
+    (and optionally writes) a data frame summarizing each job with its wall
+    time and throughput (source minutes processed per wall-clock minute).
+
+    manifest_file: csv or excel manifest
+    report_file: csv file in which to write the summary (if None, do not
+                 write)
+    jobs: number of videos to process at once
+    cpus: total number of cpus the batch may use.  each job's encoders are
+          limited to cpus // jobs threads.  if None, do not limit.
+    probe_cache_file: json file for caching ffprobe results.  if None, a
+                      temporary cache is used for the duration of the batch so
+                      the up-front probes are shared with the jobs.
+    process_kwargs: other keyword arguments passed to process_video for every
+                    job (e.g. fade_length, gap_column, render_mode, force).
+    """
+
+    if jobs < 1:
+        err = "jobs must be 1 or more\n"
+        raise ValueError(err)
+
+    if manifest_file[-4:] == ".csv":
+        manifest = pd.read_csv(manifest_file)
+    elif manifest_file[-4:] in [".xls","xlsx"]:
+        manifest = pd.read_excel(manifest_file)
+    else:
+        err = "manifest file type not recognized.  Should be excel or csv.\n"
+        raise ValueError(err)
+
+    for column in ["video","spreadsheet","output"]:
+        if column not in manifest.columns:
+            err = "manifest does not have column '{}'\n".format(column)
+            raise ValueError(err)
+
+    if cpus is not None:
+        process_kwargs["threads"] = max(1,cpus // jobs)
+
+    # Share probe results between the up-front probe and the jobs
+    tmp_probe_cache = None
+    if probe_cache_file is None:
+        tmp_probe_cache = "tmp_probe-cache_{}.json".format(os.getpid())
+        probe_cache_file = tmp_probe_cache
+    process_kwargs["probe_cache_file"] = probe_cache_file
+    process_kwargs.setdefault("progress",jobs == 1)
+
+    # Build jobs, probing every input up front
+    job_list = []
+    results = []
+    for i in range(len(manifest)):
+
+        row = manifest.iloc[i]
+        job = {"video":row["video"],
+               "spreadsheet":row["spreadsheet"],
+               "output":row["output"],
+               "timebase":None,
+               "real_time":"00:00:00"}
+
+        for column in ["timebase","real_time"]:
+            if column in manifest.columns and not pd.isnull(row[column]):
+                job[column] = row[column]
+
+        result = {"video":job["video"],"output":job["output"],
+                  "status":"pending","error":"","wall_time":0.0,
+                  "source_minutes":np.nan,"throughput":np.nan}
+        try:
+            video_props = _get_video_properties(job["video"],probe_cache_file)
+            result["source_minutes"] = video_props["duration"]/60
+            job_list.append((job,result))
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = "probe failed: {}".format(repr(e))
+            logger.info("{}: {}".format(job["video"],result["error"]))
+
+        results.append(result)
+
+    # Run jobs
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = dict([(pool.submit(_run_batch_job,j,process_kwargs),r)
+                            for j, r in job_list])
+            for future in concurrent.futures.as_completed(futures):
+
+                result = futures[future]
+                try:
+                    result.update(future.result())
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = repr(e)
+
+                if result["status"] == "ok" and result["wall_time"] > 0:
+                    result["throughput"] = result["source_minutes"]/(result["wall_time"]/60)
+
+                logger.info("{}: {} ({:.1f} s)".format(result["video"],
+                                                       result["status"],
+                                                       result["wall_time"]))
+    finally:
+        if tmp_probe_cache is not None and os.path.isfile(tmp_probe_cache):
+            os.remove(tmp_probe_cache)
+
+    report = pd.DataFrame(results,columns=["video","output","status",
+                                           "wall_time","source_minutes",
+                                           "throughput","error"])
+
+    if report_file is not None:
+        report.to_csv(report_file,index=False)
+
+    return report
+
+
+def main_worker(argv=None):
+    """
+    Parse command line arguments and invoke run_worker.
+
+    argv: command line arguments (without the leading "worker")
+    """
+
+    if argv is None:
+        argv = sys.argv[2:]
+
+    description = \
+    """
+    Render clips from a chop_video work queue (see --render-mode queue) until
+    the queue is empty.  Run as many workers as you like, on any host that
+    shares the queue file and work directory.
+    """
+
+    parser = argparse.ArgumentParser(prog="chop_video.py worker",
+                                     description=description,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("queue_file",type=str,
+                        help="sqlite work queue file")
+    parser.add_argument("--job",dest="job",type=str,default=None,
+                        help="only render clips from this job [default: any job]")
+    parser.add_argument("--poll",dest="poll",type=float,default=5.0,
+                        help="seconds between checks of an idle queue [default: 5]")
+    parser.add_argument("--lease",dest="lease",type=float,default=600.0,
+                        help="seconds before a clip claimed by a dead worker is handed out again [default: 600]")
+    parser.add_argument("--keep-running",dest="keep_running",action="store_true",
+                        help="keep waiting for new work when the queue is empty")
+    parser.add_argument("--timeout",dest="timeout",type=float,default=None,
+                        help="kill any ffmpeg process that produces no output for this many seconds [default: 'None'; wait forever]")
+
+    args = parser.parse_args(argv)
+
+    run_worker(args.queue_file,job=args.job,poll=args.poll,lease=args.lease,
+               keep_running=args.keep_running,timeout=args.timeout)
+
+
+def main_batch(argv=None):
+    """
+    Parse command line arguments and invoke process_batch function.
+
+    argv: command line arguments (without the leading "batch")
+    """
+
+    if argv is None:
+        argv = sys.argv[2:]
+
+    description = \
+    """
+    Process every video listed in a manifest spreadsheet with columns
+    video,spreadsheet,output and (optionally) timebase,real_time.  Jobs that
+    fail are reported and the rest of the batch continues.
+    """
+
+    parser = argparse.ArgumentParser(prog="chop_video.py batch",
+                                     description=description,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("manifest",type=str,
+                        help="csv or excel manifest of videos to process")
+    parser.add_argument("--report",dest="report_file",type=str,default=None,
+                        help="csv file in which to write per-job summary [default: 'None'; do not write]")
+    parser.add_argument("--jobs","-j",dest="jobs",type=int,default=1,
+                        help="number of videos to process at once [default: 1]")
+    parser.add_argument("--cpus",dest="cpus",type=int,default=None,
+                        help="total cpus the batch may use; split evenly between jobs [default: no limit]")
+    parser.add_argument("--probe-cache",dest="probe_cache_file",type=str,default=None,
+                        help="json file in which to cache ffprobe results between runs")
+    parser.add_argument("--start-column","-s",dest="start_column",type=str,default="start",
+                        help="column in spreadsheets with chunk start time stamps [default 'start']")
+    parser.add_argument("--stop-column","-p",dest="stop_column",type=str,default="stop",
+                        help="column in spreadsheets with chunk stop time stamps [default 'stop']")
+    parser.add_argument("--gap-column","-g",dest="gap_column",type=str,default=None,
+                        help="column in spreadsheets with gaps to add after chunks [default 'None']")
+    parser.add_argument("--fade-length","-f",dest="fade_length",type=float,default=1,
+                        help="fade length for transitions, in seconds [default '1']")
+    parser.add_argument("--render-mode",dest="render_mode",
+                        type=str,default="filtergraph",choices=RENDER_MODES,
+                        help="how to render each video [default: 'filtergraph']")
+    parser.add_argument("--force",dest="force",action="store_true",
+                        help="overwrite any previous output files")
+
+    args = parser.parse_args(argv)
+
+    report = process_batch(args.manifest,args.report_file,
+                           jobs=args.jobs,cpus=args.cpus,
+                           probe_cache_file=args.probe_cache_file,
+                           start_column=args.start_column,
+                           stop_column=args.stop_column,
+                           gap_column=args.gap_column,
+                           fade_length=args.fade_length,
+                           render_mode=args.render_mode,
+                           force=args.force)
+
+    print(report.to_string(index=False))
+
+    # Exit non-zero if any job failed
+    if np.sum(report["status"] != "ok") > 0:
+        sys.exit(1)
 
 
 class _NonDefaultAction(argparse.Action):
@@ -628,6 +4322,16 @@ def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
+    logging.basicConfig(level=logging.INFO,format="%(message)s")
+
+    # Subcommands
+    if len(argv) > 0 and argv[0] == "batch":
+        return main_batch(argv[1:])
+    if len(argv) > 0 and argv[0] == "detect":
+        return main_detect(argv[1:])
+    if len(argv) > 0 and argv[0] == "worker":
+        return main_worker(argv[1:])
+
     parser = argparse.ArgumentParser(description=__description__,
                                      formatter_class=argparse.RawTextHelpFormatter)
 
@@ -656,7 +4360,7 @@ def main(argv=None):
                         help="name of output file [default: 'processed_{video_file}'']",
                         action=_NonDefaultAction)
     parser.add_argument('--fade-length','-f',dest="fade_length",
-                        type=int,nargs=1,default=1,
+                        type=float,default=1,
                         help="fade length for transitions, in seconds [default '1']")
 
     # Timebase arguments
@@ -666,11 +4370,80 @@ def main(argv=None):
                         action=_NonDefaultAction)
     parser.add_argument("--real-time","-r",dest="real_time",
                         type=str,nargs=1,default="00:00:00",
-                        help="real start time of first video chunk as HH:MM:SS string [default: '00:00:00']",
+                        help="real start time of first video chunk as HH:MM:SS(.mmm) string [default: '00:00:00']",
                         action=_NonDefaultAction)
 
+    parser.add_argument("--merge-within",dest="merge_within",
+                        type=float,default=None,
+                        help="merge rows separated by less than this many seconds [default: twice the fade length]")
+    parser.add_argument("--edl-file",dest="edl_file",
+                        type=str,default=None,
+                        help="csv file in which to write the edit decision list [default: 'None'; do not write]")
+
     parser.add_argument("--force",dest="force",action="store_true",
                         help="overwrite any previous output files")
+    parser.add_argument("--render-mode",dest="render_mode",
+                        type=str,default="filtergraph",choices=RENDER_MODES,
+                        help="'filtergraph' renders in a single pass; 'temp-files' writes and joins intermediate clips; 'pipe' streams clips through named pipes into the join; 'queue' renders the temp-files clips through an sqlite work queue shared with workers [default: 'filtergraph']")
+    parser.add_argument("--jobs","-j",dest="jobs",
+                        type=int,default=1,
+                        help="number of segments to render at once with --render-mode temp-files [default: 1]")
+    parser.add_argument("--probe-cache",dest="probe_cache_file",
+                        type=str,default=None,
+                        help="json file in which to cache ffprobe results between runs [default: 'None'; do not cache between runs]")
+    parser.add_argument("--cut-mode",dest="cut_mode",
+                        type=str,default="copy",choices=CUT_MODES,
+                        help="with --render-mode temp-files, 'copy' stream copies chunks (cuts snap to keyframes); 'smart' re-encodes only partial GOPs at cuts [default: 'copy']")
+    parser.add_argument("--blank-cache",dest="blank_cache_dir",
+                        type=str,default=None,
+                        help="with --render-mode temp-files, directory in which to cache gap clips between runs [default: 'None'; do not cache]")
+    parser.add_argument("--blank-cache-size",dest="blank_cache_size",
+                        type=int,default=1024,
+                        help="maximum size of the gap clip cache in MB [default: 1024]")
+    parser.add_argument("--work-dir",dest="work_dir",
+                        type=str,default=None,
+                        help="directory for intermediate clips; kept after the run [default: '{out_file}.work', removed after the run]")
+    parser.add_argument("--keep-work-dir",dest="keep_work_dir",action="store_true",
+                        help="keep intermediate clips so a rerun only renders rows that changed")
+    parser.add_argument("--dry-run",dest="dry_run",action="store_true",
+                        help="report which segments would be rebuilt without rendering")
+    parser.add_argument("--renditions",dest="renditions",
+                        type=str,default=None,
+                        help="extra resolutions to encode from the same decode: comma-separated heights (e.g. '1080,720,480') or a json file of renditions with per-rendition out_kwargs [default: 'None']")
+    parser.add_argument("--package",dest="package",
+                        type=str,default=None,choices=PACKAGE_FORMATS,
+                        help="package renditions for streaming as hls or dash [default: 'None'; plain video files]")
+    parser.add_argument("--report",dest="report_file",
+                        type=str,default=None,
+                        help="json file in which to write per-stage timing, fps, speed and bytes for the render [default: 'None'; do not write]")
+    parser.add_argument("--no-progress",dest="progress",action="store_false",
+                        help="do not draw progress bars")
+    parser.add_argument("--executor",dest="executor",
+                        type=str,default="process",choices=EXECUTORS,
+                        help="with --render-mode temp-files, run clips on a pool of worker 'process'es or from an 'asyncio' event loop [default: 'process']")
+    parser.add_argument("--queue-file",dest="queue_file",
+                        type=str,default=None,
+                        help="with --render-mode queue, sqlite work queue shared with 'chop_video.py worker' processes [default: 'queue.sqlite' in the work directory]")
+    parser.add_argument("--local-workers",dest="local_workers",
+                        type=int,default=1,
+                        help="with --render-mode queue, number of workers to start on this host [default: 1]")
+    parser.add_argument("--timeout",dest="timeout",
+                        type=float,default=None,
+                        help="kill any ffmpeg process that produces no output for this many seconds [default: 'None'; wait forever]")
+    parser.add_argument("--preview",dest="preview",action="store_true",
+                        help="quickly render a low resolution review copy with the source time burned in [default out_file: 'preview_{video_file}']")
+    parser.add_argument("--chapters-file",dest="chapters_file",
+                        type=str,default=None,
+                        help="write a YouTube-style chapter list to this file and embed the chapters in the output [default: 'None'; do not write]")
+    parser.add_argument("--chapter-column",dest="chapter_column",
+                        type=str,default=None,
+                        help="spreadsheet column with chapter titles; embeds chapters in the output [default: 'None'; part number and real time]")
+    parser.add_argument("--sprite-file",dest="sprite_file",
+                        type=str,default=None,
+                        help="write a thumbnail sprite sheet (and a WebVTT index of it) to this image [default: 'None'; do not write]")
+    parser.add_argument("--sprite-interval",dest="sprite_interval",
+                        type=float,default=10,
+                        help="seconds between sprite thumbnails [default: 10]")
 
 
     args = parser.parse_args(argv)
@@ -699,6 +4472,8 @@ def main(argv=None):
     # Grab out_file
     if hasattr(args,"out_file_nondefault"):
         out_file = args.out_file[0]
+    elif args.preview:
+        out_file = "preview_{}".format(video_file)
     else:
         out_file = "processed_{}".format(video_file)
 
@@ -720,13 +4495,71 @@ def main(argv=None):
     # grab force
     force = args.force
 
+    # grab render mode
+    render_mode = args.render_mode
+
+    # grab number of jobs
+    jobs = args.jobs
+
+    # grab probe cache file
+    probe_cache_file = args.probe_cache_file
+
+    # grab cut mode
+    cut_mode = args.cut_mode
+
+    # grab gap clip cache
+    blank_cache_dir = args.blank_cache_dir
+    blank_cache_size = args.blank_cache_size
+
+    # grab work directory options
+    work_dir = args.work_dir
+    keep_work_dir = args.keep_work_dir
+    dry_run = args.dry_run
+
+    # grab plan options
+    merge_within = args.merge_within
+    edl_file = args.edl_file
+
+    # grab rendition ladder
+    renditions = args.renditions
+    package = args.package
+    preview = args.preview
+
+    # grab reporting options
+    report_file = args.report_file
+    progress = args.progress
+
+    # grab executor options
+    executor = args.executor
+    timeout = args.timeout
+
+    # grab work queue options
+    queue_file = args.queue_file
+    local_workers = args.local_workers
+
+    # grab chapter and sprite options
+    chapters_file = args.chapters_file
+    chapter_column = args.chapter_column
+    sprite_file = args.sprite_file
+    sprite_interval = args.sprite_interval
+
     # Process the video
     process_video(video_file,out_file,
                   spreadsheet_file,
                   start_column,stop_column,gap_column,
                   fade_length,
                   timebase_file,real_time,
-                  force)
+                  force,render_mode,jobs,
+                  probe_cache_file,cut_mode,
+                  blank_cache_dir,blank_cache_size,
+                  work_dir,keep_work_dir,dry_run,
+                  None,merge_within,edl_file,
+                  renditions,package,preview,
+                  report_file,progress,
+                  executor,timeout,
+                  queue_file,local_workers,
+                  chapters_file,chapter_column,
+                  sprite_file,sprite_interval)
 
 # If called from the command line.
 if __name__ == "__main__":
@@ -1,2 +1,2 @@
 from .session_to_site import render
-from .parse_slack import parse_slack_channel
+from .parse_slack import parse_slack_channel, parse_slack_channels
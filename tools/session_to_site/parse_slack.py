@@ -6,9 +6,16 @@ input for the templater.
 __author__ = "Michael J. Harms"
 __date__ = "2020-03-29"
 
-import json, re, os, urllib, zipfile, shutil, random, string, emoji
-from datetime import datetime
-import urllib.request, urllib.response, urllib.error
+import json, re, os, urllib, zipfile, emoji, hashlib, shutil, tempfile
+import time, threading, concurrent.futures, http.client, itertools, functools
+from datetime import datetime, date, timedelta, timezone
+import urllib.request, urllib.response, urllib.error, urllib.parse
+
+# Only used to lock the shared download cache index; not on every platform
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class StringHandler:
@@ -40,12 +47,27 @@ class StringHandler:
             # append cuts
             cuts.append((start,end+1))
 
-        # Assemble the final string
+        # Assemble the final string.  Work back from the end, replacing each
+        # cut in the string built so far.  That string is text_string[:pos]
+        # followed by the pieces (stored last to first).  A cut that runs
+        # past pos eats into replacements already made.
+        pieces = []
+        pos = len(text_string)
         for i in range(len(cuts)-1,-1,-1):
-            text_string = "{}{}{}".format(text_string[:cuts[i][0]],
-                                          replacements[i],
-                                          text_string[cuts[i][1]:])
-        return text_string
+            if cuts[i][1] <= pos:
+                pieces.append(text_string[cuts[i][1]:pos])
+            else:
+                drop = cuts[i][1] - pos
+                while drop > 0 and len(pieces) > 0:
+                    piece = pieces.pop()
+                    if len(piece) > drop:
+                        pieces.append(piece[drop:])
+                    drop -= len(piece)
+            pieces.append(replacements[i])
+            pos = cuts[i][0]
+        pieces.append(text_string[:pos])
+
+        return "".join(reversed(pieces))
 
     def _search(self,text_string):
         """
@@ -85,7 +107,7 @@ class SymmetricalStringHandler(StringHandler):
 
         # Only return every other match if search pattern is symmetrical
         # (like `blah` or *blah*)
-        return list(self._search_pattern.finditer(text_string))[::2]
+        return itertools.islice(self._search_pattern.finditer(text_string),0,None,2)
 
 
 class UrlHandler(StringHandler):
@@ -174,6 +196,164 @@ class CodeBlockHandler(SymmetricalStringHandler):
 
         return "<div class=\"card m-1 bg-light p-2\"><pre><code>{}</code></pre></div>".format(field[2:-2])
 
+class _ChainFallback(Exception):
+    """
+    Raised inside CombinedHandler when a string has to go through the chain.
+    """
+
+class CombinedHandler:
+    """
+    Apply UrlHandler, AtUserHandler, HashChannelHandler, CodeBlockHandler and
+    CodeHandler (in that order) in a single scan of the string.
+
+    Each handler in the chain runs on the output of the one before it, so
+    fields can interact: a field nested in another, a replacement the next
+    handler would match, or a field starting on the character the previous
+    replacement dropped.  Strings where that could happen are passed through
+    the chain instead, so the output always matches the chain's.
+    """
+
+    # Text that starts a field for one of the handlers
+    _trigger_pattern = re.compile("\<http|\<ftp|\<\@|\<\#|\`")
+
+    # Every handler's field, in chain order, so fields of earlier handlers win
+    # ties at the same position, followed by the character after the field
+    # (group 1; the handlers drop it).  The fields are not grouped, so re can
+    # skip ahead to the next '<' or '`'; _field_handlers says which matched.
+    _search_pattern = re.compile("(?:\<(?:http.*?\>|ftp.*?\>|\@.*?\>|\#.*?\>)|```.*?```|\`.*?\`)(.?)",
+                                 re.DOTALL)
+
+    # Handlers that do not depend on replace_dict, shared by every instance
+    _url_handler = UrlHandler()
+    _hash_channel_handler = HashChannelHandler()
+    _code_block_handler = CodeBlockHandler()
+    _code_handler = CodeHandler()
+
+    # Handler index (into self._handlers) of a field, keyed by its first two
+    # characters.  Fields starting with '`' are code (4) or, if they start
+    # with '```' and are at least six characters long, code blocks (3).
+    _field_handlers = {"<h":0,"<f":0,"<@":1,"<#":2}
+
+    # Most distinct fields to remember replacements for
+    _field_cache_size = 10000
+
+    def __init__(self,replace_dict={}):
+
+        self._handlers = [self._url_handler,
+                          AtUserHandler(replace_dict=replace_dict),
+                          self._hash_channel_handler,
+                          self._code_block_handler,
+                          self._code_handler]
+
+        # The other handlers only put (part of) their field in their
+        # replacement; a user name is the only text a replacement can gain
+        # that a later handler might match.
+        self._unsafe_users = set([k for k, v in replace_dict.items()
+                                  if self._trigger_pattern.search(str(v))])
+
+        # Replacements of fields seen before (users, links and code repeat a
+        # lot across a channel)
+        self._field_cache = {}
+
+    def _filter_chain(self,text_string):
+        """
+        Run the string through each handler in turn.
+        """
+
+        for h in self._handlers:
+            text_string = h.filter_string(text_string)
+
+        return text_string
+
+    def _replace_field(self,state,match):
+        """
+        re.sub callback: the replacement for one field (see filter_string).
+        state is [number of code fields seen, spans of code block fields].
+        Raises _ChainFallback if the string must go through the chain.
+        """
+
+        start = match.start()
+        end = match.start(1)
+
+        # Each handler drops the character after a field it replaces.  If that
+        # could start another field, the chain might not see that field.
+        trailing = match.group(1)
+        if trailing == "<" or trailing == "`":
+            raise _ChainFallback
+
+        text_string = match.string
+        key = text_string[start:end]
+        try:
+            i, replacement = self._field_cache[key]
+        except KeyError:
+            i, replacement = self._process_field(key)
+            if len(self._field_cache) >= self._field_cache_size:
+                self._field_cache.clear()
+            self._field_cache[key] = (i, replacement)
+
+        if replacement is None:
+            raise _ChainFallback
+
+        if i == 3:
+            state[1].append((start,end))
+
+        # CodeHandler only replaces every other match
+        elif i == 4:
+            state[0] += 1
+            if state[0] % 2 == 0:
+                return match.group(0)
+
+        return replacement
+
+    def _process_field(self,key):
+        """
+        Return the handler index and replacement for the field key (including
+        its delimiters), or a replacement of None if the string holding it
+        must go through the chain.
+        """
+
+        field = key[1:-1]
+        i = self._field_handlers.get(key[:2],4)
+        if i == 4 and len(key) >= 6 and field[:2] == "``":
+            i = 3
+
+        # A field holding another handler's field
+        inner = field[2:-2] if i == 3 else field
+        if ("<" in inner or "`" in inner) and self._trigger_pattern.search(inner):
+            return i, None
+
+        # A user name that a later handler would match
+        if i == 1 and field in self._unsafe_users:
+            return i, None
+
+        return i, self._handlers[i]._process_match(field)
+
+    def filter_string(self,text_string):
+
+        # Nothing for any handler to do
+        if "<" not in text_string and "`" not in text_string:
+            return text_string
+
+        state = [0,[]]
+        try:
+            out = self._search_pattern.sub(functools.partial(self._replace_field,state),
+                                           text_string)
+        except _ChainFallback:
+            return self._filter_chain(text_string)
+
+        # CodeBlockHandler sees (and only replaces every other one of) its
+        # matches before CodeHandler runs; make sure there is at most one and
+        # that it is the one found here.
+        if "```" in text_string:
+            block_spans = state[1]
+            if len(block_spans) > 1:
+                return self._filter_chain(text_string)
+            spans = [m.span() for m in self._code_block_handler._search_pattern.finditer(text_string)]
+            if spans != block_spans:
+                return self._filter_chain(text_string)
+
+        return out
+
 def _process_polly_poll(msg):
 
     name = "Polly Poll"
@@ -226,61 +406,87 @@ def _process_polly_poll(msg):
 
 
 
-def parse_slack_channel(slack_zip_file,
-                        channel="in_class",
-                        out_dir="attachments",
-                        date_span=None):
+# Slack names each day of a channel's messages YYYY-MM-DD.json
+_DAY_FILE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})\.json$")
 
+def _index_export(zf):
     """
-    Generate a list of threads, formatted in pretty fashion, from an exported
-    slack zip file.
-
-    slack_zip_file: zip file generated by slack export
-    out_dir: output directory for images
-    channel: slack channel to extract
-    date_span: (start_timestamp,end_timestamp) where timestamps are unix-style
+    Index the day files for every channel in an open slack export zip file,
+    reading only its list of members.  Returns a dictionary mapping each
+    channel to a list of (day,member_name) tuples sorted by day, where day is
+    a datetime.date (or None for files not named by date).
     """
 
-    # Check sanity of date_span
-    if date_span is not None:
-        try:
-            if len(date_span) != 2:
-                raise TypeError
-            date_span[0] < 0
-            date_span[1] < 0
-        except TypeError:
-            err = "date_span must be have a length of 2 (start,stop) containing unix timestamps\n"
-            raise ValueError(err)
+    index = {}
+    for name in zf.namelist():
 
-    # -------------------------------------------------------------------------
-    # Extract slack zip file
+        # Channels are the top-level directories
+        if "/" not in name:
+            continue
+        channel, day_file = name.split("/",1)
+        days = index.setdefault(channel,[])
+
+        # Skip the directory entry itself and anything nested below it
+        if day_file == "" or "/" in day_file:
+            continue
+
+        match = _DAY_FILE_PATTERN.match(day_file)
+        if match is None:
+            day = None
+        else:
+            day = date(*[int(g) for g in match.groups()])
 
-    zf = zipfile.ZipFile(slack_zip_file)
-    tmp_dir = "tmp_{}".format("".join([random.choice(string.ascii_letters) for _ in range(10)]))
-    os.mkdir(tmp_dir)
-    os.chdir(tmp_dir)
-    zf.extractall()
+        days.append((day,name))
+
+    # Files named by date first, in order, so thread parents come before
+    # their replies.
+    for days in index.values():
+        days.sort(key=lambda x: (x[0] is None,x[0] or date.min,x[1]))
+
+    return index
+
+def _channel_members(index,channel,date_span=None):
+    """
+    Names of the day files for channel.  If date_span is given, drop the day
+    files that cannot hold messages within it without reading them.  Raises
+    ValueError if the channel is not in the export.
+
+    index: output of _index_export
+    channel: slack channel
+    date_span: (start_timestamp,end_timestamp) where timestamps are unix-style
+    """
 
-    # extract channel
     try:
-        channel_messages = []
-        for f in os.listdir(channel):
-            channel_messages.extend(json.load(open(os.path.join(channel,f))))
-    except FileNotFoundError:
-        os.chdir("..")
-        shutil.rmtree(tmp_dir)
+        days = index[channel]
+    except KeyError:
         err = "channel '{}' not in this slack export\n".format(channel)
         raise ValueError(err)
 
+    if date_span is None:
+        return [name for day, name in days]
+
+    # Day files follow the workspace's local day, which may differ from the
+    # UTC day by up to a day either way.
+    first = datetime.fromtimestamp(date_span[0],timezone.utc).date() - timedelta(days=1)
+    last = datetime.fromtimestamp(date_span[1],timezone.utc).date() + timedelta(days=1)
+
+    return [name for day, name in days
+            if day is None or first <= day <= last]
+
+def _load_users(zf):
+    """
+    Load users.json from an open slack export zip file.  Returns dictionaries
+    mapping user_id and @user_id to each user's real name and icon.
+    """
 
     # Load users_dict, allowing us to look up users by user_id or
     # @user_id
     users_dict = {}
     names_dict = {}
     icons_dict = {}
-    if os.path.isfile("users.json"):
+    if "users.json" in zf.namelist():
 
-        users = json.load(open("users.json"))
+        users = json.loads(zf.read("users.json"))
         users_dict = dict([(u["id"],u) for u in users])
         for k in list(users_dict.keys()):
             users_dict["@{}".format(k)] = users_dict[k]
@@ -291,23 +497,320 @@ def parse_slack_channel(slack_zip_file,
             names_dict[k] = users_dict[k]["profile"]["real_name"]
             icons_dict[k] = users_dict[k]["profile"]["image_72"]
 
-    # Leave temporary directory and nuke it
-    os.chdir("..")
-    shutil.rmtree(tmp_dir)
-    # -------------------------------------------------------------------------
+    return names_dict, icons_dict
+
+def _read_channel(zf,members):
+    """
+    Read the messages in the day files members from an open slack export zip
+    file.
+    """
+
+    channel_messages = []
+    for name in members:
+        channel_messages.extend(json.loads(zf.read(name)))
+
+    return channel_messages
+
+
+# Default attachment download cache: a per-user cache directory, outside any
+# site directory that gets published
+_DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME",
+                                                 os.path.join(os.path.expanduser("~"),".cache")),
+                                  "session_to_site","downloads")
+
+def _attachment_path(url,out_dir):
+    """
+    Local path for the attachment at url.
+    """
+
+    base = url.split("?")[0]
 
+    return os.path.join(out_dir,"{}".format("_".join(base.split(os.sep)[-3:])))
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, one per host for each thread.
+    """
+
+    def __init__(self,timeout=30):
+
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def get(self,url):
+        """
+        Send a GET request for url and return the http.client.HTTPResponse.
+        The response must be read to the end before the thread makes another
+        request.
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme,parts.netloc)
+
+        try:
+            connections = self._local.connections
+        except AttributeError:
+            connections = {}
+            self._local.connections = connections
+
+        try:
+            conn = connections[key]
+        except KeyError:
+            if parts.scheme == "https":
+                conn = http.client.HTTPSConnection(parts.netloc,timeout=self._timeout)
+            else:
+                conn = http.client.HTTPConnection(parts.netloc,timeout=self._timeout)
+            connections[key] = conn
+
+        path = urllib.parse.urlunsplit(("","",parts.path or "/",parts.query,""))
+        try:
+            conn.request("GET",path)
+            response = conn.getresponse()
+        except (OSError,http.client.HTTPException):
+            conn.close()
+            connections.pop(key)
+            raise
+
+        # The server will hang up after this response; reconnect next time
+        if response.will_close:
+            connections.pop(key)
+
+        return response
+
+class AttachmentCache:
+    """
+    Content-addressed store of downloaded attachments.  Each file is stored
+    once as objects/{sha256[:2]}/{sha256} in cache_dir and index.json maps
+    the url (without its query string, which holds a token that changes
+    between exports) to the file's sha256.  Several processes may share a
+    cache; save() merges this process's new entries into the index on disk.
+    """
+
+    def __init__(self,cache_dir):
+
+        self._cache_dir = cache_dir
+        self._index_file = os.path.join(cache_dir,"index.json")
+        self._lock_file = os.path.join(cache_dir,"index.lock")
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir,"objects"),exist_ok=True)
+
+        self._index = self._read_index()
+        self._added = {}
+
+    def _read_index(self):
+
+        try:
+            with open(self._index_file) as f:
+                return json.load(f)
+        except (FileNotFoundError,json.JSONDecodeError):
+            return {}
 
-    # Handlers for processing messages
-    handlers = [UrlHandler(),
-                AtUserHandler(replace_dict=names_dict),
-                HashChannelHandler(),
-                CodeBlockHandler(),
-                CodeHandler()]
+    def _object_path(self,digest):
+
+        return os.path.join(self._cache_dir,"objects",digest[:2],digest)
+
+    def lookup(self,url):
+        """
+        Return the cached file for url, or None if it has not been fetched.
+        """
+
+        with self._lock:
+            digest = self._index.get(url.split("?")[0],None)
+
+        if digest is None or not os.path.isfile(self._object_path(digest)):
+            return None
+
+        return self._object_path(digest)
+
+    def store(self,url,response):
+        """
+        Stream response (a file-like object) into the cache as the content
+        for url.  Returns the cached file.
+        """
+
+        sha = hashlib.sha256()
+        fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir,suffix=".partial")
+        try:
+            with os.fdopen(fd,"wb") as f:
+                while True:
+                    chunk = response.read(1024*1024)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    f.write(chunk)
+
+            digest = sha.hexdigest()
+            object_path = self._object_path(digest)
+            os.makedirs(os.path.dirname(object_path),exist_ok=True)
+            os.replace(tmp_file,object_path)
+        finally:
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+        with self._lock:
+            self._index[url.split("?")[0]] = digest
+            self._added[url.split("?")[0]] = digest
+
+        return object_path
+
+    def save(self):
+        """
+        Merge the urls stored since the cache was opened into the index on
+        disk.  Holds a lock file while doing so (where the platform supports
+        it), so processes sharing the cache never drop each other's entries.
+        """
+
+        with self._lock, open(self._lock_file,"a") as lock:
+
+            if fcntl is not None:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+
+            # Re-read: other processes may have saved since we opened it
+            index = self._read_index()
+            index.update(self._added)
+
+            fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir,
+                                            prefix="index.",suffix=".partial")
+            try:
+                with os.fdopen(fd,"w") as f:
+                    json.dump(index,f,indent=1,sort_keys=True)
+                os.replace(tmp_file,self._index_file)
+            finally:
+                if os.path.isfile(tmp_file):
+                    os.remove(tmp_file)
+
+            self._index = index
+
+def _fetch(pool,cache,url,retries=3,backoff=0.5,max_redirects=5):
+    """
+    Download url into cache, following redirects and retrying connection
+    errors, 429 and 5xx responses with exponential backoff.  Returns the
+    cached file.
+    """
+
+    attempt = 0
+    while True:
+
+        try:
+            target = url
+            for _ in range(max_redirects + 1):
+                response = pool.get(target)
+                if response.status in [301,302,303,307,308]:
+                    response.read()
+                    target = urllib.parse.urljoin(target,response.getheader("Location"))
+                    continue
+                break
+
+            if response.status != 200:
+                response.read()
+                raise urllib.error.HTTPError(url,response.status,response.reason,
+                                             response.headers,None)
+
+            return cache.store(url,response)
+
+        except urllib.error.HTTPError as e:
+            if (e.code != 429 and e.code < 500) or attempt >= retries:
+                raise
+            wait = backoff*2**attempt
+            try:
+                wait = max(wait,float(e.headers["Retry-After"]))
+            except (TypeError,ValueError):
+                pass
+
+        except (OSError,http.client.HTTPException):
+            if attempt >= retries:
+                raise
+            wait = backoff*2**attempt
+
+        attempt += 1
+        time.sleep(wait)
+
+def download_attachments(urls,out_dir="attachments",cache_dir=None,
+                         jobs=8,retries=3,backoff=0.5,timeout=30):
+    """
+    Download attachments into out_dir, fetching at most jobs at once over
+    keep-alive connections.  Files are kept in a content-addressed cache, so
+    urls fetched by an earlier run (or another session sharing the cache) are
+    copied from disk rather than downloaded again.
+
+    urls: list of attachment urls (e.g. url_private_download)
+    out_dir: output directory for attachments
+    cache_dir: directory holding the download cache. if None, use
+               'session_to_site/downloads' in the user's cache directory
+               ($XDG_CACHE_HOME or ~/.cache).  never put it in out_dir; it
+               would be published with the site.
+    jobs: maximum number of downloads to run at once
+    retries: number of times to retry a failed download
+    backoff: seconds to wait before the first retry; doubles on each retry
+    timeout: socket timeout in seconds
+
+    Returns a dictionary mapping each url to its local path.
+    """
+
+    # Each local path holds one attachment
+    to_get = {}
+    for url in urls:
+        to_get.setdefault(_attachment_path(url,out_dir),url)
+
+    if len(to_get) == 0:
+        return {}
+
+    os.makedirs(out_dir,exist_ok=True)
+
+    if cache_dir is None:
+        cache_dir = _DEFAULT_CACHE_DIR
+    cache = AttachmentCache(cache_dir)
+    pool = _ConnectionPool(timeout)
+
+    def _get(url):
+        cached = cache.lookup(url)
+        if cached is None:
+            cached = _fetch(pool,cache,url,retries,backoff)
+        return cached
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = dict([(path,executor.submit(_get,url))
+                            for path, url in to_get.items()])
+
+            for path, future in futures.items():
+                cached = future.result()
+                if os.path.isfile(path) and os.path.samefile(cached,path):
+                    continue
+
+                # Hard link out of the cache where possible
+                tmp_file = "{}.partial".format(path)
+                try:
+                    os.link(cached,tmp_file)
+                except OSError:
+                    shutil.copyfile(cached,tmp_file)
+                os.replace(tmp_file,path)
+    finally:
+        cache.save()
+
+    return dict([(url,_attachment_path(url,out_dir)) for url in urls])
+
+def _parse_messages(channel_messages,handler,names_dict,icons_dict,
+                    out_dir="attachments",date_span=None):
+    """
+    Format the messages from one channel and group them into threads.
+
+    channel_messages: list of messages read from the channel's day files
+    handler: CombinedHandler used to format message text
+    names_dict: user real names, keyed by user_id and @user_id
+    icons_dict: user icons, keyed by user_id and @user_id
+    out_dir: output directory for attachments
+    date_span: (start_timestamp,end_timestamp) where timestamps are unix-style
+
+    Returns a list of threads and a list of attachment urls to download.
+    """
 
     # Go through messages, keeping track of threading
     thread_indexes = {}
     thread_list = []
     thread_counter = 0
+    to_download = []
     for m in channel_messages:
 
         final_message = {}
@@ -354,8 +857,7 @@ def parse_slack_channel(slack_zip_file,
                 continue
 
         # Process text_string
-        for h in handlers:
-            text_string = h.filter_string(text_string)
+        text_string = handler.filter_string(text_string)
 
         text_string = emoji.emojize(text_string,use_aliases=True)
         final_message["message"] = text_string
@@ -388,19 +890,10 @@ def parse_slack_channel(slack_zip_file,
                 except KeyError:
                     continue
 
-            # Make output dir if there are attachments
-            try:
-                os.mkdir(out_dir)
-            except FileExistsError:
-                pass
-
-            # Download the files
+            # Queue the files to download once all messages are processed
             for url in tmp_attachments:
-                base = url.split("?")[0]
-                new_path = os.path.join(out_dir,"{}".format("_".join(base.split(os.sep)[-3:])))
-                urllib.request.urlretrieve(url, new_path)
-
-                attachments.append(new_path)
+                to_download.append(url)
+                attachments.append(_attachment_path(url,out_dir))
 
         except KeyError:
             pass
@@ -440,4 +933,155 @@ def parse_slack_channel(slack_zip_file,
         else:
             thread_list[thread_index].append(final_message)
 
-    return thread_list
+    return thread_list, to_download
+
+# Set in each worker process by _init_channel_worker
+_CHANNEL_WORKER = {}
+
+def _init_channel_worker(slack_zip_file,names_dict,icons_dict,out_dir,
+                         date_span):
+    """
+    Initialize a worker process for _parse_channel_worker: open the export
+    and build the message handler once for all of the channels it parses.
+    """
+
+    _CHANNEL_WORKER["zf"] = zipfile.ZipFile(slack_zip_file)
+    _CHANNEL_WORKER["handler"] = CombinedHandler(replace_dict=names_dict)
+    _CHANNEL_WORKER["names_dict"] = names_dict
+    _CHANNEL_WORKER["icons_dict"] = icons_dict
+    _CHANNEL_WORKER["out_dir"] = out_dir
+    _CHANNEL_WORKER["date_span"] = date_span
+
+def _parse_channel_worker(members):
+    """
+    Read and parse one channel's day files (members) in a worker process.
+    """
+
+    channel_messages = _read_channel(_CHANNEL_WORKER["zf"],members)
+
+    return _parse_messages(channel_messages,
+                           _CHANNEL_WORKER["handler"],
+                           _CHANNEL_WORKER["names_dict"],
+                           _CHANNEL_WORKER["icons_dict"],
+                           _CHANNEL_WORKER["out_dir"],
+                           _CHANNEL_WORKER["date_span"])
+
+def parse_slack_channels(slack_zip_file,
+                         channels=None,
+                         out_dir="attachments",
+                         date_span=None,
+                         download=True,
+                         download_jobs=8,
+                         cache_dir=None,
+                         jobs=1):
+    """
+    Generate lists of threads, formatted in pretty fashion, for several
+    channels in an exported slack zip file.  The export is opened and
+    users.json loaded once for all of the channels.
+
+    slack_zip_file: zip file generated by slack export
+    channels: list of slack channels to extract. if None, extract every
+              channel in the export.
+    out_dir: output directory for images
+    date_span: (start_timestamp,end_timestamp) where timestamps are unix-style
+    download: download attachments into out_dir (see download_attachments)
+    download_jobs: maximum number of attachments to download at once
+    cache_dir: attachment download cache. if None, use the user's cache
+               directory (see download_attachments).
+    jobs: number of channels to parse at once, each in its own process
+
+    Returns a dictionary mapping each channel to its list of threads.
+    """
+
+    # Check sanity of date_span
+    if date_span is not None:
+        try:
+            if len(date_span) != 2:
+                raise TypeError
+            date_span[0] < 0
+            date_span[1] < 0
+        except TypeError:
+            err = "date_span must be have a length of 2 (start,stop) containing unix timestamps\n"
+            raise ValueError(err)
+
+    if jobs < 1:
+        err = "jobs must be 1 or more\n"
+        raise ValueError(err)
+
+    # -------------------------------------------------------------------------
+    # Read the channels and users straight out of the slack zip file
+
+    with zipfile.ZipFile(slack_zip_file) as zf:
+
+        index = _index_export(zf)
+        if channels is None:
+            channels = sorted(index.keys())
+
+        members = dict([(c,_channel_members(index,c,date_span))
+                        for c in channels])
+
+        names_dict, icons_dict = _load_users(zf)
+
+        # Parse channels in this process, sharing the open export and handler
+        if jobs == 1 or len(channels) < 2:
+
+            handler = CombinedHandler(replace_dict=names_dict)
+
+            results = {}
+            for c in channels:
+                channel_messages = _read_channel(zf,members[c])
+                results[c] = _parse_messages(channel_messages,handler,
+                                             names_dict,icons_dict,
+                                             out_dir,date_span)
+
+    # -------------------------------------------------------------------------
+    # Or parse them on a pool of worker processes
+
+    if jobs > 1 and len(channels) > 1:
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs,len(channels)),
+                                                    initializer=_init_channel_worker,
+                                                    initargs=(slack_zip_file,
+                                                              names_dict,
+                                                              icons_dict,
+                                                              out_dir,
+                                                              date_span)) as executor:
+            futures = dict([(c,executor.submit(_parse_channel_worker,members[c]))
+                            for c in channels])
+            results = dict([(c,futures[c].result()) for c in channels])
+
+    # Fetch the attachments from every channel together
+    if download:
+        to_download = []
+        for c in channels:
+            to_download.extend(results[c][1])
+        download_attachments(to_download,out_dir,cache_dir,download_jobs)
+
+    return dict([(c,results[c][0]) for c in channels])
+
+def parse_slack_channel(slack_zip_file,
+                        channel="in_class",
+                        out_dir="attachments",
+                        date_span=None,
+                        download=True,
+                        download_jobs=8,
+                        cache_dir=None):
+
+    """
+    Generate a list of threads, formatted in pretty fashion, from an exported
+    slack zip file.  (To extract several channels, use parse_slack_channels.)
+
+    slack_zip_file: zip file generated by slack export
+    out_dir: output directory for images
+    channel: slack channel to extract
+    date_span: (start_timestamp,end_timestamp) where timestamps are unix-style
+    download: download attachments into out_dir (see download_attachments)
+    download_jobs: maximum number of attachments to download at once
+    cache_dir: attachment download cache. if None, use the user's cache
+               directory (see download_attachments).
+    """
+
+    threads = parse_slack_channels(slack_zip_file,[channel],out_dir,date_span,
+                                   download,download_jobs,cache_dir)
+
+    return threads[channel]